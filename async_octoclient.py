@@ -0,0 +1,275 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+from octoclient import current_user, is_heating, printed_progress
+
+
+class OctoPrintError(Exception):
+    """OctoPrint answered with an error status, `body` is the decoded answer if it is JSON"""
+    def __init__(self, status, body):
+        super(OctoPrintError, self).__init__(f"OctoPrint answered {status}: {body}")
+        self.status = status
+        self.body = body
+
+
+class AsyncOctoClient:
+    """asyncio counterpart of `OctoClient` (without the camera) for polling a whole farm.
+
+    Pass the same `session` to every client of a fleet so they share one connection pool.
+    Unlike `OctoClient` an unreachable server raises `ConnectionError`, an answer that is not
+    2xx raises `OctoPrintError`, and POST requests return the decoded JSON body (None when
+    OctoPrint answers without one).
+    """
+    def __init__(self, host_name="http://octopi.local", api_key=None, timeout=5, session=None):
+        load_dotenv()
+        self.api_key = api_key or os.getenv("api_key")
+        self.base_url = f"{host_name}/api"
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = session
+        self.own_session = session is None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        if self.own_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __send_request(self, path, data=None, use_post=False, use_file=False):
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+
+        url = f"{self.base_url}/{path}"
+        params = {"apikey": self.api_key} if self.api_key else dict()
+        try:
+            if use_post:
+                assert data is not None, "Data should not be `None` for sending post"
+                request = self.session.post(url, params=params, json=data, timeout=self.timeout)
+            elif use_file:
+                assert data is not None, "Data should not be `None` for sending post"
+                request = self.session.post(url, params=params, data=data, timeout=self.timeout)
+            else:
+                request = self.session.get(url, params=params, timeout=self.timeout)
+
+            async with request as response:
+                status = response.status
+                body = await response.text()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            raise ConnectionError("Server is not working. Please check the service")
+        if not 200 <= status < 300:
+            try:
+                body = json.loads(body)
+            except ValueError:
+                pass
+            raise OctoPrintError(status, body)
+        return json.loads(body) if body else None
+
+    async def get_file_list(self):
+        return await self.__send_request("files")
+
+    async def get_specific_temperature(self, target="tool"):
+        return await self.__send_request(f"printer/{target}")
+
+    async def get_all_temperature(self):
+        try:
+            return await self.__send_request("printer")
+        except OctoPrintError as e:
+            # 409 while the printer is not operational, OctoPrint itself is fine
+            if e.status != 409:
+                raise
+            return e.body if isinstance(e.body, dict) else dict()
+
+    async def check_bed_heated(self):
+        get_board_temp = await self.get_specific_temperature("bed")
+        return is_heating(get_board_temp["bed"])
+
+    async def check_tool_heated(self):
+        get_tool_temp = await self.get_specific_temperature("tool")
+        return is_heating(get_tool_temp["tool0"])
+
+    async def get_job_state(self):
+        return await self.__send_request("job")
+
+    async def get_printed_progress(self):
+        job_state, printer = await asyncio.gather(self.get_job_state(), self.get_all_temperature())
+        return printed_progress(job_state, printer.get("temperature", {}))
+
+    async def get_connect_state(self):
+        return await self.__send_request("connection")
+
+    async def is_connected(self):
+        connect_state = await self.get_connect_state()
+        return connect_state["current"]["state"] != "Closed"
+
+    async def get_printer_profile(self, user="_default"):
+        return await self.__send_request(f"printerprofiles/{user}")
+
+    async def get_user_profile(self):
+        return await self.__send_request("currentuser")
+
+    async def get_current_user(self):
+        return current_user(await self.get_user_profile())
+
+    async def upload_file(self, filename):
+        form = aiohttp.FormData()
+        with open(filename, "rb") as f:
+            form.add_field("file", f.read(), filename=os.path.basename(filename))
+        return await self.__send_request("files/local", data=form, use_file=True)
+
+    async def print_selected_file(self, filename):
+        return await self.__send_request(f"files/{filename}", data={"command": "select", "print": "true"},
+                                         use_post=True)
+
+    async def snapshot(self, parts=("connection", "job", "printer", "profile", "user")):
+        """Same as `OctoClient.snapshot`, `parts` picks which of the requests to send"""
+        requests_to_send = {
+            "connection": self.get_connect_state,
+            "job": self.get_job_state,
+            "printer": self.get_all_temperature,
+            "profile": self.get_printer_profile,
+            "user": self.get_user_profile
+        }
+        results = await asyncio.gather(*[requests_to_send[part]() for part in parts])
+        return dict(zip(parts, results))
+
+
+class FleetPoller:
+    """Poll every printer of a farm on its own schedule and keep one state table.
+
+    At most `concurrency` printers are polled at the same time. Each printer waits
+    `interval` (or its entry of `intervals`) seconds between polls with +-`jitter` of
+    randomness so the farm does not poll in lockstep, and backs off exponentially up to
+    `max_backoff` seconds while it is unreachable, answers with an error status or answers
+    garbage. A failing printer only backs itself off, the rest of the farm keeps polling. `state`
+    maps each printer name to its latest result, `on_update(name, state)` is called after
+    every poll. `from_hosts` has to be called from a coroutine.
+    """
+    status_parts = ("connection", "job", "printer")
+
+    def __init__(self, clients, interval=5, intervals=None, concurrency=32, jitter=0.2,
+                 max_backoff=120, on_update=None):
+        self.clients = clients
+        self.interval = interval
+        self.intervals = intervals or dict()
+        self.concurrency = concurrency
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.on_update = on_update
+
+        self.state = dict()
+        self.running = False
+        self.semaphore = None
+        self.session = None
+
+    @classmethod
+    def from_hosts(cls, hosts, api_key=None, timeout=5, **kwargs):
+        """`hosts` maps printer names to OctoPrint urls, every client shares one session"""
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=kwargs.get("concurrency", 32)))
+        clients = {name: AsyncOctoClient(host, api_key=api_key, timeout=timeout, session=session)
+                   for name, host in hosts.items()}
+        poller = cls(clients, **kwargs)
+        poller.session = session
+        return poller
+
+    def next_delay(self, name, failures):
+        interval = self.intervals.get(name, self.interval)
+        if failures > 0:
+            interval = min(self.max_backoff, interval * 2 ** failures)
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def poll(self, name):
+        client = self.clients[name]
+        async with self.semaphore:
+            start = time.monotonic()
+            try:
+                snapshot = await client.snapshot(self.status_parts)
+                temperature = snapshot["printer"].get("temperature", dict())
+                state = {
+                    "online": True,
+                    "connected": snapshot["connection"]["current"]["state"] != "Closed",
+                    "progress": printed_progress(snapshot["job"], temperature),
+                    "temperature": temperature,
+                    "latency": time.monotonic() - start,
+                    "updated": time.time(),
+                    "failures": 0
+                }
+            except (ConnectionError, OctoPrintError, ValueError, KeyError, TypeError, AttributeError) as e:
+                # ValueError: not JSON, KeyError/TypeError/AttributeError: JSON of another shape
+                state = self.failed_state(name, e)
+        self.update(name, state)
+        return state
+
+    def failed_state(self, name, error):
+        previous = self.state.get(name, dict())
+        return {
+            **previous,
+            "online": False,
+            "error": str(error) or type(error).__name__,
+            "failures": previous.get("failures", 0) + 1
+        }
+
+    def update(self, name, state):
+        self.state[name] = state
+        if self.on_update is not None:
+            self.on_update(name, state)
+
+    async def poll_forever(self, name):
+        # Spread the first polls over one interval instead of hitting every printer at once
+        await asyncio.sleep(random.uniform(0, self.intervals.get(name, self.interval)))
+        while self.running:
+            try:
+                state = await self.poll(name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Anything else (a failing `on_update` too) only backs this printer off
+                print(f"Polling {name} failed: {e!r}")
+                state = self.failed_state(name, e)
+                self.state[name] = state
+            await asyncio.sleep(self.next_delay(name, state["failures"]))
+
+    async def run(self):
+        self.running = True
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            await asyncio.gather(*[self.poll_forever(name) for name in self.clients], return_exceptions=True)
+        finally:
+            self.running = False
+
+    def stop(self):
+        self.running = False
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+        for client in self.clients.values():
+            await client.close()
+
+    def table(self):
+        """One row per printer, the consolidated view of the farm"""
+        rows = []
+        for name in self.clients:
+            state = self.state.get(name, dict())
+            temperature = state.get("temperature", dict())
+            rows.append({
+                "name": name,
+                "online": state.get("online", False),
+                "connected": state.get("connected", False),
+                "job_state": state.get("progress", dict()).get("job_state", "-"),
+                "completion": state.get("progress", dict()).get("completion"),
+                "tool": temperature.get("tool0", dict()).get("actual"),
+                "bed": temperature.get("bed", dict()).get("actual"),
+                "failures": state.get("failures", 0),
+                "updated": state.get("updated")
+            })
+        return rows
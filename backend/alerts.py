@@ -0,0 +1,81 @@
+import queue
+import threading
+import time
+
+
+class AnomalyPublisher:
+    """Publish the anomaly state of one machine to the `anomaly` collection.
+
+    Only state transitions are written, not every anomalous frame, and the writes go out
+    from a background thread so a slow Firestore never blocks the GUI. If several
+    transitions are waiting only the newest one is written. The LINE bot listens to the
+    collection (see `linebot/anomaly_listener.py`) and resets `error` after notifying, the
+    next normal -> anomaly transition raises it again. A failed write is kept and retried
+    after `backoff` seconds, doubling up to `max_backoff`, unless a newer transition
+    replaces it in the meantime.
+    """
+    def __init__(self, collection, machine_id, backoff=1, max_backoff=60):
+        self.collection = collection
+        self.machine_id = machine_id
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.anomaly = False
+        self.lock = threading.Lock()
+        self.events = queue.Queue()
+
+        # Numbers for checking how many writes are saved
+        self.published = 0
+        self.writes = 0
+        self.failed_writes = 0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def publish(self, anomaly):
+        """Record a transition of the `DecisionEngine` (True: the machine turned anomalous,
+        False: it recovered), return True if it changed the published state"""
+        anomaly = bool(anomaly)
+        with self.lock:
+            self.published += 1
+            if anomaly == self.anomaly:
+                return False
+            self.anomaly = anomaly
+        self.events.put((anomaly, time.time()))
+        return True
+
+    def run(self):
+        running, pending, failures, delay = True, None, 0, None
+        while running:
+            try:
+                # Waits for the next transition, or until the failed write is due again
+                events = [self.events.get(timeout=delay)]
+            except queue.Empty:
+                events = []
+            while not self.events.empty():
+                events.append(self.events.get_nowait())
+            running = None not in events
+
+            # Only the newest transition matters, the others are already outdated
+            events = [event for event in events if event is not None]
+            if events:
+                pending = events[-1]
+            if pending is None:
+                continue
+
+            anomaly, changed = pending
+            try:
+                self.collection.document(self.machine_id).set({"error": anomaly, "time": changed})
+            except Exception as e:
+                self.failed_writes += 1
+                failures += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** (failures - 1))
+                print(f"Publishing the anomaly state of {self.machine_id} failed, retrying in {delay} s: {e}")
+            else:
+                self.writes += 1
+                pending, failures, delay = None, 0, None
+
+    def close(self, timeout=None):
+        """Write the pending transition (one more try if it failed) and stop the thread,
+        waits at most `timeout` seconds for that write"""
+        self.events.put(None)
+        self.thread.join(timeout)
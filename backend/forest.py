@@ -0,0 +1,220 @@
+"""Random forest of the Material tab compiled into flat NumPy arrays.
+
+    $ python -m backend.forest weights/material_cls weights/material_forest
+
+`compile_forest` turns the split nodes of every tree of a fitted `RandomForestRegressor`
+into one set of arrays (feature, threshold, tree and leaf mask of every split, the leaf
+values and the first leaf of every tree), `save_forest` writes them as `.npy` files and
+`load_forest` maps them back without reading them (`mmap_mode`). `ForestEvaluator.predict`
+gives the same numbers as `RandomForestRegressor.predict` without scikit-learn.
+
+The leaves of every tree are numbered left to right and a row that goes right at a split
+cannot end in a leaf under its left child. `mask` is the leaves a split keeps when the row
+goes right, and the leaf of a row is the lowest leaf kept by all the splits it goes right
+at. Sorted by threshold, these are a prefix of the splits of every feature, so the
+evaluator builds the combined masks of every prefix once and a row costs one binary
+search and one lookup per feature instead of a walk down every tree. These tables hold
+(splits + features) x trees x leaves / 64 words, fine for the Material forest (a few
+thousand splits, tens of leaves per tree) but not for forests of large datasets.
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+array_names = ("feature", "threshold", "tree", "mask", "value", "first_leaf")
+
+# Largest mask tables `compile_forest` accepts, in bytes
+max_table_size = 256 * 2 ** 20
+
+
+class TreeState:
+    """Stand-in for `sklearn.tree._tree.Tree` when a pickle of another scikit-learn
+    version does not load, keeps the node arrays of the pickle"""
+    def __init__(self, n_features, n_classes, n_outputs):
+        self.n_outputs = n_outputs
+
+    def __setstate__(self, state):
+        nodes = state["nodes"]
+        self.children_left = nodes["left_child"]
+        self.children_right = nodes["right_child"]
+        self.feature = nodes["feature"]
+        self.threshold = nodes["threshold"]
+        self.value = state["values"]
+        self.max_depth = state["max_depth"]
+
+
+def load_pickled_forest(path):
+    """The pickled forest, with `TreeState` trees if this scikit-learn cannot read it"""
+    import joblib
+    from joblib.numpy_pickle import NumpyUnpickler
+
+    try:
+        return joblib.load(path)
+    except ValueError:
+        # Newer versions added node fields, the old nodes are still enough to compile
+        pass
+
+    class Unpickler(NumpyUnpickler):
+        def find_class(self, module, name):
+            if module == "sklearn.tree._tree" and name == "Tree":
+                return TreeState
+            return super(Unpickler, self).find_class(module, name)
+
+    with open(path, "rb") as file:
+        return Unpickler(str(path), file, ensure_native_byte_order=True).load()
+
+
+def leaf_spans(left, right):
+    """First leaf and one past the last leaf under every node, leaves numbered left to right"""
+    first = np.zeros(len(left), dtype=np.int64)
+    end = np.zeros(len(left), dtype=np.int64)
+    leaves = 0
+    stack = [(0, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if left[node] == -1:
+            first[node], end[node] = leaves, leaves + 1
+            leaves += 1
+        elif children_done:
+            first[node], end[node] = first[left[node]], end[right[node]]
+        else:
+            stack += [(node, True), (right[node], False), (left[node], False)]
+    return first, end
+
+
+def compile_forest(forest):
+    """The arrays of `ForestEvaluator` for a fitted `RandomForestRegressor`, the splits
+    sorted by feature and threshold"""
+    trees = [estimator.tree_ for estimator in forest.estimators_]
+    most_leaves = max(int(np.count_nonzero(np.asarray(tree.children_left) == -1)) for tree in trees)
+    words = (most_leaves + 63) // 64
+    all_leaves = (1 << 64 * words) - 1
+    feature, threshold, tree_index, mask, value = [], [], [], [], []
+    for index, tree in enumerate(trees):
+        left = np.asarray(tree.children_left)
+        right = np.asarray(tree.children_right)
+        first, end = leaf_spans(left, right)
+        leaves = np.flatnonzero(left == -1)
+        # (nodes, outputs, 1) in scikit-learn, the regression values are already the means
+        value.append(np.asarray(tree.value)[leaves[np.argsort(first[leaves])], :, 0])
+        splits = np.flatnonzero(left != -1)
+        feature.append(np.asarray(tree.feature)[splits])
+        threshold.append(np.asarray(tree.threshold)[splits])
+        tree_index.append(np.full(len(splits), index))
+        for node in splits:
+            # Going right drops the leaves under the left child
+            kept = all_leaves ^ ((1 << int(end[left[node]] - first[node])) - 1) << int(first[node])
+            mask.append([(kept >> 64 * word) & 0xFFFFFFFFFFFFFFFF for word in range(words)])
+    feature = np.concatenate(feature).astype(np.int32)
+    threshold = float32_thresholds(np.concatenate(threshold).astype(np.float64))
+    table_size = (len(feature) + feature.max(initial=0) + 1) * len(trees) * words * 8
+    if table_size > max_table_size:
+        raise ValueError(f"The mask tables of this forest need {table_size / 2 ** 20:.0f} MB, "
+                         f"more than {max_table_size / 2 ** 20:.0f} MB")
+    order = np.lexsort((threshold, feature))
+    return dict(
+        feature=feature[order],
+        threshold=threshold[order],
+        tree=np.concatenate(tree_index)[order].astype(np.int32),
+        mask=np.array(mask, dtype=np.uint64).reshape(-1, words)[order],
+        value=np.concatenate(value).astype(np.float64),
+        first_leaf=np.cumsum([0] + [len(leaves) for leaves in value[:-1]]).astype(np.int64))
+
+
+def save_forest(arrays, path):
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    for name in array_names:
+        np.save(path / f"{name}.npy", arrays[name])
+
+
+def load_forest(path, mmap_mode="r"):
+    arrays = {name: np.load(Path(path) / f"{name}.npy", mmap_mode=mmap_mode) for name in array_names}
+    return ForestEvaluator(**arrays)
+
+
+def float32_thresholds(threshold):
+    """The largest float32 at or below each threshold: for a float32 input `x <= t` and
+    `x <= float32_thresholds(t)` agree, so the evaluator compares in float32 like
+    scikit-learn compares float32 inputs with float64 thresholds"""
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+class ForestEvaluator:
+    def __init__(self, feature, threshold, tree, mask, value, first_leaf):
+        # Plain arrays over the mapped files, `np.memmap` adds overhead to every indexing
+        feature = np.asarray(feature)
+        tree = np.asarray(tree)
+        mask = np.asarray(mask)
+        self.value = np.asarray(value)
+        self.first_leaf = np.asarray(first_leaf)
+        self.words = mask.shape[1]
+        # Row k of a feature's table has the leaves every tree keeps after its first k splits
+        self.thresholds, self.tables = [], []
+        bounds = np.searchsorted(feature, np.arange(feature.max(initial=0) + 2))
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            table = np.full((stop - start + 1, self.n_trees, self.words), np.iinfo(np.uint64).max, dtype=np.uint64)
+            table[np.arange(1, stop - start + 1), tree[start:stop]] = mask[start:stop]
+            np.bitwise_and.accumulate(table, axis=0, out=table)
+            self.thresholds.append(np.asarray(threshold[start:stop]))
+            self.tables.append(table)
+
+    @property
+    def n_trees(self):
+        return len(self.first_leaf)
+
+    def apply(self, X, buffers=None):
+        """Leaf of every tree for every row, shape (trees, rows) of indices into `value`.
+        `buffers` are two (rows, trees, words) uint64 arrays to reuse"""
+        X = np.asarray(X, dtype=np.float32)
+        if buffers is None:
+            buffers = np.empty((2, len(X), self.n_trees, self.words), dtype=np.uint64)
+        kept, masks = buffers[0, :len(X)], buffers[1, :len(X)]
+        for feature, (thresholds, table) in enumerate(zip(self.thresholds, self.tables)):
+            # The splits a row goes right at, NaN sorts last and goes right like in scikit-learn
+            splits = thresholds.searchsorted(X[:, feature])
+            if feature == 0:
+                table.take(splits, axis=0, out=kept, mode="clip")
+            else:
+                table.take(splits, axis=0, out=masks, mode="clip")
+                kept &= masks
+        # Lowest bit of every word alone, its float64 exponent is the bit's index
+        np.invert(kept, out=masks)
+        masks += np.uint64(1)
+        masks &= kept
+        exponent = masks.astype(np.float64).view(np.int64) >> 52
+        exponent -= 1023
+        if self.words == 1:
+            leaves = exponent[:, :, 0]
+        else:
+            # Words without a kept leaf are skipped, the first one with a leaf holds the lowest
+            leaves = np.where(exponent >= 0, exponent + 64 * np.arange(self.words), 64 * self.words).min(axis=2)
+        return leaves.T + self.first_leaf[:, None]
+
+    def predict(self, X, chunk_size=256):
+        """Mean of the trees, shape (rows, outputs). Rows go through in chunks that keep the
+        masks in the cache"""
+        X = np.asarray(X, dtype=np.float32)
+        out = np.empty((len(X), self.value.shape[1]))
+        buffers = np.empty((2, min(chunk_size, len(X)), self.n_trees, self.words), dtype=np.uint64)
+        for start in range(0, len(X), chunk_size):
+            leaves = self.apply(X[start:start + chunk_size], buffers)
+            # Summed tree after tree like scikit-learn, the result is the same to the last bit
+            out[start:start + chunk_size] = self.value.take(leaves, axis=0).sum(axis=0)
+        out /= self.n_trees
+        return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a pickled random forest into NumPy arrays")
+    parser.add_argument("forest", help="joblib pickle of a fitted RandomForestRegressor")
+    parser.add_argument("output", help="Directory of the .npy files")
+    args = parser.parse_args()
+    arrays = compile_forest(load_pickled_forest(args.forest))
+    save_forest(arrays, args.output)
+    print(f"{len(arrays['first_leaf'])} trees, {len(arrays['feature'])} splits, "
+          f"{len(arrays['value'])} leaves -> {args.output}")
@@ -0,0 +1,6 @@
+from .model import AnomalyModel
+from .client import InferenceClient
+from .server import InferenceServer
+from .scheduler import BatchScheduler
+from .decision import DecisionEngine
+from .gating import FrameGate
@@ -0,0 +1,173 @@
+"""Pick the fastest engine, thread count and batch size for this host.
+
+    $ python -m backend.inference.autotune --objective throughput --retune
+
+Every available engine of `engines.py` runs synthetic `(B, 3, 352, 352)` batches for each
+thread count and batch size. The winner is cached on disk per host fingerprint (CPU,
+core count, runtime versions and weights), later starts read it back without tuning.
+"""
+import argparse
+import hashlib
+import importlib.metadata
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+from backend.inference.engines import available_engines, engine_registry, load_engine, weight_path
+
+objectives = ["latency", "throughput"]
+default_cache_path = f"{weight_path}/autotune.json"
+
+
+def cpu_name():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name") or line.startswith("Model"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def package_version(package):
+    # Without importing it, torch alone takes seconds to import
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def host_fingerprint():
+    """Changes whenever the numbers of the last tuning may no longer hold"""
+    weights = {}
+    for spec in engine_registry.values():
+        for weight in spec.weights:
+            path = f"{weight_path}/{weight}"
+            if os.path.exists(path):
+                weights[weight] = os.path.getsize(path)
+
+    host = {
+        "machine": platform.machine(),
+        "cpu": cpu_name(),
+        "cores": os.cpu_count(),
+        "onnxruntime": package_version("onnxruntime"),
+        "torch": package_version("torch"),
+        "weights": weights
+    }
+    return hashlib.sha1(json.dumps(host, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def thread_candidates():
+    cores = os.cpu_count() or 1
+    return sorted({1, 2, cores // 2, cores} & set(range(1, cores + 1)))
+
+
+def time_engine(engine, batch, warmup=2, iterations=5):
+    for _ in range(warmup):
+        engine.predict_batch(batch)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        engine.predict_batch(batch)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def autotune(backends=None, threads=None, batch_sizes=(1, 2, 4, 8), warmup=2, iterations=5,
+             crop_size=352, verbose=False):
+    """Return one row per (backend, threads, batch size) with the median seconds per batch"""
+    rng = np.random.default_rng(0)
+    batches = {size: rng.standard_normal((size, 3, crop_size, crop_size), dtype=np.float32)
+               for size in batch_sizes}
+
+    results = []
+    for backend in backends or available_engines():
+        for num_threads in threads or thread_candidates():
+            try:
+                engine = load_engine(backend, num_threads=num_threads)
+            except (ImportError, OSError, RuntimeError, TypeError, AssertionError) as e:
+                # e.g. a quantized weight without the timm build it was trained with
+                if verbose:
+                    print(f"{backend:>18} skipped: {e}")
+                break
+            for batch_size, batch in batches.items():
+                try:
+                    seconds = time_engine(engine, batch, warmup, iterations)
+                except (RuntimeError, ValueError, MemoryError) as e:
+                    # e.g. a runtime without the kernels of a quantized weight
+                    if verbose:
+                        print(f"{backend:>18} threads {num_threads:>2} batch {batch_size:>2} failed: {e}")
+                    continue
+                results.append({
+                    "backend": backend,
+                    "num_threads": num_threads,
+                    "batch_size": batch_size,
+                    "ms_per_batch": 1000 * seconds,
+                    "frames_per_second": batch_size / seconds
+                })
+                if verbose:
+                    print(f"{backend:>18} threads {num_threads:>2} batch {batch_size:>2}: "
+                          f"{1000 * seconds:8.1f} ms {batch_size / seconds:7.1f} frames/s")
+    return results
+
+
+def pick_best(results, objective="latency"):
+    """`latency`: fastest single frame, `throughput`: most frames per second at any batch size"""
+    assert objective in objectives, f"`objective` should be one of {objectives}"
+    if not results:
+        raise RuntimeError("No inference backend could be benchmarked, none of the engines of "
+                           "engines.py loaded or ran. Check the runtimes and the weights in weights/")
+    if objective == "latency":
+        smallest = min(row["batch_size"] for row in results)
+        best = min((row for row in results if row["batch_size"] == smallest), key=lambda row: row["ms_per_batch"])
+    else:
+        best = max(results, key=lambda row: row["frames_per_second"])
+    return {key: best[key] for key in ["backend", "num_threads", "batch_size"]}
+
+
+def read_cache(cache_path):
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def tuned_config(objective="latency", cache_path=None, retune=False, **kwargs):
+    """Return the cached winner of this host, tune and cache it first if there is none"""
+    cache_path = cache_path or os.getenv("autotune_cache", default_cache_path)
+    fingerprint = host_fingerprint()
+    cache = read_cache(cache_path)
+    entry = cache.get(fingerprint, dict())
+    if not retune and objective in entry.get("best", dict()):
+        return entry["best"][objective]
+
+    results = autotune(**kwargs)
+    entry = {
+        "tuned": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "best": {name: pick_best(results, name) for name in objectives},
+        "results": results
+    }
+    cache[fingerprint] = entry
+    with open(cache_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    return entry["best"][objective]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the engines and cache the fastest one")
+    parser.add_argument("--objective", default="latency", choices=objectives)
+    parser.add_argument("--backends", nargs="*", choices=list(engine_registry))
+    parser.add_argument("--threads", nargs="*", type=int)
+    parser.add_argument("--batch-sizes", nargs="*", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--cache", default=None, help=f"Defaults to {default_cache_path}")
+    parser.add_argument("--retune", action="store_true", help="Ignore the cached result")
+    args = parser.parse_args()
+
+    best = tuned_config(args.objective, args.cache, args.retune, backends=args.backends, threads=args.threads,
+                        batch_sizes=args.batch_sizes, verbose=True)
+    print(f"{host_fingerprint()}: {best}")
@@ -0,0 +1,33 @@
+import numpy as np
+import requests
+
+
+class InferenceClient:
+    """Send RGB frames to `backend/inference_server.py` instead of running the model locally"""
+    def __init__(self, url="http://localhost:8500", timeout=5, jpeg_quality=95):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.jpeg_quality = jpeg_quality
+        self.session = requests.Session()
+
+    def predict(self, frame, printer_id="default", bgr=False, cropped=False):
+        """Return the logits `[no defect, defect]` of a single RGB (or BGR if `bgr=True`) frame,
+        `cropped` if the sender already cropped it to the model geometry"""
+        import cv2
+
+        success, buffer = cv2.imencode(
+            ".jpg", frame if bgr else cv2.cvtColor(frame, cv2.COLOR_RGB2BGR),
+            [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        assert success, "Fail to encode the frame"
+
+        try:
+            response = self.session.post(
+                f"{self.url}/predict", params={"printer": printer_id, "cropped": int(cropped)}, data=buffer.tobytes(),
+                headers={"Content-Type": "image/jpeg"}, timeout=self.timeout)
+        except requests.exceptions.ConnectionError:
+            raise ValueError("Inference server is not working. Please check the service")
+        response.raise_for_status()
+        return np.asarray(response.json()["logits"], dtype=np.float32)
+
+    def health(self):
+        return self.session.get(f"{self.url}/health", timeout=self.timeout).json()
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import numpy as np
+
+
+def anomaly_score(logits):
+    """Softmax probability of the defect class"""
+    logits = np.asarray(logits, dtype=np.float64)
+    exp = np.exp(logits - logits.max())
+    return float(exp[1] / exp.sum())
+
+
+class PrinterDecision:
+    """Decision state of a single printer, the ring buffer keeps the latest `window` scores"""
+    def __init__(self, window):
+        self.scores = np.zeros(window, dtype=np.float32)
+        self.index = 0
+        self.count = 0
+        self.votes = 0
+        self.ema = None
+        self.anomaly = False
+        self.last_raised = None
+
+
+class DecisionEngine:
+    """Turn the per-frame predictions of many printers into debounced anomaly states
+
+    Every frame's defect probability feeds an EMA (`ema_alpha=1` disables it) and a vote
+    over the last `window` frames (`score > vote_threshold`). A printer turns anomalous once
+    the EMA reaches `raise_threshold` and at least `votes` frames of the window agree, and
+    only turns back to normal once the EMA falls to `clear_threshold`. After raising, the
+    printer cannot raise again for `cooldown` seconds. `update` returns the new state when
+    it changes and None otherwise, so only transitions are emitted.
+    """
+    def __init__(self, window=8, votes=5, ema_alpha=0.3, raise_threshold=0.6, clear_threshold=0.3,
+                 vote_threshold=0.5, cooldown=60, clock=time.monotonic):
+        assert 0 < votes <= window, "`votes` should be in (0, window]"
+        assert clear_threshold <= raise_threshold, "`clear_threshold` should not be above `raise_threshold`"
+
+        self.window = window
+        self.votes = votes
+        self.ema_alpha = ema_alpha
+        self.raise_threshold = raise_threshold
+        self.clear_threshold = clear_threshold
+        self.vote_threshold = vote_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+
+        self.printers = dict()
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.changes = 0
+
+    def update(self, printer_id, logits, timestamp=None):
+        """Add the logits of one frame, return True/False if the state of the printer changed"""
+        score = anomaly_score(logits)
+        now = self.clock() if timestamp is None else timestamp
+        with self.lock:
+            state = self.printers.get(printer_id)
+            if state is None:
+                state = self.printers[printer_id] = PrinterDecision(self.window)
+
+            # The vote of the score that leaves the window is taken back
+            if state.count == self.window:
+                state.votes -= int(state.scores[state.index] > self.vote_threshold)
+            else:
+                state.count += 1
+            state.scores[state.index] = score
+            state.votes += int(score > self.vote_threshold)
+            state.index = (state.index + 1) % self.window
+            state.ema = score if state.ema is None else \
+                self.ema_alpha * score + (1 - self.ema_alpha) * state.ema
+            self.frames += 1
+
+            if state.anomaly:
+                change = state.ema <= self.clear_threshold
+            else:
+                cooling = state.last_raised is not None and now - state.last_raised < self.cooldown
+                change = not cooling and state.ema >= self.raise_threshold and state.votes >= self.votes
+            if not change:
+                return None
+
+            state.anomaly = not state.anomaly
+            if state.anomaly:
+                state.last_raised = now
+            self.changes += 1
+            return state.anomaly
+
+    def is_anomaly(self, printer_id):
+        with self.lock:
+            state = self.printers.get(printer_id)
+            return state is not None and state.anomaly
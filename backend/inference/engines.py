@@ -0,0 +1,77 @@
+"""Registry of the inference engines.
+
+Every engine takes the float32 `(B, 3, 352, 352)` batch of `Preprocessor` and returns the
+`(B, 2)` logits `[no defect, defect]` with `predict_batch`. The loaders import their
+runtime lazily, so e.g. the ONNX engine does not need torch. Which engine runs is picked at
+runtime by name, see `AnomalyModel` and `available_engines`.
+"""
+import importlib.util
+import os
+from collections import namedtuple
+from pathlib import Path
+
+weight_path = f"{Path(__file__).parent.parent.parent}/weights"
+
+EngineSpec = namedtuple("EngineSpec", ["loader", "requires", "weights"])
+engine_registry = dict()
+
+
+def register_engine(name, loader, requires=(), weights=()):
+    """`loader(**options)` returns an object with `predict_batch`, `requires` lists the
+    modules and `weights` the files under `weights/` the engine needs"""
+    engine_registry[name] = EngineSpec(loader, tuple(requires), tuple(weights))
+
+
+def is_available(name):
+    spec = engine_registry[name]
+    return all(importlib.util.find_spec(module) is not None for module in spec.requires) and \
+        all(os.path.exists(f"{weight_path}/{weight}") for weight in spec.weights)
+
+
+def available_engines():
+    """Engines whose runtime is installed and whose weight is downloaded"""
+    return [name for name in engine_registry if is_available(name)]
+
+
+def load_engine(name, **options):
+    if name not in engine_registry:
+        raise ValueError(f"Unknown backend `{name}`, choose from {list(engine_registry)}")
+    return engine_registry[name].loader(**options)
+
+
+class OnnxEngine:
+    def __init__(self, num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            f"{weight_path}/resnet.onnx", options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict_batch(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+def load_torch_engine(**options):
+    from backend.inference.torch_models import load_torch_model
+    return load_torch_model(**options)
+
+
+def load_torchscript_engine(**options):
+    from backend.inference.torch_models import load_torchscript_model
+    return load_torchscript_model(**options)
+
+
+def load_quantized_engine(qengine="fbgemm", **options):
+    from backend.inference.torch_models import load_quantized_model
+    return load_quantized_model(qengine=qengine, **options)
+
+
+register_engine("onnx", OnnxEngine, requires=["onnxruntime"], weights=["resnet.onnx"])
+register_engine("torch", load_torch_engine, requires=["torch", "timm"], weights=["resnet.pt"])
+register_engine("torchscript", load_torchscript_engine, requires=["torch", "timm"], weights=["resnet.pt"])
+register_engine("quantized", load_quantized_engine, requires=["torch", "timm"], weights=["quantized.pt"])
+register_engine("quantized_qnnpack", lambda **options: load_quantized_engine(qengine="qnnpack", **options),
+                requires=["torch", "timm"], weights=["quantized.pt"])
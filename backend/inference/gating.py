@@ -0,0 +1,67 @@
+import threading
+import time
+
+import numpy as np
+
+
+class FrameGate:
+    """Skip the model when the camera sees the same scene as the last inferred frame
+
+    A frame is shrunk to a `size` x `size` grayscale thumbnail, which also averages the
+    sensor noise away. If no cell of it differs from the thumbnail of the last inferred
+    frame of the same printer by `threshold` (in 0-255 intensity levels) or more, the
+    previous logits are reused, but never for longer than `max_age` seconds. The largest
+    cell difference is used instead of the mean, so a small defect is not averaged away.
+    `hits`, `misses` and `forced` count reused predictions, inferences because the scene
+    changed and inferences because the reused prediction got too old.
+    """
+    def __init__(self, threshold=2.5, size=32, max_age=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.size = size
+        self.max_age = max_age
+        self.clock = clock
+
+        # printer id -> (thumbnail, logits, inferred time)
+        self.last = dict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.forced = 0
+
+    def thumbnail(self, frame):
+        import cv2
+
+        small = cv2.resize(frame, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        return small.astype(np.float32).mean(axis=2) if small.ndim == 3 else small.astype(np.float32)
+
+    def predict(self, printer_id, frame, predict, timestamp=None):
+        """Return the logits of `frame`, calls `predict(frame)` only if the scene changed"""
+        now = self.clock() if timestamp is None else timestamp
+        thumbnail = self.thumbnail(frame)
+        with self.lock:
+            last = self.last.get(printer_id)
+            if last is not None:
+                last_thumbnail, last_logits, inferred = last
+                if now - inferred >= self.max_age:
+                    self.forced += 1
+                elif np.abs(thumbnail - last_thumbnail).max() < self.threshold:
+                    self.hits += 1
+                    return last_logits
+                else:
+                    self.misses += 1
+            else:
+                self.misses += 1
+
+        logits = predict(frame)
+        with self.lock:
+            self.last[printer_id] = (thumbnail, logits, now)
+        return logits
+
+    def report(self):
+        total = self.hits + self.misses + self.forced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "forced": self.forced,
+            "hit_rate": self.hits / total if total else 0.
+        }
@@ -0,0 +1,37 @@
+from backend.inference.engines import load_engine
+from backend.inference.preprocess import Preprocessor
+
+
+class AnomalyModel:
+    """Load one of the engines of `engines.py` once and classify frames with it.
+    Frames are RGB unless `bgr=True` (e.g. straight from `cv2.imdecode`), `engine_options`
+    (e.g. `num_threads`) go to the engine. `backend="auto"` runs the engine and thread count
+    `autotune.py` found fastest for a single frame on this host.
+
+    `rois` maps printer ids to the region of interest of their camera, see `roi.py`.
+    `input_size` below the trained 352 makes every inference cheaper, it relies on the
+    dynamic height/width axes of the exported model"""
+    def __init__(self, backend="onnx", bgr=False, rois=None, input_size=352, **engine_options):
+        if backend == "auto":
+            from backend.inference.autotune import tuned_config
+            tuned = tuned_config("latency")
+            backend = tuned["backend"]
+            engine_options.setdefault("num_threads", tuned["num_threads"])
+
+        self.backend = backend
+        # Keep the 400 -> 352 resize/crop ratio of training for frames without a region of interest
+        self.preprocess = Preprocessor(
+            resize_size=round(input_size * 400 / 352), crop_size=input_size, bgr=bgr, rois=rois)
+        self.engine = load_engine(backend, **engine_options)
+
+    def set_precropped(self, printer_id, precropped):
+        """The frames of `printer_id` come cropped by `send_image.py`, see `Preprocessor`"""
+        self.preprocess.set_precropped(printer_id, precropped)
+
+    def predict(self, frame, printer_id=None):
+        """Return the logits `[no defect, defect]` of a single frame"""
+        return self.predict_batch([frame], None if printer_id is None else [printer_id])[0]
+
+    def predict_batch(self, frames, printer_ids=None):
+        """Return the `(B, 2)` logits of a list of frames with one forward pass"""
+        return self.engine.predict_batch(self.preprocess.batch(frames, printer_ids))
@@ -0,0 +1,124 @@
+import numpy as np
+
+imagenet_mean = [0.485, 0.456, 0.406]
+imagenet_std = [0.229, 0.224, 0.225]
+
+
+class Preprocessor:
+    """NumPy/OpenCV version of the torchvision pipeline the model was trained with
+
+        ToTensor -> Resize((400, 400)) -> CenterCrop(352) -> Normalize(mean, std) -> unsqueeze(0)
+
+    Resize and crop are fused into a single `cv2.warpAffine` that only computes the cropped
+    pixels. The printers of `precropped` send frames `send_image.py` already resized and
+    center cropped on the RPI (the `FRAME_CROPPED` flag of the stream), those are only
+    resized to `crop_size`, whatever their size. Normalisation and HWC -> CHW (plus the BGR -> RGB swap if
+    `bgr=True`) write straight into a preallocated float32 buffer. The returned arrays are
+    views of those buffers, so they are only valid until the next call.
+
+    `rois` maps printer ids to a region of interest `(x, y, width, height)` in fractions of
+    the frame, see `roi.py`. The region of such a printer is resized straight to
+    `crop_size` instead of resize + center crop, in the same single `cv2.warpAffine`. A
+    region of interest of a pre-cropped frame is mapped into the crop, the pixels outside
+    of it are already gone, so such printers should send the full frame (`--full-frame`).
+    """
+    def __init__(self, resize_size=400, crop_size=352, mean=imagenet_mean, std=imagenet_std,
+                 bgr=False, max_batch_size=8, rois=None, precropped=None):
+        self.resize_size = resize_size
+        self.crop_size = crop_size
+        self.bgr = bgr
+        self.rois = rois if rois is not None else dict()
+        self.precropped = set() if precropped is None else set(precropped)
+        self.warned = set()
+
+        # (x / 255 - mean) / std == x * scale - shift
+        std = np.asarray(std, dtype=np.float32)
+        self.scale = (1 / (255 * std)).reshape(3, 1, 1)
+        self.shift = (np.asarray(mean, dtype=np.float32) / std).reshape(3, 1, 1)
+
+        self.cropped = np.empty((crop_size, crop_size, 3), dtype=np.uint8)
+        self.output = np.empty((max_batch_size, 3, crop_size, crop_size), dtype=np.float32)
+
+    def set_precropped(self, printer_id, precropped):
+        """Record whether the frames of a printer come already cropped"""
+        if precropped:
+            self.precropped.add(printer_id)
+        else:
+            self.precropped.discard(printer_id)
+
+    def crop_matrix(self, height, width, precropped=False):
+        """Map the pixels of the center crop back to the original frame,
+        the same half-pixel convention as the bilinear `Resize` of torchvision"""
+        if precropped:
+            return self.roi_matrix(height, width, (0, 0, 1, 1))
+
+        offset = (self.resize_size - self.crop_size) / 2
+        scale_x = width / self.resize_size
+        scale_y = height / self.resize_size
+        return np.array([
+            [scale_x, 0, (offset + 0.5) * scale_x - 0.5],
+            [0, scale_y, (offset + 0.5) * scale_y - 0.5]
+        ], dtype=np.float64)
+
+    def roi_matrix(self, height, width, roi):
+        """Map the pixels of the model input back to the region of interest"""
+        x, y, roi_width, roi_height = roi
+        scale_x = roi_width * width / self.crop_size
+        scale_y = roi_height * height / self.crop_size
+        return np.array([
+            [scale_x, 0, x * width + 0.5 * scale_x - 0.5],
+            [0, scale_y, y * height + 0.5 * scale_y - 0.5]
+        ], dtype=np.float64)
+
+    def crop_roi(self, printer_id, roi):
+        """The region of interest in fractions of a pre-cropped frame instead of the full frame"""
+        if printer_id not in self.warned:
+            self.warned.add(printer_id)
+            print(f"Printer {printer_id} has a region of interest but sends cropped frames, "
+                  f"run send_image.py with --full-frame to keep the resolution of the region")
+        # The sender keeps the center crop_size / resize_size of the frame
+        kept = self.crop_size / self.resize_size
+        margin = (1 - kept) / 2
+        x, y, roi_width, roi_height = roi
+        left, top = max(0., (x - margin) / kept), max(0., (y - margin) / kept)
+        right, bottom = min(1., (x + roi_width - margin) / kept), min(1., (y + roi_height - margin) / kept)
+        if right <= left or bottom <= top:
+            # The region is outside of the crop, classify the whole crop
+            return 0, 0, 1, 1
+        return left, top, right - left, bottom - top
+
+    def into(self, frame, out, printer_id=None):
+        """Preprocess a single HWC uint8 frame into `out` of shape `(3, crop, crop)`"""
+        import cv2
+
+        height, width = frame.shape[:2]
+        roi = self.rois.get(printer_id)
+        precropped = printer_id in self.precropped
+        if roi is None:
+            matrix = self.crop_matrix(height, width, precropped)
+        else:
+            matrix = self.roi_matrix(height, width, self.crop_roi(printer_id, roi) if precropped else roi)
+        cv2.warpAffine(
+            frame, matrix, (self.crop_size, self.crop_size),
+            dst=self.cropped, flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_REPLICATE)
+
+        chw = self.cropped.transpose(2, 0, 1)
+        if self.bgr:
+            chw = chw[::-1]
+        np.multiply(chw, self.scale, out=out)
+        out -= self.shift
+        return out
+
+    def __call__(self, frame, printer_id=None):
+        """Return the `(1, 3, crop, crop)` input of a single frame"""
+        return self.into(frame, self.output[0], printer_id)[None]
+
+    def batch(self, frames, printer_ids=None):
+        """Return the `(B, 3, crop, crop)` input of a list of frames"""
+        if len(frames) > len(self.output):
+            self.output = np.empty((len(frames), *self.output.shape[1:]), dtype=np.float32)
+        printer_ids = printer_ids or [None] * len(frames)
+        for idx, (frame, printer_id) in enumerate(zip(frames, printer_ids)):
+            self.into(frame, self.output[idx], printer_id)
+        return self.output[:len(frames)]
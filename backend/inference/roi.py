@@ -0,0 +1,95 @@
+"""Per-printer region of interest around the print bed.
+
+    $ python -m backend.inference.roi set --printer <machine id> --roi 0.25 0.3 0.5 0.55
+    $ python -m backend.inference.roi calibrate --printer <machine id> --reference empty.jpg --current printing.jpg
+
+A region is `(x, y, width, height)` in fractions of the camera frame, so it holds for any
+resolution the sender uses. It is stored in `rois.json` (or `roi_file` in `.env`) and given
+to `Preprocessor`, which resizes just that region to the model input.
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+default_roi_path = f"{Path(__file__).parent.parent.parent}/rois.json"
+
+
+def roi_path():
+    return os.getenv("roi_file", default_roi_path)
+
+
+def load_rois(path=None):
+    """Return {printer id: (x, y, width, height)}, empty if nothing is calibrated"""
+    try:
+        with open(path or roi_path()) as f:
+            return {printer_id: tuple(roi) for printer_id, roi in json.load(f).items()}
+    except FileNotFoundError:
+        return dict()
+
+
+def save_roi(printer_id, roi, path=None):
+    path = path or roi_path()
+    rois = load_rois(path)
+    rois[printer_id] = tuple(float(value) for value in roi)
+    with open(path, "w") as f:
+        json.dump(rois, f, indent=2)
+
+
+def grow_range(low, high, margin, min_size):
+    low, high = low - margin, high + margin
+    if high - low < min_size:
+        center = (low + high) / 2
+        low, high = center - min_size / 2, center + min_size / 2
+    # Shift back into the frame instead of cutting the range
+    if low < 0:
+        low, high = 0., high - low
+    if high > 1:
+        low, high = low - (high - 1), 1.
+    return max(0., low), min(1., high)
+
+
+def calibrate_roi(reference, current, margin=0.15, min_size=0.25, threshold=30):
+    """Region of the pixels that changed between `reference` (empty bed) and `current`
+    (a few layers in), grown by `margin` of the frame on every side and to at least `min_size`.
+    Returns None if nothing changed"""
+    import cv2
+
+    difference = cv2.absdiff(cv2.cvtColor(reference, cv2.COLOR_BGR2GRAY), cv2.cvtColor(current, cv2.COLOR_BGR2GRAY))
+    # Sensor noise and compression artifacts are small specks, the print is one blob
+    mask = cv2.morphologyEx((difference > threshold).astype(np.uint8), cv2.MORPH_OPEN, np.ones((5, 5), np.uint8))
+    ys, xs = np.nonzero(mask)
+    if len(xs) == 0:
+        return None
+
+    height, width = mask.shape
+    x0, x1 = grow_range(xs.min() / width, (xs.max() + 1) / width, margin, min_size)
+    y0, y1 = grow_range(ys.min() / height, (ys.max() + 1) / height, margin, min_size)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set the region of interest of a printer")
+    parser.add_argument("command", choices=["set", "calibrate", "show"])
+    parser.add_argument("--printer", help="Machine id")
+    parser.add_argument("--roi", nargs=4, type=float, metavar=("X", "Y", "WIDTH", "HEIGHT"),
+                        help="Fractions of the frame")
+    parser.add_argument("--reference", help="Frame of the empty bed")
+    parser.add_argument("--current", help="Frame a few layers into the print")
+    parser.add_argument("--margin", type=float, default=0.15)
+    args = parser.parse_args()
+
+    if args.command == "show":
+        print(json.dumps(load_rois(), indent=2))
+    else:
+        assert args.printer, "--printer is needed"
+        if args.command == "set":
+            roi = args.roi
+        else:
+            import cv2
+            roi = calibrate_roi(cv2.imread(args.reference), cv2.imread(args.current), args.margin)
+            assert roi is not None, "The two frames are the same, print a few layers first"
+        save_roi(args.printer, roi)
+        print(f"{args.printer}: {tuple(round(value, 3) for value in roi)}")
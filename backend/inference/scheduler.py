@@ -0,0 +1,188 @@
+import queue
+import threading
+import time
+from collections import OrderedDict, deque, defaultdict
+from concurrent.futures import Future
+
+overflow_policies = ["drop_oldest", "block", "reject"]
+
+
+class SchedulerStopped(RuntimeError):
+    """The scheduler was stopped before the frame was classified"""
+
+
+class BatchScheduler:
+    """Collect the frames of many printers and classify them with one batched forward pass
+
+    A batch is closed once `max_batch_size` frames are waiting or the oldest waiting frame
+    is `max_wait_ms` old. Every printer keeps at most `max_pending_per_printer` frames, on
+    overflow `drop_oldest` cancels the stale frame, `block` waits for room and `reject`
+    raises `queue.Full`. Printers are served round-robin and `max_per_printer` caps how many
+    frames of one printer go into a single batch, so a fast camera cannot starve the others.
+    `stop` fails the frames that are still waiting with `SchedulerStopped`.
+    """
+    def __init__(self, model, max_batch_size=8, max_wait_ms=20, max_pending_per_printer=2,
+                 overflow="drop_oldest", max_per_printer=1):
+        assert overflow in overflow_policies, f"`overflow` should be one of {overflow_policies}"
+
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_pending_per_printer = max_pending_per_printer
+        self.overflow = overflow
+        self.max_per_printer = max_per_printer or max_batch_size
+
+        # printer id -> deque of (frame, future, submitted time), only printers with frames are kept
+        self.pending = OrderedDict()
+        self.num_pending = 0
+        self.condition = threading.Condition()
+        self.running = False
+        self.stopped = False
+        self.worker = None
+
+        # batch size -> accumulated numbers, used to tune `max_batch_size` and `max_wait_ms`
+        self.batch_stats = defaultdict(lambda: {"batches": 0, "frames": 0, "seconds": 0., "wait_seconds": 0.})
+        self.dropped = 0
+        self.rejected = 0
+
+    def start(self):
+        self.running = True
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.stopped = True
+            self.condition.notify_all()
+        if self.worker is not None:
+            self.worker.join()
+
+        # Nobody takes these frames anymore, wake up whoever waits for their result
+        with self.condition:
+            pending, self.pending, self.num_pending = self.pending, OrderedDict(), 0
+        for printer_queue in pending.values():
+            for _, future, _ in printer_queue:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(SchedulerStopped("The scheduler stopped before the frame was classified"))
+
+    def submit(self, printer_id, frame):
+        """Queue one frame and return a `Future` of its logits"""
+        future = Future()
+        with self.condition:
+            if self.stopped:
+                raise SchedulerStopped("The scheduler is stopped")
+            printer_queue = self.pending.setdefault(printer_id, deque())
+            while len(printer_queue) >= self.max_pending_per_printer:
+                if self.overflow == "reject":
+                    self.rejected += 1
+                    raise queue.Full(f"Too many frames are waiting for printer `{printer_id}`")
+                elif self.overflow == "block":
+                    self.condition.wait()
+                    if self.stopped:
+                        raise SchedulerStopped("The scheduler is stopped")
+                    printer_queue = self.pending.setdefault(printer_id, deque())
+                else:
+                    _, stale_future, _ = printer_queue.popleft()
+                    stale_future.cancel()
+                    self.num_pending -= 1
+                    self.dropped += 1
+
+            printer_queue.append((frame, future, time.perf_counter()))
+            self.num_pending += 1
+            self.condition.notify_all()
+        return future
+
+    def predict(self, printer_id, frame, timeout=None):
+        return self.submit(printer_id, frame).result(timeout)
+
+    def next_batch(self):
+        with self.condition:
+            while self.running and self.num_pending == 0:
+                self.condition.wait()
+
+            # Wait for a full batch but never longer than `max_wait` for the oldest frame
+            while self.running and self.num_pending < self.max_batch_size:
+                oldest = min(printer_queue[0][2] for printer_queue in self.pending.values())
+                remaining = oldest + self.max_wait - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            if not self.running:
+                return []
+
+            batch = []
+            taken = defaultdict(int)
+            while len(batch) < self.max_batch_size and self.num_pending > 0:
+                taken_this_round = 0
+                for printer_id in list(self.pending):
+                    if len(batch) == self.max_batch_size:
+                        break
+                    if taken[printer_id] == self.max_per_printer:
+                        continue
+
+                    printer_queue = self.pending[printer_id]
+                    frame, future, submitted = printer_queue.popleft()
+                    self.num_pending -= 1
+                    taken[printer_id] += 1
+                    taken_this_round += 1
+                    if future.set_running_or_notify_cancel():
+                        batch.append((printer_id, frame, future, submitted))
+
+                    # Served printers go to the back so the next batch starts from someone else
+                    if len(printer_queue) == 0:
+                        del self.pending[printer_id]
+                    else:
+                        self.pending.move_to_end(printer_id)
+                if taken_this_round == 0:
+                    break
+
+            self.condition.notify_all()
+            return batch
+
+    def run(self):
+        while self.running:
+            batch = self.next_batch()
+            if len(batch) == 0:
+                continue
+
+            start = time.perf_counter()
+            try:
+                logits = self.model.predict_batch(
+                    [frame for _, frame, _, _ in batch], [printer_id for printer_id, _, _, _ in batch])
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+
+            stats = self.batch_stats[len(batch)]
+            stats["batches"] += 1
+            stats["frames"] += len(batch)
+            stats["seconds"] += elapsed
+            stats["wait_seconds"] += sum(start - submitted for _, _, _, submitted in batch)
+
+            for (_, _, future, _), logit in zip(batch, logits):
+                future.set_result(logit)
+
+    def report(self):
+        """Throughput and latency for every batch size seen so far"""
+        rows = []
+        for batch_size, stats in sorted(self.batch_stats.items()):
+            rows.append({
+                "batch_size": batch_size,
+                "batches": stats["batches"],
+                "frames": stats["frames"],
+                "ms_per_batch": 1000 * stats["seconds"] / stats["batches"],
+                "ms_per_frame": 1000 * stats["seconds"] / stats["frames"],
+                "frames_per_second": stats["frames"] / stats["seconds"] if stats["seconds"] > 0 else 0.,
+                "mean_wait_ms": 1000 * stats["wait_seconds"] / stats["frames"]
+            })
+        return {
+            "batches": rows,
+            "pending": self.num_pending,
+            "dropped": self.dropped,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,96 @@
+import json
+import queue
+from concurrent.futures import CancelledError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from .decision import DecisionEngine
+from .gating import FrameGate
+from .scheduler import SchedulerStopped
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /predict?printer=<machine id>[&cropped=1]  body: JPEG bytes
+       `cropped=1`: `send_image.py` already cropped the frame to the model geometry
+        -> {"printer": ..., "logits": [no defect, defect], "anomaly": bool,
+            "alert": bool, "alert_changed": bool}
+       `anomaly` is the prediction of this frame, `alert` the debounced state of the printer
+    GET  /health
+        -> {"status": "ok", "backend": ...}
+    GET  /stats
+        -> throughput of every batch size, see `BatchScheduler.report`, and the `FrameGate` counters
+    """
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self.send_json({"status": "ok", "backend": self.server.scheduler.model.backend})
+        elif path == "/stats":
+            self.send_json({**self.server.scheduler.report(), "gate": self.server.gate.report()})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        import cv2
+
+        url = urlparse(self.path)
+        if url.path != "/predict":
+            self.send_error(404)
+            return
+
+        query = parse_qs(url.query)
+        printer_id = query.get("printer", ["default"])[0]
+        self.server.scheduler.model.set_precropped(printer_id, query.get("cropped", ["0"])[0] == "1")
+        length = int(self.headers.get("Content-Length", 0))
+        frame = cv2.imdecode(np.frombuffer(self.rfile.read(length), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            self.send_error(400, "Cannot decode the image")
+            return
+
+        try:
+            logits = self.server.gate.predict(
+                printer_id, frame, lambda frame: self.server.scheduler.predict(printer_id, frame))
+        except queue.Full as e:
+            self.send_error(429, str(e))
+            return
+        except CancelledError:
+            self.send_error(409, "Frame is replaced by a newer frame of the same printer")
+            return
+        except SchedulerStopped as e:
+            self.send_error(503, str(e))
+            return
+
+        change = self.server.decision.update(printer_id, logits)
+        self.send_json({
+            "printer": printer_id,
+            "logits": [float(logit) for logit in logits],
+            "anomaly": bool(logits[1] > logits[0]),
+            "alert": self.server.decision.is_anomaly(printer_id),
+            "alert_changed": change is not None
+        })
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # One line per frame floods the console, only log when asked to
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class InferenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, scheduler, decision=None, gate=None, verbose=False):
+        super(InferenceServer, self).__init__(address, InferenceRequestHandler)
+        self.scheduler = scheduler
+        self.decision = decision or DecisionEngine()
+        self.gate = gate or FrameGate()
+        self.verbose = verbose
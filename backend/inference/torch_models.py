@@ -0,0 +1,110 @@
+import torch
+import torch.nn as nn
+import timm
+
+from backend.inference.engines import weight_path
+
+
+def reload_weight(weight_path):
+    weight = torch.load(weight_path, map_location="cpu")
+    new_weight = dict()
+    for key, val in weight.items():
+        new_weight[key.replace("model.", "")] = val
+    return new_weight
+
+
+class QuantizeTrainModel(nn.Module):
+    """Same architecture as the one in `quantize.ipynb`, needed to rebuild `quantized.pt`"""
+    def __init__(self, model_name="resnet34", pretrained=False, num_classes=2):
+        super().__init__()
+
+        self.quant = torch.ao.quantization.QuantStub()
+        self.model = timm.create_model(model_name, pretrained=pretrained,
+                                       block_args={"use_quantized": True})
+        self.model.fc = nn.Linear(self.model.fc.weight.shape[1], num_classes)
+        self.dequant = torch.ao.quantization.DeQuantStub()
+
+    def forward(self, x):
+        x = self.quant(x)
+        x = self.model(x)
+        return self.dequant(x)
+
+    def fused_module_inplace(self):
+        """Fuse conv + bn + act the same way as training did, the downsample
+        branches were left unfused there so they are left unfused here as well
+        """
+        self.train()
+
+        torch.ao.quantization.fuse_modules_qat(
+            self.model, [["conv1", "bn1", "act1"]], inplace=True
+        )
+        for basic_block_name, basic_block in self.model.named_children():
+            if "layer" not in basic_block_name:
+                continue
+
+            for sub_block in basic_block.children():
+                torch.ao.quantization.fuse_modules_qat(
+                    sub_block,
+                    [["conv1", "bn1", "act1"], ["conv2", "bn2", "act2"]],
+                    inplace=True
+                )
+
+
+class TorchRunner:
+    """Feed the numpy batch from `Preprocessor` to a torch module"""
+    def __init__(self, model, qengine=None):
+        self.model = model
+        self.qengine = qengine
+
+    @torch.no_grad()
+    def predict_batch(self, batch):
+        # The quantized engine is a global of torch, the one the model was converted with has to run it
+        if self.qengine is not None and torch.backends.quantized.engine != self.qengine:
+            torch.backends.quantized.engine = self.qengine
+        return self.model(torch.from_numpy(batch)).numpy()
+
+
+def set_num_threads(num_threads):
+    # Shared by every torch model of the process
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+
+def build_torch_model():
+    model = timm.create_model("resnet34", pretrained=False)
+    model.fc = nn.Linear(model.fc.weight.shape[1], 2)
+    model.load_state_dict(reload_weight(f"{weight_path}/resnet.pt"))
+    return model.eval()
+
+
+def load_torch_model(num_threads=None):
+    set_num_threads(num_threads)
+    return TorchRunner(build_torch_model())
+
+
+def load_torchscript_model(num_threads=None, crop_size=352):
+    """Trace and freeze the FP32 model, the graph is fixed for `(B, 3, crop, crop)` inputs"""
+    set_num_threads(num_threads)
+    with torch.no_grad():
+        traced = torch.jit.trace(build_torch_model(), torch.zeros(1, 3, crop_size, crop_size))
+        model = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    return TorchRunner(model)
+
+
+def load_quantized_model(qengine="fbgemm", num_threads=None):
+    """INT8 QAT model, `qengine` is fbgemm for x86 servers or qnnpack for ARM (the RPI)"""
+    assert qengine in torch.backends.quantized.supported_engines, \
+        f"This torch build only supports {torch.backends.quantized.supported_engines}"
+    set_num_threads(num_threads)
+    torch.backends.quantized.engine = qengine
+
+    model = QuantizeTrainModel(pretrained=False)
+    model.fused_module_inplace()
+    model.qconfig = torch.ao.quantization.get_default_qat_qconfig(qengine)
+    torch.ao.quantization.prepare_qat(model, inplace=True)
+    model.eval()
+
+    quantized_model = torch.ao.quantization.convert(model, inplace=False)
+    quantized_model.load_state_dict(torch.load(f"{weight_path}/quantized.pt", map_location="cpu"))
+    quantized_model.eval()
+    return TorchRunner(quantized_model, qengine)
@@ -0,0 +1,65 @@
+import argparse
+
+from backend.inference import AnomalyModel, BatchScheduler, DecisionEngine, FrameGate, InferenceServer
+from backend.inference.autotune import tuned_config
+from backend.inference.engines import engine_registry
+from backend.inference.roi import load_rois
+from backend.inference.scheduler import overflow_policies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the anomaly model to every printer of the farm")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8500)
+    parser.add_argument("--backend", default="onnx", choices=["auto"] + list(engine_registry),
+                        help="auto runs the engine with the best throughput on this host, see autotune.py")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads of the engine")
+    parser.add_argument("--input-size", type=int, default=352,
+                        help="Model input size, smaller is faster. Use it with a region of interest per printer")
+    parser.add_argument("--roi-file", default=None, help="Regions of interest, defaults to rois.json, see roi.py")
+    parser.add_argument("--max-batch-size", type=int, default=None,
+                        help="Run the model once this many frames are waiting, "
+                             "8 or the tuned batch size with --backend auto")
+    parser.add_argument("--max-wait-ms", type=float, default=20,
+                        help="Longest time the oldest frame waits for the batch to fill up")
+    parser.add_argument("--max-pending", type=int, default=2,
+                        help="Frames a single printer can have waiting")
+    parser.add_argument("--overflow", default="drop_oldest", choices=overflow_policies,
+                        help="What to do with a new frame when its printer has `--max-pending` waiting")
+    parser.add_argument("--max-per-printer", type=int, default=1,
+                        help="Frames of a single printer in one batch, 0 means no limit")
+    parser.add_argument("--window", type=int, default=8, help="Frames of each printer the alert votes over")
+    parser.add_argument("--votes", type=int, default=5, help="Anomalous frames of the window to raise an alert")
+    parser.add_argument("--cooldown", type=float, default=60, help="Seconds before a printer can alert again")
+    parser.add_argument("--gate-threshold", type=float, default=2.5,
+                        help="Reuse the last prediction of a printer while its scene changes less than this, "
+                             "0 disables")
+    parser.add_argument("--gate-max-age", type=float, default=30,
+                        help="Seconds after which a frame is inferred even if the scene did not change")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    # Load the weight once, every request shares the same model. Decoded
+    #  JPEGs are BGR and the preprocessing swaps the channels for free
+    if args.backend == "auto":
+        tuned = tuned_config("throughput")
+        args.backend = tuned["backend"]
+        args.threads = args.threads or tuned["num_threads"]
+        args.max_batch_size = args.max_batch_size or tuned["batch_size"]
+        print(f"Autotuned: {tuned}")
+    args.max_batch_size = args.max_batch_size or 8
+    model = AnomalyModel(args.backend, bgr=True, rois=load_rois(args.roi_file), input_size=args.input_size,
+                         num_threads=args.threads)
+    scheduler = BatchScheduler(
+        model, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+        max_pending_per_printer=args.max_pending, overflow=args.overflow,
+        max_per_printer=args.max_per_printer).start()
+    decision = DecisionEngine(window=args.window, votes=args.votes, cooldown=args.cooldown)
+    gate = FrameGate(threshold=args.gate_threshold, max_age=args.gate_max_age)
+    server = InferenceServer((args.host, args.port), scheduler, decision, gate, verbose=args.verbose)
+    print(f"Serving `{args.backend}` model on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        server.server_close()
@@ -3,24 +3,29 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QColor
 from PyQt5.QtWidgets import QGraphicsDropShadowEffect
 
+from backend.threads.tasks import run_task
+from machine_registry import MachineRegistry
 
-def check_in_db(machine_id, docs):
-    for data in docs:
-        if machine_id == data.to_dict()["id"]:
-            return True
+
+def check_in_db(machine_id, registry):
+    return registry.contains(machine_id.strip())
 
 
 class Login(QtWidgets.QDialog):
-    def __init__(self, firestore_client, parent=None):
+    def __init__(self, firestore_client=None, parent=None, registry=None):
         super(Login, self).__init__(parent)
 
-        self.firestore_check_machine = firestore_client.collection(u"machines")
+        # Machine ids are looked up in memory, the registry follows the collection. Without
+        #  a client the app connects to Firebase in the background and calls `set_registry`
+        if registry is None and firestore_client is not None:
+            registry = MachineRegistry(firestore_client.collection(u"machines")).start()
+        self.machine_registry = registry
 
         self.setStyleSheet(
             "background-color: white;"
         )
 
-        self.setFixedSize(350, 320)
+        self.setFixedSize(350, 345)
         self.page_name = QtWidgets.QLabel("Login🔑", self)
         self.page_name.setStyleSheet(
             "font-size: 40pt;"
@@ -146,6 +151,10 @@ class Login(QtWidgets.QDialog):
         )
         self.buttonLogin.clicked.connect(self.check_login)
 
+        # What the app is still loading in the background
+        self.progress_text = QtWidgets.QLabel("", self)
+        self.progress_text.setStyleSheet("color: gray; qproperty-alignment: AlignCenter;")
+
         layout = QtWidgets.QVBoxLayout(self)
         layout.addWidget(self.page_name)
         layout.addLayout(acc_h_layout)
@@ -153,6 +162,7 @@ class Login(QtWidgets.QDialog):
         layout.addLayout(machine_h_layout)
         layout.addSpacing(25)
         layout.addWidget(self.buttonLogin)
+        layout.addWidget(self.progress_text)
 
     def check_login(self):
         if self.acc_edit.text().strip() == "" or self.pwd_edit.text().strip() == "":
@@ -170,15 +180,39 @@ class Login(QtWidgets.QDialog):
             account = self.acc_edit.text()
             password = os.getenv(account)
 
-            if (password is not None) and (password == self.pwd_edit.text()) and \
-                    check_in_db(self.machine_edit.text(), self.firestore_check_machine.stream()):
-                self.get_id()
-                self.acc_edit.clear()
-                self.pwd_edit.clear()
-                self.machine_edit.clear()
-                self.accept()
-            else:
+            if self.machine_registry is None:
+                QtWidgets.QMessageBox.information(self, "Connecting", "Still connecting to the database, please retry")
+                return
+
+            if (password is None) or (password != self.pwd_edit.text()):
                 QtWidgets.QMessageBox.warning(self, "Error", 'Bad user or password')
+                return
+            # A registry still waiting for its first snapshot blocks for up to `load_timeout`,
+            #  it is asked on the task pool so the dialog does not freeze
+            self.buttonLogin.setEnabled(False)
+            run_task(check_in_db, self.machine_edit.text(), self.machine_registry, key=(id(self), "login"),
+                     on_result=self.machine_checked, on_error=self.machine_check_failed)
+
+    def machine_checked(self, registered):
+        self.buttonLogin.setEnabled(True)
+        if registered:
+            self.get_id()
+            self.acc_edit.clear()
+            self.pwd_edit.clear()
+            self.machine_edit.clear()
+            self.accept()
+        else:
+            QtWidgets.QMessageBox.warning(self, "Error", 'Bad user or password')
+
+    def machine_check_failed(self, error):
+        self.buttonLogin.setEnabled(True)
+        QtWidgets.QMessageBox.warning(self, "Error", f"Could not look up the machine id: {error}")
+
+    def set_registry(self, registry):
+        self.machine_registry = registry
+
+    def set_progress(self, text):
+        self.progress_text.setText(text)
 
     def acc_text_change(self, text):
         if text.strip() == "":
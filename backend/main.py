@@ -1,16 +1,30 @@
+import os
 import sys
 
-import firebase_admin
-import firebase_admin
-from PyQt5.QtCore import QCoreApplication
-from firebase_admin import firestore, credentials
+from dotenv import load_dotenv
+from PyQt5.QtCore import pyqtSignal
 
 from PyQt5 import QtWidgets
 
 from octoclient import OctoClient
+from machine_registry import MachineRegistry
+from backend.inference import InferenceClient
 from backend.login import Login
-from backend.tab_widgets import FileTab, StateTab, MonitorTab, MaterialTab
-from backend.threads import CheckConnection
+from backend.startup import Startup
+from backend.streaming import IngestManager
+from backend.tab_widgets import FileTab, StateTab, MonitorTab, MaterialTab, load_anomaly_model, load_material_model
+from backend.threads import CheckConnection, task_pool
+
+
+def init_firebase():
+    # firebase_admin takes a while to import, the login dialog is up by then
+    import firebase_admin
+    from firebase_admin import firestore, credentials
+
+    # Set up firestore authorization for monitor tab
+    cred = credentials.Certificate("service_account.json")
+    firebase_admin.initialize_app(cred)
+    return firestore.client()
 
 
 class VLine(QtWidgets.QFrame):
@@ -22,54 +36,142 @@ class VLine(QtWidgets.QFrame):
         self.setFrameShape(self.VLine | self.Sunken)
 
 
+class LazyTab(QtWidgets.QWidget):
+    """Placeholder of a tab, `build()` puts the widget of `factory(self)` in it the first
+    time the tab is shown"""
+    def __init__(self, factory):
+        super(LazyTab, self).__init__()
+        self.factory = factory
+        self.widget = None
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+    def build(self):
+        if self.widget is None:
+            self.widget = self.factory(self)
+            self.layout().addWidget(self.widget)
+        return self.widget
+
+
 class TabWidget(QtWidgets.QTabWidget):
-    def __init__(self, octo, firestore_client, parent=None):
+    def __init__(self, octo, startup, inference_client=None, push=None, ingest=None, parent=None):
         super(TabWidget, self).__init__(parent)
         self.octo = octo
-        self.firestore_client = firestore_client
-
-    def init_ui(self, machine_id):
-        self.state_tab = StateTab(self, self.octo)
-        self.file_tab = FileTab(self, self.octo)
-        self.monitor_tab = MonitorTab(self, self.octo, self.firestore_client, machine_id)
-        self.material_tab = MaterialTab(self)
+        self.startup = startup
+        self.inference_client = inference_client
+        self.push = push
+        self.ingest = ingest
+        self.machine_id = None
 
-        self.addTab(self.state_tab, "Status")
-        self.addTab(self.file_tab, "Files")
-        self.addTab(self.monitor_tab, "Monitor")
-        self.addTab(self.material_tab, "Material")
+        self.state_tab = None
+        self.file_tab = None
+        self.monitor_tab = None
+        self.material_tab = None
+        self.currentChanged.connect(self.build_tab)
 
-    def closeEvent(self, event):
+    def init_ui(self, machine_id):
+        self.machine_id = machine_id
+        # Only the shown tab is built, the others when they are first opened
+        self.addTab(LazyTab(self.build_state_tab), "Status")
+        self.addTab(LazyTab(self.build_file_tab), "Files")
+        self.addTab(LazyTab(self.build_monitor_tab), "Monitor")
+        self.addTab(LazyTab(self.build_material_tab), "Material")
+        self.build_tab(self.currentIndex())
+
+    def build_tab(self, index):
+        tab = self.widget(index)
+        if tab is not None:
+            tab.build()
+
+    def build_state_tab(self, parent):
+        # The printer state fetched while the login dialog was up is shown at once
+        self.state_tab = StateTab(parent, self.octo, self.push, snapshot=self.startup.result("status"))
+        return self.state_tab
+
+    def build_file_tab(self, parent):
+        self.file_tab = FileTab(parent, self.octo)
+        return self.file_tab
+
+    def build_monitor_tab(self, parent):
+        self.monitor_tab = MonitorTab(parent, self.octo, self.machine_id, inference_client=self.inference_client,
+                                      ingest=self.ingest)
+        # Alerting starts once Firebase is up, right away if it already is
+        self.startup.when_ready("firebase", self.monitor_tab.set_firestore, self.monitor_tab.firestore_failed)
+        if self.inference_client is None:
+            self.startup.when_ready("model", self.monitor_tab.set_model, self.monitor_tab.model_failed)
+        return self.monitor_tab
+
+    def build_material_tab(self, parent):
+        self.material_tab = MaterialTab(parent)
+        self.startup.when_ready("material", self.material_tab.set_model, self.material_tab.model_failed)
+        return self.material_tab
+
+    def stop_monitor(self):
+        if self.monitor_tab is None:
+            return
         if self.monitor_tab.thread_is_running:
             self.monitor_tab.video_thread_worker.quit()
             self.monitor_tab.predict_thread_worker.quit()
+        self.monitor_tab.close_alerts()
+
+    def closeEvent(self, event):
+        self.stop_monitor()
 
     def log_out(self):
-        if self.monitor_tab.thread_is_running:
-            self.monitor_tab.video_thread_worker.quit()
-            self.monitor_tab.predict_thread_worker.quit()
+        self.stop_monitor()
         self.close()
         if self.parent().login_window.exec_() == QtWidgets.QDialog.Accepted:
+            if self.monitor_tab is not None:
+                self.startup.when_ready("firebase", self.monitor_tab.set_firestore,
+                                        self.monitor_tab.firestore_failed)
             self.show()
 
 
 class MainWindow(QtWidgets.QMainWindow):
-    def __init__(self):
-        super(MainWindow, self).__init__()
+    # Connection state from the `PushSubscriber` thread
+    connection_pushed = pyqtSignal(str)
 
-        # Set up firestore authorization for monitor tab
-        cred = credentials.Certificate("service_account.json")
-        firebase_admin.initialize_app(cred)
-        firestore_client = firestore.client()
+    def __init__(self, octo=None, firebase=init_firebase):
+        super(MainWindow, self).__init__()
 
-        octo = OctoClient(use_cap=False)
-        self.login_window = Login(firestore_client, parent=self)
-        self.main_widget = TabWidget(octo, firestore_client, parent=self)
+        # Use the shared inference server if `inference_url` is set in `.env`
+        load_dotenv()
+        inference_url = os.getenv("inference_url")
+        inference_client = InferenceClient(inference_url) if inference_url else None
+
+        octo = octo or OctoClient(use_cap=False)
+
+        # Everything slow loads at once in the background while the user logs in
+        self.startup = Startup().add("firebase", firebase).add("status", octo.snapshot)
+        if inference_client is None:
+            self.startup.add("model", load_anomaly_model)
+        self.startup.add("material", load_material_model)
+        self.startup.progress.connect(self.show_progress)
+        self.startup.start()
+
+        push = None
+        if os.getenv("state_protocol", "push") == "push":
+            try:
+                push = octo.subscribe()
+            except ImportError:
+                # websocket-client is not installed, poll the REST API instead
+                pass
+        # Every camera connection of the app runs on `ingest_workers` threads
+        ingest = IngestManager(workers=int(os.getenv("ingest_workers", 1))).start()
+        self.login_window = Login(parent=self)
+        self.startup.when_ready("firebase", lambda firestore_client: self.login_window.set_registry(
+            MachineRegistry(firestore_client.collection(u"machines")).start()))
+        self.main_widget = TabWidget(octo, self.startup, inference_client, push, ingest, parent=self)
         self.machine_id = None
 
         self.connected = QtWidgets.QLabel()
         self.connected.setStyleSheet("border: none")
-        self.connected.setText("Connected 🟢" if octo.is_connected() else "Closed 🔴")
+        # `CheckConnection` asks in the background as soon as the window is up
+        self.connected.setText("Connecting 🟡")
+        self.connection_pushed.connect(self.connected.setText)
+        if push is not None:
+            push.add_listener(lambda snapshot: self.connection_pushed.emit(
+                "Connected 🟢" if snapshot["connection"]["current"]["state"] != "Closed" else "Closed 🔴"))
         self.log_out_button = QtWidgets.QPushButton("Log out")
         self.log_out_button.clicked.connect(self.main_widget.log_out)
         self.log_out_button.setStyleSheet(
@@ -89,27 +191,22 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.statusBar().setStyleSheet('border: 0; background-color: #FFF8DC;')
         self.statusBar().setStyleSheet("QStatusBar::item {border: none;}")
+        self.loading = QtWidgets.QLabel()
+        self.loading.setStyleSheet("border: none")
+        self.statusBar().addPermanentWidget(self.loading)
         self.statusBar().addPermanentWidget(VLine())
         self.statusBar().addPermanentWidget(self.connected)
         self.statusBar().addPermanentWidget(VLine())
         self.statusBar().addPermanentWidget(self.log_out_button)
 
         self.check_thread = True
+        self.show_progress()
         if self.login_window.exec_() == QtWidgets.QDialog.Accepted:
             self.machine_id = self.login_window.machine_id
-            windows = QtWidgets.QMessageBox()
-            windows.setIcon(QtWidgets.QMessageBox.Information)
-            windows.setText("Loading...")
-            windows.addButton(QtWidgets.QMessageBox.Ok)
-            windows.button(QtWidgets.QMessageBox.Ok).hide()
-            windows.show()
-            QtWidgets.QApplication.processEvents()
-
             self.main_widget.init_ui(self.machine_id)
             self.init_ui()
 
-            windows.done(0)
-            self.check_connected = CheckConnection(self, octo, self.connected)
+            self.check_connected = CheckConnection(self, octo, self.connected, push)
             self.check_connected.start()
         else:
             sys.exit(0)
@@ -118,8 +215,26 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setCentralWidget(self.main_widget)
         self.show()
 
+    def closeEvent(self, event):
+        # The tab widget is no window of its own, it gets no close event
+        self.main_widget.stop_monitor()
+        super(MainWindow, self).closeEvent(event)
+
+    def show_progress(self, *args):
+        pending = self.startup.pending()
+        text = []
+        if pending:
+            done = len(self.startup.steps) - len(pending)
+            text.append(f"Loading {', '.join(pending)} ({done}/{len(self.startup.steps)})")
+        if self.startup.errors:
+            text.append(f"{', '.join(self.startup.errors)} failed")
+        self.login_window.set_progress(", ".join(text))
+        self.loading.setText(", ".join(text))
+
 
 if __name__ == '__main__':
     app = QtWidgets.QApplication(sys.argv)
+    # Let running OctoPrint requests finish instead of aborting in the middle
+    app.aboutToQuit.connect(lambda: task_pool().waitForDone(3000))
     window = MainWindow()
     app.exec_()
@@ -0,0 +1,85 @@
+import time
+from collections import defaultdict
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from backend.threads.tasks import run_task
+
+
+class Startup(QObject):
+    """Run the slow start up steps (Firebase, model loads, the first printer state) at
+    the same time on the task pool while the login dialog is up.
+
+    `when_ready(name, callback, on_error)` calls back in the GUI thread with the result of
+    a step, right away if it is already done. `progress` is emitted after every step with
+    the name of the step, the finished and the total number of steps.
+    """
+    progress = pyqtSignal(str, int, int)
+
+    def __init__(self):
+        super(Startup, self).__init__()
+        self.steps = dict()
+        self.results = dict()
+        self.errors = dict()
+        # Seconds each step took and how long after `start()` it was done
+        self.durations = dict()
+        self.finished_at = dict()
+        self.waiting = defaultdict(list)
+        self.started = None
+
+    def add(self, name, function, *args, **kwargs):
+        self.steps[name] = (function, args, kwargs)
+        return self
+
+    def start(self):
+        self.started = time.monotonic()
+        for name, (function, args, kwargs) in self.steps.items():
+            run_task(self.timed, name, function, *args, **kwargs, key=(id(self), name),
+                     on_result=lambda result, name=name: self.finish(name, result),
+                     on_error=lambda error, name=name: self.fail(name, error))
+        return self
+
+    def timed(self, name, function, *args, **kwargs):
+        start = time.monotonic()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.durations[name] = time.monotonic() - start
+
+    def finish(self, name, result):
+        self.results[name] = result
+        self.done(name)
+
+    def fail(self, name, error):
+        print(f"Start up step {name} failed: {error}")
+        self.errors[name] = error
+        self.done(name)
+
+    def done(self, name):
+        self.finished_at[name] = time.monotonic() - self.started
+        for callback, on_error in self.waiting.pop(name, []):
+            self.call(name, callback, on_error)
+        self.progress.emit(name, len(self.results) + len(self.errors), len(self.steps))
+
+    def call(self, name, callback, on_error):
+        if name in self.results:
+            callback(self.results[name])
+        elif on_error is not None:
+            on_error(self.errors[name])
+
+    def when_ready(self, name, callback, on_error=None):
+        if name in self.results or name in self.errors:
+            self.call(name, callback, on_error)
+        else:
+            self.waiting[name].append((callback, on_error))
+
+    def result(self, name):
+        """The result of a finished step, None while it runs or if it failed"""
+        return self.results.get(name)
+
+    def pending(self):
+        return [name for name in self.steps if name not in self.results and name not in self.errors]
+
+    @property
+    def finished(self):
+        return not self.pending()
@@ -0,0 +1,2 @@
+from .ingest import CameraStream, IngestManager, StreamConfig, parse_streams, stream_configs
+from .slot import FrameSlot
@@ -0,0 +1,371 @@
+"""Receive the camera streams of many printers on a few threads.
+
+    camera_streams=printer-1@192.168.0.11:9999,printer-2@192.168.0.12
+
+Every stream is a non-blocking socket on the selector of one of `workers` threads, a
+frame is only copied into a reusable buffer when it arrives. Nothing is decoded there:
+`CameraStream.frame()` decodes the latest frame for whoever asks (display, inference)
+and each frame at most once, so frames nobody looks at only cost the receive.
+"""
+import os
+import selectors
+import socket
+import threading
+import time
+from collections import deque, namedtuple
+
+from frame_transport import (
+    Frame, FRAME_JPEG, FRAME_RAW, credit_struct, decode_frame, disable_nagle, frame_header, legacy_length_size,
+    legacy_request, split_encoding, stream_hello
+)
+
+default_camera_port = 9999
+
+StreamConfig = namedtuple("StreamConfig", ["name", "host", "port", "streaming"])
+
+
+def parse_streams(text, port=default_camera_port, streaming=True):
+    """Parse `name@host[:port],...` as in `camera_streams` of `.env`"""
+    configs = []
+    for entry in filter(None, (entry.strip() for entry in text.split(","))):
+        name, _, address = entry.rpartition("@")
+        host, _, entry_port = address.partition(":")
+        configs.append(StreamConfig(name or host, host, int(entry_port or port), streaming))
+    return configs
+
+
+def stream_configs():
+    """Camera streams of `.env`: `camera_streams`, `camera_port` and `video_protocol`"""
+    return parse_streams(
+        os.getenv("camera_streams", ""), int(os.getenv("camera_port", default_camera_port)),
+        os.getenv("video_protocol", "stream") != "legacy")
+
+
+class CameraStream:
+    """Latest frame of one camera connection and its statistics.
+
+    The payload is received into one of three buffers: the one being received, the latest
+    complete frame and the one a reader may still be decoding, so a reader never sees a
+    half written frame and the receiving thread never waits for a decode. `cropped` is True
+    while the sender sends frames it already cropped to the model geometry.
+    """
+    def __init__(self, config, credits=4, buffer_size=1 << 18, window=30):
+        self.config = config
+        self.name = config.name
+        self.credits = credits
+
+        self.condition = threading.Condition()
+        self.buffers = [bytearray(buffer_size) for _ in range(3)]
+        self.latest = None
+        self.borrowed = None
+        self.sequence = 0
+        self.decode_lock = threading.Lock()
+        self.decoded = (0, None, None)
+        self.cropped = False
+
+        self.connected = False
+        self.error = None
+        self.closed = False
+        self.socket = None
+        self.reset_receive()
+
+        self.received = 0
+        self.decodes = 0
+        self.corrupt = 0
+        self.reconnects = 0
+        self.arrivals = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+
+    # ================ Receiving side, only called by the worker thread ===================
+    def reset_receive(self):
+        self.header = bytearray(frame_header.size if self.config.streaming else legacy_length_size)
+        self.view = memoryview(self.header)
+        self.in_header = True
+        self.length = 0
+        self.frame_info = None
+        self.consumed = 0
+
+    def free_buffer(self, size):
+        with self.condition:
+            latest = None if self.latest is None else self.latest.payload.obj
+            index = next(index for index, buffer in enumerate(self.buffers)
+                         if buffer is not latest and buffer is not self.borrowed)
+        if len(self.buffers[index]) < size:
+            self.buffers[index] = bytearray(max(size, 2 * len(self.buffers[index])))
+        return self.buffers[index]
+
+    def on_connected(self):
+        disable_nagle(self.socket)
+        if self.config.streaming:
+            self.socket.sendall(stream_hello + credit_struct.pack(self.credits))
+        with self.condition:
+            self.connected = True
+            self.error = None
+
+    def on_readable(self):
+        """Read whatever arrived, raises once the connection is gone"""
+        received = self.socket.recv_into(self.view)
+        if received == 0:
+            raise ConnectionResetError("Connection is closed by the sender")
+        self.view = self.view[received:]
+        if len(self.view):
+            return
+
+        if self.in_header:
+            if self.config.streaming:
+                self.length, encoding, height, width, timestamp = frame_header.unpack(self.header)
+            else:
+                self.length, encoding, height, width, timestamp = int(self.header), FRAME_JPEG, 0, 0, None
+            self.frame_info = (*split_encoding(encoding), height, width, timestamp)
+            self.view = memoryview(self.free_buffer(self.length))[:self.length]
+            self.in_header = False
+            if self.length:
+                return
+        self.on_frame()
+
+    def on_frame(self):
+        now = time.time()
+        encoding, cropped, height, width, timestamp = self.frame_info
+        payload = self.view.obj
+        with self.condition:
+            self.latest = Frame(memoryview(payload)[:self.length], encoding, height, width,
+                                now if timestamp is None else timestamp, cropped)
+            self.cropped = cropped
+            self.sequence += 1
+            self.received += 1
+            self.arrivals.append(now)
+            if timestamp is not None:
+                self.latencies.append(now - timestamp)
+            self.condition.notify_all()
+
+        # Old frames are replaced anyway, ask for the next one right away
+        if self.config.streaming:
+            self.consumed += 1
+            if self.consumed >= max(1, self.credits // 2):
+                self.socket.sendall(credit_struct.pack(self.consumed))
+                self.consumed = 0
+        else:
+            self.socket.sendall(legacy_request)
+        self.view = memoryview(self.header)
+        self.in_header = True
+
+    def on_disconnected(self, error):
+        with self.condition:
+            self.connected = False
+            self.error = error
+            self.condition.notify_all()
+        self.reset_receive()
+
+    # ================ Reading side, any thread ===================
+    def frame(self, after=0, timeout=None):
+        """Return `(sequence, capture time, BGR image)` of the latest frame newer than
+        `after`, or None on timeout or close. The image is None if the frame does not
+        decode. The image is shared, copy it before drawing on it"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.sequence > after or self.closed, timeout):
+                return None
+            if self.closed:
+                return None
+
+        with self.decode_lock:
+            with self.condition:
+                sequence, frame = self.sequence, self.latest
+                if self.decoded[0] == sequence:
+                    return self.decoded
+                self.borrowed = frame.payload.obj
+            try:
+                image = decode_frame(frame)
+                if frame.encoding == FRAME_RAW:
+                    # A view of the receive buffer, which is reused two frames later
+                    image = image.copy()
+            finally:
+                with self.condition:
+                    self.borrowed = None
+            self.decodes += 1
+            if image is None:
+                self.corrupt += 1
+            self.decoded = (sequence, frame.timestamp, image)
+            return self.decoded
+
+    def stats(self):
+        with self.condition:
+            arrivals, latencies = list(self.arrivals), sorted(self.latencies)
+            return {
+                "connected": self.connected,
+                "error": None if self.error is None else str(self.error),
+                "received": self.received,
+                "decoded": self.decodes,
+                "corrupt": self.corrupt,
+                # Frames nobody asked for were never decoded
+                "skipped": self.received - self.decodes,
+                "reconnects": self.reconnects,
+                "cropped": self.cropped,
+                "fps": (len(arrivals) - 1) / (arrivals[-1] - arrivals[0]) if len(arrivals) > 1 and
+                arrivals[-1] > arrivals[0] else 0.,
+                "latency_ms": 1000 * latencies[len(latencies) // 2] if latencies else None
+            }
+
+
+class IngestWorker(threading.Thread):
+    """Selector loop over a share of the streams, reconnects dropped ones"""
+    def __init__(self, reconnect_delay=2., connect_timeout=5.):
+        super(IngestWorker, self).__init__(daemon=True)
+        self.reconnect_delay = reconnect_delay
+        self.connect_timeout = connect_timeout
+        self.selector = selectors.DefaultSelector()
+        # Other threads hand over work through a socket pair, the selector wakes up on it
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.wakeup_receiver.setblocking(False)
+        self.selector.register(self.wakeup_receiver, selectors.EVENT_READ)
+        self.lock = threading.Lock()
+        self.pending = []
+        # stream -> time to connect again, or the connect deadline while connecting
+        self.retry = dict()
+        self.streams = set()
+        self.running = True
+
+    def call(self, function, *args):
+        with self.lock:
+            self.pending.append((function, args))
+        self.wakeup_sender.send(b"\0")
+
+    def add(self, stream):
+        self.streams.add(stream)
+        self.connect(stream)
+
+    def remove(self, stream):
+        self.streams.discard(stream)
+        self.retry.pop(stream, None)
+        self.drop(stream, None)
+
+    def connect(self, stream):
+        stream.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        stream.socket.setblocking(False)
+        stream.socket.connect_ex((stream.config.host, stream.config.port))
+        self.selector.register(stream.socket, selectors.EVENT_WRITE, stream)
+        self.retry[stream] = time.monotonic() + self.connect_timeout
+
+    def drop(self, stream, error):
+        if stream.socket is not None:
+            try:
+                self.selector.unregister(stream.socket)
+            except (KeyError, ValueError):
+                pass
+            stream.socket.close()
+            stream.socket = None
+        stream.on_disconnected(error)
+        if stream in self.streams:
+            stream.reconnects += 1
+            self.retry[stream] = time.monotonic() + self.reconnect_delay
+
+    def handle(self, stream, events):
+        try:
+            if events & selectors.EVENT_WRITE:
+                error = stream.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error:
+                    raise ConnectionRefusedError(error, os.strerror(error))
+                self.retry.pop(stream, None)
+                self.selector.modify(stream.socket, selectors.EVENT_READ, stream)
+                stream.on_connected()
+            elif events & selectors.EVENT_READ:
+                stream.on_readable()
+        except (OSError, ValueError) as e:
+            self.drop(stream, e)
+
+    def check_retries(self):
+        now = time.monotonic()
+        for stream, when in list(self.retry.items()):
+            if when > now:
+                continue
+            if stream.socket is None:
+                self.connect(stream)
+            else:
+                self.drop(stream, socket.timeout("Timed out connecting to the camera"))
+
+    def run(self):
+        while self.running:
+            for key, events in self.selector.select(timeout=0.5):
+                if key.fileobj is self.wakeup_receiver:
+                    self.wakeup_receiver.recv(4096)
+                    with self.lock:
+                        pending, self.pending = self.pending, []
+                    for function, args in pending:
+                        function(*args)
+                else:
+                    self.handle(key.data, events)
+            self.check_retries()
+
+        for stream in list(self.streams):
+            self.remove(stream)
+        self.selector.close()
+
+    def stop(self):
+        self.running = False
+        self.wakeup_sender.send(b"\0")
+
+
+class IngestManager:
+    """Own every camera connection of this process on `workers` selector threads
+
+    `open()` returns the `CameraStream` of a camera, which keeps reconnecting until it
+    is closed. Streams are spread over the workers by count."""
+    def __init__(self, workers=1, reconnect_delay=2., credits=4):
+        self.workers = [IngestWorker(reconnect_delay) for _ in range(workers)]
+        self.credits = credits
+        self.lock = threading.Lock()
+        # name -> (stream, worker)
+        self.streams = dict()
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        return self
+
+    def open(self, name, host, port=default_camera_port, streaming=True):
+        """Return the stream of `name`, reconnects it if the address changed"""
+        config = StreamConfig(name, host, port, streaming)
+        stream = self.get(name)
+        if stream is not None:
+            if stream.config == config:
+                return stream
+            self.close(name)
+
+        with self.lock:
+            worker = min(self.workers, key=lambda worker: sum(
+                1 for _, stream_worker in self.streams.values() if stream_worker is worker))
+            stream = CameraStream(config, credits=self.credits)
+            self.streams[name] = (stream, worker)
+        worker.call(worker.add, stream)
+        return stream
+
+    def open_configured(self):
+        """Open every stream of `camera_streams` in `.env`"""
+        return [self.open(*config) for config in stream_configs()]
+
+    def get(self, name):
+        with self.lock:
+            entry = self.streams.get(name)
+        return None if entry is None else entry[0]
+
+    def close(self, name):
+        with self.lock:
+            stream, worker = self.streams.pop(name, (None, None))
+        if stream is None:
+            return
+        with stream.condition:
+            stream.closed = True
+            stream.condition.notify_all()
+        worker.call(worker.remove, stream)
+
+    def stats(self):
+        with self.lock:
+            streams = [stream for stream, _ in self.streams.values()]
+        return {stream.name: stream.stats() for stream in streams}
+
+    def stop(self):
+        with self.lock:
+            names = list(self.streams)
+        for name in names:
+            self.close(name)
+        for worker in self.workers:
+            worker.stop()
@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+
+
+class FrameSlot:
+    """The latest `size` frames in preallocated arrays, one writer and any number of readers
+
+    `put` copies a frame into the oldest array and then publishes it, readers copy the
+    latest one out with `latest`. Nothing is locked: every array has a generation that is
+    odd while it is written, a reader retries if it changed during its copy (a seqlock),
+    which only happens if the writer laps `size` frames during one copy. Memory stays at
+    `size` frames whatever the rates of the writer and the readers.
+    """
+    def __init__(self, size=2):
+        self.size = size
+        self.frames = None
+        self.timestamps = [0.] * size
+        self.generations = [0] * size
+        # (sequence, index) of the latest complete frame, replaced in one assignment
+        self.published = (0, None)
+        # Frames replaced by a newer one before any reader took them
+        self.read_sequence = 0
+        self.dropped = 0
+
+    def put(self, frame, timestamp=None):
+        """Copy `frame` into the slot, `timestamp` is its capture time (`time.time()`)"""
+        if self.frames is None or self.frames[0].shape != frame.shape or self.frames[0].dtype != frame.dtype:
+            # The first frame or the camera changed resolution
+            self.frames = [np.empty_like(frame) for _ in range(self.size)]
+            self.published = (self.published[0], None)
+
+        sequence, index = self.published
+        index = 0 if index is None else (index + 1) % self.size
+        self.generations[index] += 1
+        np.copyto(self.frames[index], frame)
+        self.timestamps[index] = time.time() if timestamp is None else timestamp
+        self.generations[index] += 1
+        if sequence > self.read_sequence:
+            self.dropped += 1
+        self.published = (sequence + 1, index)
+
+    def latest(self, out=None, after=0):
+        """Return `(sequence, timestamp, frame)` of the newest frame after `after` or None.
+        The frame is copied into `out` (allocated if None or of another shape)"""
+        while True:
+            sequence, index = self.published
+            if index is None or sequence <= after:
+                return None
+            frames = self.frames
+            generation = self.generations[index]
+            if generation % 2:
+                # Mid write, give the writer the GIL instead of spinning until its time slice ends
+                time.sleep(0)
+                continue
+            if out is None or out.shape != frames[index].shape or out.dtype != frames[index].dtype:
+                out = np.empty_like(frames[index])
+            np.copyto(out, frames[index])
+            timestamp = self.timestamps[index]
+            if self.generations[index] == generation and self.frames is frames:
+                self.read_sequence = max(self.read_sequence, sequence)
+                return sequence, timestamp, out
+            time.sleep(0)
+
+    def age(self):
+        """Seconds since the capture of the latest frame, None before the first one"""
+        sequence, index = self.published
+        return None if index is None else time.time() - self.timestamps[index]
+
+    def clear(self):
+        self.published = (self.published[0], None)
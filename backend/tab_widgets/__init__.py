@@ -1,4 +1,4 @@
 from .file_tab import FileTab
 from .state_tab import StateTab
-from .monitor_tab import MonitorTab
-from .material_tab import MaterialTab
+from .monitor_tab import MonitorTab, load_anomaly_model
+from .material_tab import MaterialTab, load_material_model
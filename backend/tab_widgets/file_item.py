@@ -3,6 +3,8 @@ import json.decoder
 from PyQt5 import QtWidgets
 from PyQt5.QtWidgets import QMessageBox
 
+from backend.threads import run_task
+
 
 class FileItem(QtWidgets.QWidget):
     def __init__(self, parent=None):
@@ -47,8 +49,17 @@ class FileItem(QtWidgets.QWidget):
         self.file_size.setText(file_size)
 
     def start_printing(self):
-        res = self.parent().parent().parent().oct_client.print_selected_file(self.file_name.text())
+        oct_client = self.parent().parent().parent().oct_client
+        self.print_button.setEnabled(False)
+        run_task(oct_client.print_selected_file, self.file_name.text(), on_result=self.printing_started,
+                 on_error=self.printing_failed)
+
+    def printing_failed(self, error):
+        self.print_button.setEnabled(True)
+        QMessageBox.critical(self, "Printing Status", error, QMessageBox.Ok)
 
+    def printing_started(self, res):
+        self.print_button.setEnabled(True)
         try:
             error = res.json()
             QMessageBox.critical(
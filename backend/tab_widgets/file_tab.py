@@ -6,6 +6,7 @@ from PyQt5.QtCore import QSize
 from PyQt5.QtWidgets import QMessageBox
 
 from backend.tab_widgets.file_item import FileItem
+from backend.threads import run_task
 
 
 class FileTab(QtWidgets.QWidget):
@@ -65,6 +66,7 @@ class FileTab(QtWidgets.QWidget):
                 }
             """
         )
+        self.file_info_list = {"files": []}
         self.load_file_list()
 
         side_h_box = QtWidgets.QHBoxLayout()
@@ -88,7 +90,20 @@ class FileTab(QtWidgets.QWidget):
         return f"{base}{size_name[level]}"
 
     def load_file_list(self):
-        self.file_info_list = self.oct_client.get_file_list()
+        self.reload_btn.setEnabled(False)
+        run_task(self.oct_client.get_file_list, on_result=self.show_file_list, on_error=self.show_load_error,
+                 key=(id(self), "files"))
+
+    def show_load_error(self, error):
+        # Not a dialog, it would pop up at every start while the Pi is offline
+        self.reload_btn.setEnabled(True)
+        self.list_view.clear()
+        self.list_view.addItem(f"Fail to load the files: {error}")
+
+    def show_file_list(self, file_info_list):
+        self.reload_btn.setEnabled(True)
+        self.file_info_list = file_info_list
+        self.list_view.clear()
 
         if len(self.file_info_list["files"]) > 0:
             for file_info in self.file_info_list["files"]:
@@ -128,14 +143,18 @@ class FileTab(QtWidgets.QWidget):
             self, "Open File", str(Path.home()), filter="Gcode (*.gcode)")
 
         if filename[0] != "":
-            res = self.oct_client.upload_file(filename[0]).json()
-
-            if res["done"]:
-                QMessageBox.information(
-                    self, "Upload Result", "success",
-                    QMessageBox.Ok)
-                self.reload_list()
-            else:
-                QMessageBox.critical(
-                    self, "Upload Result", "fail",
-                    QMessageBox.Ok)
+            self.upload_btn.setEnabled(False)
+            run_task(lambda: self.oct_client.upload_file(filename[0]).json(), on_result=self.uploaded,
+                     on_error=lambda error: self.uploaded({"done": False}))
+
+    def uploaded(self, res):
+        self.upload_btn.setEnabled(True)
+        if res.get("done"):
+            QMessageBox.information(
+                self, "Upload Result", "success",
+                QMessageBox.Ok)
+            self.reload_list()
+        else:
+            QMessageBox.critical(
+                self, "Upload Result", "fail",
+                QMessageBox.Ok)
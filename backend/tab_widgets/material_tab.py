@@ -1,8 +1,9 @@
 from pathlib import Path
 from PyQt5 import QtWidgets
-import joblib
 from PyQt5.QtGui import QDoubleValidator
 
+from backend.forest import load_forest
+
 weight_path = f"{Path(__file__).parent.parent.parent}/weights"
 
 infill_pattern_dict = {
@@ -20,10 +21,20 @@ def not_empty(text):
     return text.strip() != ""
 
 
+def load_material_model():
+    """The forest compiled by `python -m backend.forest`, the pickle if it was not compiled"""
+    if Path(f"{weight_path}/material_forest").is_dir():
+        return load_forest(f"{weight_path}/material_forest")
+    # joblib (and the scikit-learn it unpickles) is only imported for the pickle
+    import joblib
+    return joblib.load(f"{weight_path}/material_cls")
+
+
 class MaterialTab(QtWidgets.QWidget):
-    def __init__(self, parent):
+    def __init__(self, parent, model=None):
         super(MaterialTab, self).__init__(parent)
-        self.model = joblib.load(f"{weight_path}/material_cls")
+        # Without a model the inputs wait for `set_model`, the forest loads in the background
+        self.model = model
         common_frame_style = """
             QFrame {
                 background-color: white;
@@ -150,8 +161,16 @@ class MaterialTab(QtWidgets.QWidget):
             v_layout.addWidget(arg)
         return v_layout
 
+    def set_model(self, model):
+        self.model = model
+        self.predict_outcome()
+
+    def model_failed(self, error):
+        for label in (self.roughness_predict, self.tension_predict, self.elongation_predict):
+            label.setText("Model not loaded")
+
     def predict_outcome(self):
-        if self.check_all_filled():
+        if self.model is not None and self.check_all_filled():
             get_features = self.obtain_features_from_val()
             predict = self.model.predict(get_features)
             self.roughness_predict.setText(f"{predict[0][0]:.3f}")
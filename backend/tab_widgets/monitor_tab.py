@@ -1,21 +1,18 @@
+import os
 import time
-from pathlib import Path
-import queue
+from collections import deque
 
-import cv2
-import torch.nn
 from PyQt5 import QtWidgets
-from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtGui import QPixmap
 from PyQt5.QtCore import Qt
 
 import numpy as np
-from torchvision import transforms
-import onnxruntime as ort
-import timm
 
-from backend.threads import VideoWorkerThread, PredictThread
-
-weight_path = f"{Path(__file__).parent.parent.parent}/weights"
+from backend.alerts import AnomalyPublisher
+from backend.inference import AnomalyModel, DecisionEngine, FrameGate
+from backend.inference.roi import load_rois
+from backend.streaming import FrameSlot, IngestManager, stream_configs
+from backend.threads import VideoWorkerThread, PredictThread, is_running, run_task
 
 index_to_cls = [
     "<font color='green'>No defected</font>",
@@ -23,53 +20,67 @@ index_to_cls = [
 ]
 
 
-def reload_weight(weight_path):
-    weight = torch.load(weight_path, map_location="cpu")
-    new_weight = dict()
-    for key, val in weight.items():
-        new_weight[key.replace("model.", "")] = val
-    return new_weight
+def load_anomaly_model(backend=None):
+    """The model of the monitor tab when there is no inference server. Set
+    `inference_backend` in `.env` to pick the engine"""
+    # The region of interest of each printer (`roi.py`) is resized to `inference_input_size`
+    # Frames come straight from the decoder in BGR order
+    return AnomalyModel(backend or os.getenv("inference_backend", "onnx"), bgr=True, rois=load_rois(),
+                        input_size=int(os.getenv("inference_input_size", 352)))
 
 
 class MonitorTab(QtWidgets.QWidget):
-    def __init__(self, parent, client, firestore_client, machine_id, use_onnx=True):
+    def __init__(self, parent, client, machine_id, firestore_client=None, model=None, inference_client=None,
+                 ingest=None):
         super(MonitorTab, self).__init__(parent)
 
         self.client = client
-        self.firestore_client = firestore_client
+        self.firestore_client = None
         self.machine_id = machine_id
-        self.use_onnx = use_onnx
-        self.img_queue = queue.Queue(maxsize=200)
+        # A single blurry frame should not page the operator, only debounced
+        #  normal <-> anomaly transitions are written to Firestore. Without a Firestore
+        #  client (Firebase failed or is still starting) frames are classified but not alerted
+        self.decision = DecisionEngine()
+        self.alerts = None
+        if firestore_client is not None:
+            self.set_firestore(firestore_client)
+        # Only the latest shown frames are kept, predictions always take the newest one.
+        #  Frames older than `max_frame_age` seconds (a stalled camera) are not classified
+        self.frames = FrameSlot(size=2)
+        self.predict_frame = None
+        self.predicted_sequence = 0
+        self.max_frame_age = float(os.getenv("max_frame_age", 5))
+        self.frame_ages = deque(maxlen=60)
+        # Classification and the job state request run on the thread pool, the job state
+        #  is asked every `job_poll_interval` seconds instead of on every prediction
+        self.predict_key = (id(self), "predict")
+        self.job_poll_interval = 5
+        self.job_polled = -self.job_poll_interval
+        self.printing = False
+        # The camera connection is owned by the ingest manager of the app
+        self.ingest = ingest
+        self.camera = {config.name: config for config in stream_configs()}.get(machine_id)
 
         # ================ Model ===================
-        self.transform = transforms.Compose([
-            # transforms.Lambda(lambda x: cv2.cvtColor(x, cv2.COLOR_RGB2BGR)),
-            transforms.ToTensor(),
-            transforms.Resize((400, 400)),
-            transforms.CenterCrop((352, 352)),
-            transforms.Normalize(
-                mean=[0.485, 0.456, 0.406],
-                std=[0.229, 0.224, 0.225]),
-            transforms.Lambda(lambda x: x.unsqueeze(0)) \
-                if not self.use_onnx else transforms.Lambda(lambda x: x.unsqueeze(0).numpy())
-        ])
-
-        if use_onnx:
-            self.model = ort.InferenceSession(f"{weight_path}/resnet.onnx")
-        else:
-            self.model = timm.create_model("resnet34", pretrained=False)
-            self.model.fc = torch.nn.Linear(
-                self.model.fc.weight.shape[1], 2)
-            self.model.load_state_dict(reload_weight(f"{weight_path}/resnet.pt"))
-            self.model.eval()
+        # Frames are sent to the inference server if there is one, otherwise to the model
+        #  of `load_anomaly_model`. It loads in the background, frames are not classified
+        #  until `set_model` is called
+        self.inference_client = inference_client
+        self.model = model
+        self.model_error = None
+        # Static scenes (heating, pauses, slow layers) reuse the last prediction
+        self.gate = FrameGate()
 
         self.video_display_label = QtWidgets.QLabel()
         self.video_display_label.setFixedSize(500, 500)
+        self.video_display_label.setAlignment(Qt.AlignCenter)
 
-        # Set up line edit validator for input ip-address
+        # Address of the camera sender, an IP address or a host name like `printer.local`
         self.ip_address = QtWidgets.QLineEdit()
-        self.ip_address.setPlaceholderText("IP Address")
-        self.ip_address.setInputMask("000.000.000.000")
+        self.ip_address.setPlaceholderText("IP address or host name")
+        if self.camera is not None:
+            # `camera_streams` of `.env` has the address of this printer
+            self.ip_address.setText(self.camera.host)
 
         self.start_button = QtWidgets.QPushButton("Start Monitor")
         self.start_button.clicked.connect(self.start_video)
@@ -114,6 +125,7 @@ class MonitorTab(QtWidgets.QWidget):
             }
         """)
         self.predict_text = QtWidgets.QLabel("-")
+        self.frame_age_text = QtWidgets.QLabel("Frame age: -")
 
         side_panel_v_box = QtWidgets.QVBoxLayout()
         side_panel_v_box.setAlignment(Qt.AlignTop)
@@ -122,6 +134,7 @@ class MonitorTab(QtWidgets.QWidget):
         side_panel_v_box.addWidget(self.stop_button)
         side_panel_v_box.addWidget(self.predict_label)
         side_panel_v_box.addWidget(self.predict_text)
+        side_panel_v_box.addWidget(self.frame_age_text)
 
         side_panel_frame = QtWidgets.QFrame()
         side_panel_frame.setMinimumWidth(150)
@@ -150,11 +163,21 @@ class MonitorTab(QtWidgets.QWidget):
         self.start_button.setEnabled(False)
         self.start_button.repaint()
 
-        video_file = self.ip_address.text()
-        self.video_thread_worker = VideoWorkerThread(self, video_file)
+        if self.ingest is None:
+            self.ingest = IngestManager().start()
+        # Set `camera_port` and `video_protocol=legacy` in `.env` for senders that still wait for b"get"
+        port = self.camera.port if self.camera is not None else int(os.getenv("camera_port", 9999))
+        streaming = os.getenv("video_protocol", "stream") != "legacy"
+        self.stream = self.ingest.open(self.machine_id, self.ip_address.text().strip(), port, streaming)
+        # Render at the label size and no faster than the screen refreshes
+        refresh_rate = QtWidgets.QApplication.primaryScreen().refreshRate() or 60
+        label_size = (self.video_display_label.width(), self.video_display_label.height())
+        self.video_thread_worker = VideoWorkerThread(
+            self, self.stream, self.frames, target_size=label_size, max_fps=refresh_rate)
         self.predict_thread_worker = PredictThread(self)
 
-        self.video_thread_worker.frame_data_updated.connect(self.update_video_frames)
+        self.video_thread_worker.image_ready.connect(self.update_video_frames)
+        self.video_thread_worker.failed.connect(self.stream_failed)
         self.video_thread_worker.start()
         self.predict_thread_worker.trigger.connect(self.predict_img)
         self.predict_thread_worker.start()
@@ -162,57 +185,112 @@ class MonitorTab(QtWidgets.QWidget):
     def stop_current_video(self):
         if self.thread_is_running:
             self.thread_is_running = False
+            self.ingest.close(self.machine_id)
             self.video_thread_worker.stop_thread()
             self.predict_thread_worker.stop_thread()
 
             self.video_display_label.clear()
             self.start_button.setEnabled(True)
 
-            self.img_queue.queue.clear()
+            self.frames.clear()
             self.predict_text.setText("-")
+            self.frame_age_text.setText("Frame age: -")
+
+    def stream_failed(self, error):
+        self.stop_current_video()
+        self.video_display_label.setText(error)
+
+    def latest_frame(self):
+        """The newest frame not classified yet, None if there is none or it is too old"""
+        latest = self.frames.latest(self.predict_frame, after=self.predicted_sequence)
+        if latest is None:
+            return None
+        self.predicted_sequence, captured, self.predict_frame = latest
+        age = time.time() - captured
+        self.frame_ages.append(age)
+        self.frame_age_text.setText(f"Frame age: {age:.2f} s")
+        return self.predict_frame if age <= self.max_frame_age else None
+
+    def frame_age_stats(self):
+        """Capture to inference age of the last predictions in seconds"""
+        ages = sorted(self.frame_ages)
+        if not ages:
+            return None
+        return {"p50": ages[len(ages) // 2], "max": ages[-1], "dropped": self.frames.dropped}
+
+    def set_firestore(self, firestore_client):
+        self.close_alerts()
+        self.firestore_client = firestore_client
+        self.alerts = AnomalyPublisher(firestore_client.collection(u"anomaly"), self.machine_id)
 
-    @torch.no_grad()
-    def predict_img(self):
-        try:
-            frame = self.img_queue.get_nowait()
-        except queue.Empty:
-            frame = None
-
-        if (frame is not None) and \
-                ("printing" in self.client.get_printed_progress()["job_state"].lower()):
-            # Predict the image
-            if self.use_onnx:
-                outputs = self.model.run(None, {"input": self.transform(frame)})
-                self.predict_text.setText(index_to_cls[int(outputs[0][0][1] > outputs[0][0][0])])
-                anomaly = int(outputs[0][0][1] > outputs[0][0][0])
-            else:
-                outputs = self.model(self.transform(frame))
-                self.predict_text.setText(index_to_cls[outputs.argmax(dim=-1).item()])
-                anomaly = bool(outputs.argmax(dim=-1).item())
-            if anomaly:
-                self.firestore_client.collection(u"anomaly").document(self.machine_id).set({"error": True})
-        else:
-            self.predict_text.setText("-")
+    def close_alerts(self):
+        """Stop the publisher thread on log out or close, `set_firestore` starts a new one"""
+        alerts, self.alerts = self.alerts, None
+        if alerts is not None:
+            # The last transition gets its write, a hanging Firestore does not hold up the GUI
+            alerts.close(timeout=2)
 
-        time.sleep(0.1)
+    def firestore_failed(self, error):
+        print(f"Anomalies of {self.machine_id} are not alerted, Firebase failed: {error}")
 
-    def update_video_frames(self, video_frame):
-        height, width, channels = video_frame.shape
-        bytes_per_line = width * channels
+    def set_model(self, model):
+        self.model = model
 
-        try:
-            self.img_queue.put_nowait(video_frame)
-        except queue.Full:
-            self.img_queue.get_nowait()
-            self.img_queue.put_nowait(video_frame)
+    def model_failed(self, error):
+        self.model_error = f"Model not loaded: {error}"
 
-        converted_Qt_image = QImage(
-            video_frame, width, height, bytes_per_line, QImage.Format_RGB888)
+    def predict_img(self):
+        self.poll_job_state()
+        if self.inference_client is None and self.model is None:
+            self.predict_text.setText(self.model_error or "Loading model...")
+            return
+        if is_running(self.predict_key):
+            # The previous frame is still being classified, it owns `predict_frame`
+            return
+        frame = self.latest_frame()
+        if frame is not None and self.printing:
+            run_task(self.classify, frame, on_result=self.show_prediction, on_error=self.prediction_failed,
+                     key=self.predict_key)
+        else:
+            self.predict_text.setText("-")
 
-        self.video_display_label.setPixmap(
-            QPixmap.fromImage(converted_Qt_image).scaled(
-                self.video_display_label.width(), self.video_display_label.height())
-        )
+    def poll_job_state(self):
+        if time.monotonic() - self.job_polled < self.job_poll_interval:
+            return
+        self.job_polled = time.monotonic()
+        run_task(self.client.get_printed_progress, on_result=self.set_job_state, key=(id(self), "job"))
+
+    def set_job_state(self, progress):
+        self.printing = "printing" in progress["job_state"].lower()
+
+    def classify(self, frame):
+        """Runs on the thread pool, returns 1 if the frame looks defective"""
+        logits = self.gate.predict(self.machine_id, frame, self.infer)
+        change = self.decision.update(self.machine_id, logits)
+        alerts = self.alerts
+        if change is not None and alerts is not None:
+            alerts.publish(change)
+        return int(logits[1] > logits[0])
+
+    def show_prediction(self, anomaly):
+        if self.thread_is_running:
+            self.predict_text.setText(index_to_cls[anomaly])
+
+    def prediction_failed(self, error):
+        self.predict_text.setText("-")
+
+    def infer(self, frame):
+        # Frames `send_image.py` already cropped are not cropped a second time
+        cropped = self.stream.cropped
+        if self.inference_client is not None:
+            return self.inference_client.predict(frame, self.machine_id, bgr=True, cropped=cropped)
+        self.model.set_precropped(self.machine_id, cropped)
+        return self.model.predict(frame, self.machine_id)
+
+    def update_video_frames(self, image):
+        # Already rendered at the label size by `VideoWorkerThread`
+        self.video_display_label.setPixmap(QPixmap.fromImage(image))
+        self.video_thread_worker.shown()
 
     @staticmethod
     def pix_to_array(pixmap):
@@ -1,13 +1,19 @@
 from PyQt5 import QtWidgets
+from PyQt5.QtCore import pyqtSignal
 
-from backend.threads import UpdateStatus
+from octoclient import current_user, is_heating, printed_progress
+from backend.threads import UpdateStatus, run_task
 
 
 class StateTab(QtWidgets.QWidget):
-    def __init__(self, parent, octo):
+    # Snapshots from the `PushSubscriber` thread, rendered in the GUI thread
+    state_pushed = pyqtSignal(dict)
+
+    def __init__(self, parent, octo, push=None, snapshot=None):
         super(StateTab, self).__init__(parent)
 
         self.octo = octo
+        self.push = push
         common_label_style_sheet = """
             QLabel {
                 margin: 0;
@@ -156,47 +162,55 @@ class StateTab(QtWidgets.QWidget):
         main_v_box.addWidget(speed_frame, 2)
 
         self.setLayout(main_v_box)
+        if snapshot is not None:
+            # Fetched while the login dialog was up, shown until the fresh one arrives
+            self.render(snapshot)
         self.reset_state()
 
+        self.state_pushed.connect(self.render)
+        if self.push is not None:
+            self.push.add_listener(self.state_pushed.emit)
+
+        # Only polls while the push socket is down
         self.check_thread = True
-        self.update_status = UpdateStatus(self)
+        self.update_status = UpdateStatus(self, self.push)
         self.update_status.start()
 
-    def set_connected_state(self):
+    def set_connected_state(self, connect_state):
         self.connected_state.setText(
-            "Connected 🟢" if self.octo.is_connected() else "Closed 🔴")
+            "Connected 🟢" if connect_state["current"]["state"] != "Closed" else "Closed 🔴")
 
-    def set_job_state(self):
-        job_state = self.octo.get_printed_progress()
+    def set_job_state(self, job, printer):
+        temperature = printer.get("temperature", {})
+        job_state = printed_progress(job, temperature)
 
-        if self.octo.check_bed_heated():
+        if "bed" in temperature and is_heating(temperature["bed"]):
             self.job_state.setText("Board heated")
             self.job_progress.setValue(0)
             self.job_progress_text.setText("not printed")
-        elif self.octo.check_tool_heated():
+        elif "tool0" in temperature and is_heating(temperature["tool0"]):
             self.job_state.setText("Tool heated")
             self.job_progress.setValue(0)
             self.job_progress_text.setText("not printed")
         elif "completion" in job_state:
             self.job_state.setText(job_state["job_state"])
-            self.job_progress.setValue(job_state['completion'])
+            self.job_progress.setValue(int(job_state['completion']))
             self.job_progress_text.setText(f"{job_state['completion']:.2f}%")
         else:
             self.job_progress.setValue(0)
             self.job_state.setText(job_state["job_state"])
             self.job_progress_text.setText("not printed")
 
-    def set_temp_state(self):
+    def set_temp_state(self, temp_state):
         try:
-            temp_state = self.octo.get_all_temperature()
             self.tool_temp.setText(f"{temp_state['temperature']['tool0']['actual']}°C")
             self.bed_temp.setText(f"{temp_state['temperature']['bed']['actual']}°C")
         except KeyError:
             self.tool_temp.setText("NaN")
             self.bed_temp.setText("NaN")
 
-    def set_speed_state(self):
-        speed_state = self.octo.get_printer_profile()["axes"]
+    def set_speed_state(self, profile):
+        speed_state = profile["axes"]
         annotations = ["x", "y", "z", "e"]
         targets = [self.x_speed, self.y_speed, self.z_speed, self.e_speed]
 
@@ -204,14 +218,21 @@ class StateTab(QtWidgets.QWidget):
             speed_info = speed_state[anno]
             target.setText(f"Speed: {speed_info['speed']} Inverted: {speed_info['inverted']}")
 
-    def set_user(self):
-        user_profile = self.octo.get_current_user()
+    def set_user(self, user_profile):
+        user_profile = current_user(user_profile)
         self.user_role_text.setText(user_profile['role'])
         self.user_name_text.setText(user_profile["name"])
 
+    def render(self, snapshot):
+        self.set_connected_state(snapshot["connection"])
+        self.set_job_state(snapshot["job"], snapshot["printer"])
+        self.set_temp_state(snapshot["printer"])
+        self.set_speed_state(snapshot["profile"])
+        self.set_user(snapshot["user"])
+
     def reset_state(self):
-        self.set_connected_state()
-        self.set_job_state()
-        self.set_temp_state()
-        self.set_speed_state()
-        self.set_user()
+        # Every request goes out at once in the background, see `OctoClient.snapshot`
+        run_task(self.octo.snapshot, on_result=self.render, on_error=self.render_offline, key=(id(self), "state"))
+
+    def render_offline(self, error):
+        self.connected_state.setText("Closed 🔴")
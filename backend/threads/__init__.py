@@ -1,3 +1,4 @@
+from .tasks import Task, is_running, run_task, task_pool
 from .update_connected import CheckConnection, UpdateStatus
 from .video_thread import VideoWorkerThread
 from .predict_thread import PredictThread
@@ -0,0 +1,75 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class TaskSignals(QObject):
+    # A `QRunnable` is no `QObject`, it reports back through this one
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class Task(QRunnable):
+    """Run `function(*args, **kwargs)` on the thread pool, the result or the error comes
+    back through `signals` in the thread that started it"""
+    def __init__(self, function, *args, **kwargs):
+        super(Task, self).__init__()
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = TaskSignals()
+        # Kept alive by `running_tasks` until its signals are delivered
+        self.setAutoDelete(False)
+
+    def run(self):
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as e:
+            signal, value = self.signals.failed, str(e) or type(e).__name__
+        else:
+            signal, value = self.signals.finished, result
+        try:
+            signal.emit(value)
+        except RuntimeError:
+            # The app closed while the task was running
+            pass
+
+
+def task_pool(max_threads=8):
+    """The pool of `run_task`. Not `QThreadPool.globalInstance()`: Qt converts images on
+    that one and waits for it holding the GIL, which deadlocks with a Python task waiting
+    for the GIL on a busy global pool (a single thread on a single core host)"""
+    global tasks_pool
+    if tasks_pool is None:
+        tasks_pool = QThreadPool()
+        # Mostly HTTP requests waiting on the printer, not CPU work
+        tasks_pool.setMaxThreadCount(max_threads)
+    return tasks_pool
+
+
+tasks_pool = None
+# key (the task itself without one) -> task still running. A keyed task is not started
+#  twice, so a slow printer does not stack up the same request
+running_tasks = dict()
+
+
+def run_task(function, *args, on_result=None, on_error=None, key=None, pool=None, **kwargs):
+    """Run `function` in the background and call `on_result(result)` or `on_error(message)`
+    in the GUI thread. Call it from the GUI thread. With a `key` nothing is started while
+    the previous task of the same key is running, None is returned then"""
+    if key in running_tasks:
+        return None
+
+    task = Task(function, *args, **kwargs)
+    if on_result is not None:
+        task.signals.finished.connect(on_result)
+    if on_error is not None:
+        task.signals.failed.connect(on_error)
+    key = task if key is None else key
+    running_tasks[key] = task
+    task.signals.finished.connect(lambda _: running_tasks.pop(key, None))
+    task.signals.failed.connect(lambda _: running_tasks.pop(key, None))
+    (pool or task_pool()).start(task)
+    return task
+
+
+def is_running(key):
+    return key in running_tasks
@@ -1,37 +1,55 @@
-import time
+from PyQt5.QtCore import QObject, QTimer
 
-from PyQt5 import QtWidgets
-from PyQt5.QtCore import QThread
+from backend.threads.tasks import run_task
 
 
-class CheckConnection(QThread):
-    def __init__(self, parent, client, connected_state_text=None):
-        super().__init__()
-        self.parent = parent
-        self.client = client
-        self.connected_state_text = connected_state_text
+def is_pushed(push):
+    """True while a `PushSubscriber` keeps the state up to date, no need to poll"""
+    return push is not None and push.connected
 
-    def run(self):
-        while self.parent.check_thread:
-            self.connected_state_text.setText(
-                "Connected 🟢" if self.client.is_connected() else "Closed 🔴")
-            time.sleep(5)
+
+class PollTimer(QObject):
+    """Call `poll()` in the GUI thread every `interval` seconds while `parent.check_thread`
+    is set and no push socket keeps the state up to date. `poll` hands the HTTP request to
+    `run_task`"""
+    def __init__(self, parent, poll, push=None, interval=5):
+        super(PollTimer, self).__init__()
+        self.parent = parent
+        self.poll = poll
+        self.push = push
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(interval * 1000))
+        self.timer.timeout.connect(self.tick)
+
+    def start(self):
+        self.tick()
+        self.timer.start()
+
+    def tick(self):
+        if not self.parent.check_thread:
+            self.timer.stop()
+        elif not is_pushed(self.push):
+            self.poll()
 
     def stop_thread(self):
-        self.wait()
-        QtWidgets.QApplication.processEvents()
+        self.timer.stop()
 
 
-class UpdateStatus(QThread):
-    def __init__(self, parent):
-        super().__init__()
-        self.parent = parent
+class CheckConnection(PollTimer):
+    def __init__(self, parent, client, connected_state_text=None, push=None):
+        super(CheckConnection, self).__init__(parent, self.check, push)
+        self.client = client
+        self.connected_state_text = connected_state_text
 
-    def run(self):
-        while self.parent.check_thread:
-            self.parent.reset_state()
-            time.sleep(5)
+    def check(self):
+        # A Pi that does not answer counts as closed
+        run_task(self.client.is_connected, on_result=self.show, on_error=lambda _: self.show(False),
+                 key=(id(self), "connection"))
 
-    def stop_thread(self):
-        self.wait()
-        QtWidgets.QApplication.processEvents()
+    def show(self, connected):
+        self.connected_state_text.setText("Connected 🟢" if connected else "Closed 🔴")
+
+
+class UpdateStatus(PollTimer):
+    def __init__(self, parent, push=None):
+        super(UpdateStatus, self).__init__(parent, parent.reset_state, push)
@@ -1,75 +1,82 @@
 import time
 
-import cv2
-import numpy as np
-import imutils
-import socket
 from PyQt5 import QtWidgets
 from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtGui import QImage
+
+
+def render_frame(frame, size, text=None):
+    """Return a `QImage` of a BGR frame fit into `size` (width, height) with one resize,
+    keeping the aspect ratio"""
+    import cv2
+
+    height, width = frame.shape[:2]
+    scale = min(size[0] / width, size[1] / height)
+    fitted = (max(1, round(width * scale)), max(1, round(height * scale)))
+    # INTER_AREA is ten times slower at non integer ratios, bilinear is plenty for a preview
+    image = cv2.resize(frame, fitted, interpolation=cv2.INTER_LINEAR)
+    if text is not None:
+        cv2.putText(image, text, (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+    # Qt does the BGR order itself, the copy makes the image own its pixels across threads
+    return QImage(image.data, fitted[0], fitted[1], image.strides[0], QImage.Format_BGR888).copy()
 
 
 class VideoWorkerThread(QThread):
-    frame_data_updated = pyqtSignal(np.ndarray)
+    """Render the latest frame of a `CameraStream` for the monitor view
 
-    def __init__(self, parent, video_file=None):
+    At most `max_fps` (the display refresh rate) frames per second are decoded, frames
+    that arrive in between never are. Every decoded frame goes into `slot` (a
+    `FrameSlot`, BGR, full size, no overlay) and is rendered to `target_size` off the GUI
+    thread. A new image is only sent once the GUI has shown the previous one (`shown()`),
+    so a fast camera drops frames here instead of piling up in the Qt event queue.
+    A frame that does not decode is counted in `corrupt` and skipped, only a closed
+    connection or no frame for `timeout` seconds stops the worker with `failed`."""
+    image_ready = pyqtSignal(QImage)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent, stream, slot=None, target_size=(500, 500), max_fps=60, timeout=5):
         super().__init__()
         self.parent = parent
-        self.video_file = video_file
+        self.stream = stream
+        self.slot = slot
+        self.target_size = target_size
+        self.interval = 1 / max_fps
+        self.timeout = timeout
+        self.in_flight = False
+        self.rendered = 0
+        self.dropped = 0
+        self.corrupt = 0
 
     def run(self):
-        try:
-            self.capture = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.capture.connect((self.video_file, 9999))
-            self.capture.settimeout(5)
-        except Exception as e:
-            self.parent.thread_is_running = False
-            self.parent.start_button.setEnabled(True)
-            self.parent.video_display_label.setText(str(e))
-            self.capture.close()
-            return
-
-        fps, start_time, record_fps_frames, count_frame = 0, 0, 20, 0
+        sequence, last_shown = 0, 0.
         while self.parent.thread_is_running:
-            # Read frames from the camera
-            try:
-                length = self.recv_all(self.capture, 16)
-                img_string = self.recv_all(self.capture, int(length))
-                frame = np.fromstring(img_string, dtype="uint8")
-                frame = cv2.imdecode(frame, 1)
-            except (socket.timeout, BlockingIOError, ConnectionResetError, TypeError) as e:
-                self.parent.start_button.setEnabled(True)
-                self.parent.video_display_label.setText("Connection is closed or crashed."
-                                                        " Please check the server status")
-                self.parent.predict_text.setText("-")
-                self.parent.thread_is_running = False
+            time.sleep(max(0., last_shown + self.interval - time.monotonic()))
+            latest = self.stream.frame(after=sequence, timeout=self.timeout)
+            if latest is None:
+                if self.parent.thread_is_running:
+                    self.failed.emit(self.stream.stats()["error"] or
+                                     f"No frame for {self.timeout} s, the connection is closed or the camera "
+                                     f"stalled. Please check the server status")
                 break
+            last_shown = time.monotonic()
+            sequence, captured, frame = latest
+            if frame is None:
+                # A truncated or garbled JPEG, the next frame is fine again
+                self.corrupt += 1
+                continue
+            if self.slot is not None:
+                self.slot.put(frame, captured)
 
-            frame = imutils.resize(frame, width=640)
-
-            frame = cv2.putText(frame, f"FPS: {fps}", (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            if count_frame == record_fps_frames:
-                fps = round(record_fps_frames / (time.time() - start_time))
-                start_time = time.time()
-                count_frame = 0
-            count_frame += 1
-
-            self.frame_data_updated.emit(frame)
-            self.capture.send(b"get")
-
-        self.capture.close()
+            if self.in_flight:
+                # The GUI has not shown the previous image yet
+                self.dropped += 1
+                continue
+            self.in_flight = True
+            self.rendered += 1
+            self.image_ready.emit(render_frame(frame, self.target_size, f"FPS: {round(self.stream.stats()['fps'])}"))
 
-    @staticmethod
-    def recv_all(connect, count):
-        buffer = b""
-        while count:
-            new_buffer = connect.recv(count)
-            if not new_buffer:
-                return None
-            buffer += new_buffer
-            count -= len(new_buffer)
-        return buffer
+    def shown(self):
+        self.in_flight = False
 
     def stop_thread(self):
         self.wait()
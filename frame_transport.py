@@ -0,0 +1,188 @@
+"""Wire format between the camera sender on the RPI and `VideoWorkerThread`
+
+legacy:  sender  -> 16 bytes ASCII length + JPEG, waits for b"get" before the next frame
+stream:  receiver -> b"STRM" + uint32 credits once after connecting
+         sender  -> `frame_header` + payload, one frame per credit without waiting
+         receiver -> uint32 credits whenever it has consumed frames
+
+The sender tells the two apart by waiting `handshake_timeout` for the hello, legacy
+receivers never send anything before the first frame. The encoding byte of the header
+has `FRAME_CROPPED` set when the sender already cropped the frame to the model geometry
+(`send_image.py` without `--full-frame`), legacy frames cannot say and count as full frames.
+"""
+import select
+import socket
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+legacy_length_size = 16
+legacy_request = b"get"
+
+stream_hello = b"STRM"
+credit_struct = struct.Struct("!I")
+# payload length, encoding, height, width, capture timestamp
+frame_header = struct.Struct("!IBHHd")
+
+FRAME_JPEG = 0
+FRAME_RAW = 1
+# Flag of the encoding byte: the resize + center crop of the model is already done
+FRAME_CROPPED = 0x80
+
+Frame = namedtuple("Frame", ["payload", "encoding", "height", "width", "timestamp", "cropped"],
+                   defaults=[False])
+
+
+def split_encoding(encoding):
+    """`(encoding, cropped)` of the encoding byte of a header"""
+    return encoding & ~FRAME_CROPPED, bool(encoding & FRAME_CROPPED)
+
+
+def recv_exactly(connect, view):
+    """Fill the whole memoryview `view` from the socket without intermediate copies"""
+    while len(view):
+        received = connect.recv_into(view)
+        if received == 0:
+            raise ConnectionResetError("Connection is closed by the sender")
+        view = view[received:]
+
+
+def disable_nagle(connect):
+    # Headers and credits are tiny writes, do not let them wait for the previous ACK
+    try:
+        connect.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
+
+
+def decode_frame(frame):
+    """Return the BGR image of a `Frame`. A raw frame is a view of the receive buffer,
+    copy it if it has to outlive the next `ring_size - 1` frames"""
+    import cv2
+
+    if frame.encoding == FRAME_RAW:
+        return np.frombuffer(frame.payload, dtype=np.uint8).reshape(frame.height, frame.width, 3)
+    return cv2.imdecode(np.frombuffer(frame.payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+class FrameReceiver:
+    """Receive frames into a ring of reusable buffers.
+
+    Each payload is read with `recv_into` straight into one of `ring_size` bytearrays,
+    which only grow when a bigger frame shows up, so the payload returned by `recv_frame`
+    stays valid until `ring_size` more frames are received.
+    """
+    def __init__(self, connect, streaming=True, credits=4, ring_size=4, buffer_size=1 << 18):
+        self.connect = connect
+        self.streaming = streaming
+        self.credits = credits
+        self.ring = [bytearray(buffer_size) for _ in range(ring_size)]
+        self.ring_index = 0
+        self.header = bytearray(frame_header.size if streaming else legacy_length_size)
+        self.consumed = 0
+        self.received_frames = 0
+
+        disable_nagle(self.connect)
+        if self.streaming:
+            self.connect.sendall(stream_hello + credit_struct.pack(self.credits))
+
+    def next_buffer(self, size):
+        buffer = self.ring[self.ring_index]
+        if len(buffer) < size:
+            buffer = self.ring[self.ring_index] = bytearray(max(size, 2 * len(buffer)))
+        self.ring_index = (self.ring_index + 1) % len(self.ring)
+        return memoryview(buffer)[:size]
+
+    def recv_frame(self):
+        if self.received_frames > 0:
+            self.release()
+
+        recv_exactly(self.connect, memoryview(self.header))
+        if self.streaming:
+            length, encoding, height, width, timestamp = frame_header.unpack(self.header)
+        else:
+            length, encoding, height, width, timestamp = int(self.header), FRAME_JPEG, 0, 0, time.time()
+        encoding, cropped = split_encoding(encoding)
+
+        payload = self.next_buffer(length)
+        recv_exactly(self.connect, payload)
+        self.received_frames += 1
+        return Frame(payload, encoding, height, width, timestamp, cropped)
+
+    def release(self):
+        """Ask for the next frame(s) once the previous one is consumed"""
+        if not self.streaming:
+            self.connect.sendall(legacy_request)
+            return
+
+        # Hand the credits back in chunks instead of one tiny packet per frame
+        self.consumed += 1
+        if self.consumed >= max(1, self.credits // 2):
+            self.connect.sendall(credit_struct.pack(self.consumed))
+            self.consumed = 0
+
+
+class FrameConnection:
+    """Sender side of a single receiver, speaks whichever protocol the receiver speaks"""
+    def __init__(self, connect, handshake_timeout=0.5):
+        self.connect = connect
+        self.pending_credit = b""
+        disable_nagle(self.connect)
+
+        ready, _, _ = select.select([connect], [], [], handshake_timeout)
+        hello = connect.recv(len(stream_hello), socket.MSG_PEEK) if ready else b""
+        self.streaming = hello == stream_hello
+        if self.streaming:
+            connect.recv(len(stream_hello))
+            self.credits = 0
+            self.wait_ready()
+        else:
+            # A legacy receiver takes the first frame without asking
+            self.credits = 1
+
+    def read_credits(self, timeout):
+        ready, _, _ = select.select([self.connect], [], [], timeout)
+        if not ready:
+            return
+        data = self.connect.recv(4096)
+        if not data:
+            raise ConnectionResetError("Connection is closed by the receiver")
+
+        if not self.streaming:
+            self.pending_credit += data
+            while self.pending_credit.startswith(legacy_request):
+                self.pending_credit = self.pending_credit[len(legacy_request):]
+                self.credits += 1
+            return
+
+        self.pending_credit += data
+        complete = len(self.pending_credit) - len(self.pending_credit) % credit_struct.size
+        for (credit,) in credit_struct.iter_unpack(self.pending_credit[:complete]):
+            self.credits += credit
+        self.pending_credit = self.pending_credit[complete:]
+
+    def wait_ready(self, timeout=None):
+        """Return True once the receiver can take another frame, False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.credits == 0:
+            remaining = None if deadline is None else max(0., deadline - time.monotonic())
+            self.read_credits(remaining)
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        return self.credits > 0
+
+    def send(self, payload, encoding=FRAME_JPEG, height=0, width=0, timestamp=None, cropped=False):
+        assert self.streaming or encoding == FRAME_JPEG, "Legacy receivers only understand JPEG"
+
+        payload = memoryview(payload).cast("B")
+        if self.streaming:
+            header = frame_header.pack(
+                len(payload), encoding | (FRAME_CROPPED if cropped else 0), height, width,
+                time.time() if timestamp is None else timestamp)
+        else:
+            header = str(len(payload)).ljust(legacy_length_size).encode()
+        self.connect.sendall(header)
+        self.connect.sendall(payload)
+        self.credits -= 1
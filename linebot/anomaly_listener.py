@@ -0,0 +1,29 @@
+class AnomalyListener:
+    """Call `on_anomaly(machine_id)` as soon as a machine raises `error` in the `anomaly` collection.
+
+    Uses the `on_snapshot` listener of the collection, so only the changed documents are
+    read instead of scanning the whole collection. Any collection with the same
+    `on_snapshot(callback)` interface works, e.g. the local stand-in in
+    `tools/fake_firestore.py`. The callback runs on the listener thread.
+    """
+    def __init__(self, collection, on_anomaly):
+        self.collection = collection
+        self.on_anomaly = on_anomaly
+        self.watch = None
+
+    def start(self):
+        self.watch = self.collection.on_snapshot(self.on_snapshot)
+        return self
+
+    def on_snapshot(self, docs, changes, read_time):
+        for change in changes:
+            if change.type.name == "REMOVED":
+                continue
+            data = change.document.to_dict() or dict()
+            if data.get("error"):
+                self.on_anomaly(change.document.id)
+
+    def stop(self):
+        if self.watch is not None:
+            self.watch.unsubscribe()
+            self.watch = None
@@ -1,25 +1,32 @@
-import threading
-import time
-from collections import defaultdict
-from flask import Flask, request, abort
+import sys
+from pathlib import Path
+from flask import Flask
 from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage
 import configparser
 
 import firebase_admin
 from firebase_admin import firestore, credentials
 
+from anomaly_listener import AnomalyListener
+from dispatcher import NotificationDispatcher
+from leader_lock import LeaderLock
+from subscriber_store import SubscriberStore
+from webhook import EventProcessor, add_callback
+
+# `machine_registry.py` is shared with the app in the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from machine_registry import MachineRegistry
+
 config = configparser.ConfigParser()
 config.read("config.ini")
 
 line_bot_api = LineBotApi(config.get("line-bot", "channel_access_token"))
 handler = WebhookHandler(config.get("line-bot", "channel_secret"))
 
-# Used to save the authorized user
-authorized_ID_dict = defaultdict(str)
-reversed_authorized_ID_dict = defaultdict(list)
-running = True
+# Used to save the authorized user, shared by every worker and kept across restarts
+database = config.get("store", "database", fallback="subscribers.db")
+subscriber_store = SubscriberStore(database)
 
 
 def reply_message(reply_token, msg):
@@ -30,47 +37,41 @@ def send_direct_message(user_id, msg):
     line_bot_api.push_message(user_id, TextSendMessage(text=msg))
 
 
-def check_database_anomaly(firestore_client):
-    global running
-    collection = firestore_client.collection(u"anomaly")
-    while running:
-        # Obtain data first
-        docs = collection.stream()
+def send_multicast(user_ids, msg):
+    line_bot_api.multicast(user_ids, TextSendMessage(text=msg))
+
+
+def reset_anomaly(machine_id):
+    # Reset once per machine, the app raises it again on its next normal -> anomaly transition
+    anomaly_collection.document(machine_id).set({"error": False}, merge=True)
+
 
-        for data in docs:
-            # Check error and send message to user if necessary
-            error = data.to_dict()["error"]
-            if error:
-                notify_id = reversed_authorized_ID_dict[data.id]
-                for single_id in notify_id:
-                    send_direct_message(single_id, "Error detected!🆘")
-                    collection.document(data.id).set({"error": False})
-        time.sleep(10)
+# Batches the subscribers of a machine into multicasts, off the listener thread
+dispatcher = NotificationDispatcher(
+    send_multicast, subscriber_store.subscribers, reset=reset_anomaly,
+    workers=config.getint("dispatcher", "workers", fallback=4),
+    rate=config.getfloat("dispatcher", "rate", fallback=100),
+    dedup_window=config.getfloat("dispatcher", "dedup_window", fallback=60))
+
+
+def notify_anomaly(machine_id):
+    dispatcher.notify(machine_id, "Error detected!🆘")
 
 
 def set_password(reply_token, password, user_id):
-    reversed_authorized_ID_dict[password].append(user_id)
-    authorized_ID_dict[user_id] = password
+    subscriber_store.subscribe(user_id, password.strip())
     reply_message(reply_token, "Token is successfully activated!")
 
 
 def clear_user_information(reply_token, user_id):
-    reversed_authorized_ID_dict[authorized_ID_dict[user_id]].remove(user_id)
-    del authorized_ID_dict[user_id]
+    subscriber_store.unsubscribe(user_id)
     message = [TextSendMessage(text="Password is reset. Please input your new password.")]
     line_bot_api.reply_message(reply_token, message)
 
 
 def check_database_token(cur_message):
-    if not firebase_admin._apps:
-        cred = credentials.Certificate("service_account.json")
-        firebase_admin.initialize_app(cred)
-
-    docs = firestore.client().collection(u"machines").stream()
-    for data in docs:
-        if cur_message in data.to_dict()["id"]:
-            return True
-    return False
+    # Exact match, a part of a machine id is no token
+    return machine_registry.contains(cur_message.strip())
 
 
 @handler.add(MessageEvent, message=TextMessage)
@@ -78,7 +79,7 @@ def handle_message(event):
     cur_user_id = event.source.user_id
     cur_message = event.message.text
 
-    if cur_user_id not in authorized_ID_dict:
+    if subscriber_store.machine_of(cur_user_id) is None:
         # Add user if user enter the correct password/token
         if not check_database_token(cur_message):
             reply_message(event.reply_token, "Token not found. Please try again")
@@ -94,31 +95,26 @@ cred = credentials.Certificate("service_account.json")
 firebase_admin.initialize_app(cred)
 firestore_client = firestore.client()
 
-# Threading for check the database and send message to user if needed
-check_database_thread = threading.Thread(
-    target=check_database_anomaly, args=(firestore_client,), daemon=True)
-check_database_thread.start()
-
-app = Flask(__name__)
+# Firestore pushes the changed anomaly documents, no need to scan the collection. Only
+#  the leader worker listens, the others take over if it exits
+anomaly_collection = firestore_client.collection(u"anomaly")
+anomaly_listener = AnomalyListener(anomaly_collection, notify_anomaly)
 
 
-@app.route("/callback", methods=["POST"])
-def callback():
-    # get X-Line-Signature header value
-    signature = request.headers["X-Line-Signature"]
+def start_alerts():
+    dispatcher.start()
+    anomaly_listener.start()
 
-    # get request body as text
-    body = request.get_data(as_text=True)
-    app.logger.info("Request body: " + body)
 
-    # handle webhook body
-    try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
-        print("Invalid signature. Please check your channel access token/channel secret.")
-        abort(400)
+leader_lock = LeaderLock(database + ".leader", on_elected=start_alerts).start()
+# Tokens are checked in memory, the registry follows the `machines` collection
+machine_registry = MachineRegistry(firestore_client.collection(u"machines")).start()
 
-    return "OK"
+# The webhook only checks the signature and queues the events, replies and token checks
+#  run on the processor's threads
+event_processor = EventProcessor(handler.handle, workers=config.getint("webhook", "workers", fallback=4),
+                                 queue_size=config.getint("webhook", "queue_size", fallback=1000)).start()
+app = add_callback(Flask(__name__), config.get("line-bot", "channel_secret"), event_processor)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+import queue
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Allow `rate` calls per second on average and bursts of up to `burst` calls"""
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst or rate
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable(error):
+    """Rate limited, server side and network errors are worth another try, a bad request is not"""
+    status = getattr(error, "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+
+class NotificationDispatcher:
+    """Send the anomaly alerts of many machines to their subscribers without blocking the
+    listener.
+
+    `notify(machine_id, text)` only queues the alert. The worker threads look up the
+    subscribers with `recipients(machine_id)`, drop the users that already got an alert of
+    that machine in the last `dedup_window` seconds and call `send(user_ids, text)` with
+    up to `batch_size` users at once (a LINE multicast). Calls are limited to `rate` per
+    second and retried with exponential backoff. `reset(machine_id)` is called once per
+    machine when all its batches are done, however many alerts were coalesced into it. If
+    every batch failed the flag stays raised, so the alert is not lost and the next one
+    tries again.
+    """
+    def __init__(self, send, recipients, reset=None, workers=4, batch_size=500, rate=100, burst=None,
+                 dedup_window=60, queue_size=1000, retries=5, backoff=0.5):
+        self.send = send
+        self.recipients = recipients
+        self.reset = reset
+        self.workers = workers
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(rate, burst)
+        self.dedup_window = dedup_window
+        self.retries = retries
+        self.backoff = backoff
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        # machine id -> batches not done yet, machine id -> [delivered, failed] batches,
+        # (machine id, user id) -> time of the last alert
+        self.pending = dict()
+        self.outcomes = dict()
+        self.notified = dict()
+        self.threads = []
+        self.counters = dict.fromkeys(
+            ["alerts", "coalesced", "dropped", "deduplicated", "batches", "sent", "retries", "failed", "resets",
+             "kept"], 0)
+
+    def start(self):
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.run, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def notify(self, machine_id, text):
+        """Queue an alert, False if it was dropped because the queue is full"""
+        with self.lock:
+            self.counters["alerts"] += 1
+            if machine_id in self.pending:
+                # Its subscribers are about to be notified anyway
+                self.counters["coalesced"] += 1
+                return True
+            self.pending[machine_id] = 1
+            self.outcomes[machine_id] = [0, 0]
+        try:
+            self.queue.put_nowait((machine_id, None, text))
+        except queue.Full:
+            with self.lock:
+                del self.pending[machine_id]
+                del self.outcomes[machine_id]
+                self.counters["dropped"] += 1
+            return False
+        return True
+
+    def fresh_recipients(self, machine_id):
+        subscribers = self.recipients(machine_id)
+        now = time.monotonic()
+        user_ids = []
+        with self.lock:
+            if len(self.notified) > 100000:
+                self.notified = {key: sent for key, sent in self.notified.items()
+                                 if now - sent < self.dedup_window}
+            for user_id in subscribers:
+                sent = self.notified.get((machine_id, user_id))
+                if sent is not None and now - sent < self.dedup_window:
+                    self.counters["deduplicated"] += 1
+                    continue
+                self.notified[(machine_id, user_id)] = now
+                user_ids.append(user_id)
+        return user_ids
+
+    def expand(self, machine_id, text):
+        """Split the alert of a machine into batches for the other workers, the ones that do
+        not fit into the queue are returned to be sent by this worker"""
+        user_ids = self.fresh_recipients(machine_id)
+        batches = [user_ids[start:start + self.batch_size] for start in range(0, len(user_ids), self.batch_size)]
+        own = batches[:1]
+        for batch in batches[1:]:
+            with self.lock:
+                self.pending[machine_id] += 1
+            try:
+                self.queue.put_nowait((machine_id, batch, text))
+            except queue.Full:
+                # Blocking here could stall every worker, an accepted alert is not dropped either
+                with self.lock:
+                    self.pending[machine_id] -= 1
+                own.append(batch)
+        return own
+
+    def deliver(self, machine_id, user_ids, text):
+        """Send one batch with retries, False if it could not be sent"""
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                self.send(user_ids, text)
+            except Exception as e:
+                if attempt == self.retries or not is_retryable(e):
+                    print(f"Could not notify {len(user_ids)} user(s) of {machine_id}: {e}")
+                    self.count("failed", len(user_ids))
+                    with self.lock:
+                        # Let the next alert of the machine try them again
+                        for user_id in user_ids:
+                            self.notified.pop((machine_id, user_id), None)
+                    return False
+                self.count("retries")
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+            else:
+                self.count("batches")
+                self.count("sent", len(user_ids))
+                return True
+
+    def done(self, machine_id, delivered, failed):
+        with self.lock:
+            self.pending[machine_id] -= 1
+            outcome = self.outcomes[machine_id]
+            outcome[0] += delivered
+            outcome[1] += failed
+            finished = self.pending[machine_id] == 0
+            if finished:
+                del self.pending[machine_id]
+                del self.outcomes[machine_id]
+        # Nothing to send (no new subscribers) still resets, only an alert nobody got is kept
+        if finished and outcome[1] and not outcome[0]:
+            print(f"No alert of {machine_id} was delivered, its anomaly stays raised")
+            self.count("kept")
+        elif finished and self.reset is not None:
+            try:
+                self.reset(machine_id)
+                self.count("resets")
+            except Exception as e:
+                print(f"Could not reset the anomaly of {machine_id}: {e}")
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            machine_id, user_ids, text = item
+            delivered = failed = 0
+            try:
+                for batch in self.expand(machine_id, text) if user_ids is None else [user_ids]:
+                    if self.deliver(machine_id, batch, text):
+                        delivered += 1
+                    else:
+                        failed += 1
+            except Exception as e:
+                print(f"Could not dispatch the alert of {machine_id}: {e}")
+                failed += 1
+            finally:
+                self.done(machine_id, delivered, failed)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, queued=self.queue.qsize(), pending=len(self.pending))
@@ -0,0 +1,56 @@
+import fcntl
+import os
+import threading
+
+
+class LeaderLock:
+    """Elect one process among the gunicorn workers with an exclusive `flock` on `path`.
+
+    `on_elected()` is called once in the worker that gets the lock, the others try again
+    every `retry` seconds and take over when the leader exits (the kernel releases the
+    lock of a dead process). Only the leader runs the alert loop, so every anomaly is
+    sent once however many workers serve the webhook.
+    """
+    def __init__(self, path, on_elected, retry=5):
+        self.path = path
+        self.on_elected = on_elected
+        self.retry = retry
+        self.file = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @property
+    def is_leader(self):
+        return self.file is not None
+
+    def try_acquire(self):
+        file = open(self.path, "a+")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return False
+        file.seek(0)
+        file.truncate()
+        file.write(f"{os.getpid()}\n")
+        file.flush()
+        self.file = file
+        return True
+
+    def run(self):
+        while not self.try_acquire():
+            if self.stopped.wait(self.retry):
+                return
+        self.on_elected()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
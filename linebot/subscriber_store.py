@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class SubscriberStore:
+    """Which LINE user follows which machine, kept in SQLite so it survives restarts and
+    is shared by every gunicorn worker.
+
+    The database runs in WAL mode, readers never wait for a writer. Lookups are cached
+    per worker, the cache is dropped as soon as any worker commits a change
+    (`PRAGMA data_version`), so a subscription made on one worker is seen by the others
+    on their next lookup without reading the table again in between.
+    """
+    def __init__(self, path, timeout=5, cache_size=10000):
+        self.path = path
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+        self.version = None
+        # user id -> machine id (None if not subscribed), machine id -> user ids
+        self.machines = dict()
+        self.users = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        # A connection must not cross a fork, gunicorn may import the app before forking
+        if self.connection is None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                              check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            # Enough with WAL, a power cut can only lose the last commits
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS subscribers ("
+                "user_id TEXT PRIMARY KEY, machine_id TEXT NOT NULL, subscribed REAL NOT NULL)")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS subscribers_machine_id ON subscribers (machine_id)")
+            self.pid = os.getpid()
+            self.version = None
+        return self.connection
+
+    def validate(self):
+        """Drop the cache if another connection committed since the last lookup"""
+        version = self.connect().execute("PRAGMA data_version").fetchone()[0]
+        if version != self.version:
+            self.machines.clear()
+            self.users.clear()
+            self.version = version
+
+    def write(self, query, args):
+        with self.lock:
+            self.connect().execute(query, args)
+            # `data_version` does not change for the commits of this connection
+            self.machines.clear()
+            self.users.clear()
+
+    def subscribe(self, user_id, machine_id):
+        self.write("INSERT INTO subscribers (user_id, machine_id, subscribed) VALUES (?, ?, ?) "
+                   "ON CONFLICT (user_id) DO UPDATE SET machine_id = excluded.machine_id, "
+                   "subscribed = excluded.subscribed", (user_id, machine_id, time.time()))
+
+    def unsubscribe(self, user_id):
+        self.write("DELETE FROM subscribers WHERE user_id = ?", (user_id,))
+
+    def machine_of(self, user_id):
+        """The machine `user_id` follows, None if the user has no token yet"""
+        with self.lock:
+            self.validate()
+            if user_id in self.machines:
+                self.hits += 1
+                return self.machines[user_id]
+            self.misses += 1
+            row = self.connection.execute(
+                "SELECT machine_id FROM subscribers WHERE user_id = ?", (user_id,)).fetchone()
+            if len(self.machines) >= self.cache_size:
+                # Every stranger writing to the bot is looked up once, keep the cache bounded
+                self.machines.clear()
+            self.machines[user_id] = row[0] if row else None
+            return self.machines[user_id]
+
+    def subscribers(self, machine_id):
+        with self.lock:
+            self.validate()
+            if machine_id in self.users:
+                self.hits += 1
+                return list(self.users[machine_id])
+            self.misses += 1
+            rows = self.connection.execute(
+                "SELECT user_id FROM subscribers WHERE machine_id = ? ORDER BY subscribed", (machine_id,))
+            if len(self.users) >= self.cache_size:
+                self.users.clear()
+            self.users[machine_id] = tuple(row[0] for row in rows)
+            return list(self.users[machine_id])
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.pid == os.getpid():
+                self.connection.close()
+            self.connection = None
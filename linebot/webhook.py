@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import hmac
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+from flask import abort, jsonify, request
+
+
+def verify_signature(channel_secret, body, signature):
+    """The `X-Line-Signature` check of the SDK: base64 HMAC-SHA256 of the body"""
+    digest = hmac.new(channel_secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return hmac.compare_digest(signature.encode("utf-8"), base64.b64encode(digest))
+
+
+def source_key(body):
+    """The user (or group, room) of the first event of a webhook body, None without one"""
+    try:
+        events = json.loads(body).get("events") or []
+    except (ValueError, AttributeError):
+        return None
+    for event in events:
+        source = event.get("source") or dict()
+        key = source.get("userId") or source.get("groupId") or source.get("roomId")
+        if key is not None:
+            return key
+    return None
+
+
+class EventProcessor:
+    """Handle webhook bodies on `workers` background threads, `handle(body, signature)` is
+    called once per body.
+
+    Each worker has its own queue and the bodies of one user always go to the same worker
+    (`source_key` hashed onto the workers), so the events of one user are handled in the
+    order they arrive: a token and the "set password" right after it cannot overtake each
+    other. A body with events of several users follows its first user. The order only
+    holds within one process, the bodies of separate web server processes race as before.
+
+    At most `queue_size` bodies wait, `submit` refuses more so a burst cannot grow the
+    memory of the worker. `stats()` reports the queue depth and how long the bodies
+    waited and took from `submit` to the end of `handle`.
+    """
+    def __init__(self, handle, workers=4, queue_size=1000, samples=1000):
+        self.handle = handle
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queues = [queue.Queue() for _ in range(workers)]
+        self.depth = 0
+        self.lock = threading.Lock()
+        self.threads = []
+        # Seconds from `submit` to the start and to the end of `handle` of the last bodies
+        self.waits = deque(maxlen=samples)
+        self.latencies = deque(maxlen=samples)
+        self.submitted = 0
+        self.handled = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_depth = 0
+
+    def start(self):
+        for worker_queue in self.queues:
+            thread = threading.Thread(target=self.run, args=(worker_queue,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        for worker_queue in self.queues:
+            worker_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def submit(self, body, signature):
+        """Queue a body on the worker of its user, False if `queue_size` bodies are waiting"""
+        worker_queue = self.queues[hash(source_key(body)) % self.workers]
+        with self.lock:
+            if self.depth >= self.queue_size:
+                self.rejected += 1
+                return False
+            self.depth += 1
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self.depth)
+            # Under the lock, two bodies of one user are queued in the order they came in
+            worker_queue.put((time.monotonic(), body, signature))
+        return True
+
+    def run(self, worker_queue):
+        while True:
+            item = worker_queue.get()
+            if item is None:
+                break
+            with self.lock:
+                self.depth -= 1
+            submitted, body, signature = item
+            started = time.monotonic()
+            try:
+                self.handle(body, signature)
+                failed = False
+            except Exception as e:
+                print(f"Could not handle a webhook body: {e}")
+                failed = True
+            with self.lock:
+                self.waits.append(started - submitted)
+                self.latencies.append(time.monotonic() - submitted)
+                self.handled += 1
+                self.failed += failed
+
+    def join(self, timeout=None):
+        """Wait until every submitted body is handled, False on timeout"""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                if self.handled >= self.submitted:
+                    return True
+            if end is not None and time.monotonic() > end:
+                return False
+            time.sleep(0.005)
+
+    @staticmethod
+    def percentiles(samples):
+        if not samples:
+            return dict(p50_ms=None, p99_ms=None)
+        ordered = sorted(samples)
+        return dict(p50_ms=round(1000 * ordered[len(ordered) // 2], 2),
+                    p99_ms=round(1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2))
+
+    def stats(self):
+        with self.lock:
+            return dict(depth=self.depth, max_depth=self.max_depth, submitted=self.submitted,
+                        handled=self.handled, failed=self.failed, rejected=self.rejected,
+                        wait=self.percentiles(self.waits), latency=self.percentiles(self.latencies))
+
+
+def add_callback(app, channel_secret, processor, rule="/callback"):
+    """The webhook route: check the signature, queue the body for `processor` and answer
+    at once. `/metrics` returns `processor.stats()`"""
+    @app.route(rule, methods=["POST"])
+    def callback():
+        # get X-Line-Signature header value
+        signature = request.headers.get("X-Line-Signature", "")
+
+        # get request body as text
+        body = request.get_data(as_text=True)
+        app.logger.debug(f"Request body of {len(body)} characters")
+
+        if not verify_signature(channel_secret, body, signature):
+            print("Invalid signature. Please check your channel access token/channel secret.")
+            abort(400)
+        if not processor.submit(body, signature):
+            # LINE redelivers the webhook later if redelivery is turned on
+            abort(503)
+        return "OK"
+
+    @app.route("/metrics")
+    def metrics():
+        return jsonify(processor.stats())
+
+    return app
@@ -0,0 +1,127 @@
+"""In-memory index of the registered machine ids, shared by the app login and the LINE bot.
+
+    registry = MachineRegistry(firestore_client.collection(u"machines")).start()
+    registry.contains("machine-42")
+
+A lookup is an exact match in a hash index, no request goes out. The set is filled once and then
+kept up to date by the `on_snapshot` listener of the collection (only changed documents
+are read), or reloaded in the background every `ttl` seconds with `listen=False`. Any
+collection with `stream()` and `on_snapshot(callback)` works, e.g. the local stand-in of
+`tools/fake_firestore.py`.
+"""
+import threading
+import time
+
+
+class MachineRegistry:
+    def __init__(self, collection, listen=True, ttl=300, load_timeout=10, field="id", clock=time.monotonic):
+        self.collection = collection
+        self.listen = listen
+        self.ttl = ttl
+        self.load_timeout = load_timeout
+        self.field = field
+        self.clock = clock
+
+        # document id -> machine id, and machine id -> number of documents with it. Both are
+        #  only changed under `lock`, a lookup is a single dict membership test without it
+        self.documents = dict()
+        self.ids = dict()
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.refreshing = False
+        self.loaded = None
+        self.watch = None
+
+        self.lookups = 0
+        self.reloads = 0
+        self.changes = 0
+
+    def start(self):
+        """Load the ids in the background, the first lookup waits for them"""
+        if self.listen:
+            # The listener starts with one ADDED change per existing document
+            self.watch = self.collection.on_snapshot(self.on_snapshot)
+        else:
+            self.refresh()
+        return self
+
+    def stop(self):
+        if self.watch is not None:
+            self.watch.unsubscribe()
+            self.watch = None
+
+    def machine_id(self, document):
+        data = document.to_dict() or dict()
+        return data.get(self.field)
+
+    @staticmethod
+    def count_ids(documents):
+        ids = dict()
+        for machine_id in documents.values():
+            if machine_id is not None:
+                ids[machine_id] = ids.get(machine_id, 0) + 1
+        return ids
+
+    def discard(self, doc_id):
+        machine_id = self.documents.pop(doc_id, None)
+        if machine_id is None:
+            return
+        if self.ids[machine_id] == 1:
+            del self.ids[machine_id]
+        else:
+            self.ids[machine_id] -= 1
+
+    def on_snapshot(self, docs, changes, read_time):
+        """Apply only the changed documents, `docs` is not looked at"""
+        with self.lock:
+            for change in changes:
+                self.discard(change.document.id)
+                if change.type.name == "REMOVED":
+                    continue
+                machine_id = self.machine_id(change.document)
+                self.documents[change.document.id] = machine_id
+                if machine_id is not None:
+                    self.ids[machine_id] = self.ids.get(machine_id, 0) + 1
+            self.changes += len(changes)
+            self.loaded = self.clock()
+        self.ready.set()
+
+    def reload(self):
+        documents = {document.id: self.machine_id(document) for document in self.collection.stream()}
+        with self.lock:
+            self.documents = documents
+            self.ids = self.count_ids(documents)
+            self.reloads += 1
+            self.loaded = self.clock()
+        self.ready.set()
+
+    def refresh(self):
+        """Reload in the background unless a reload is already running"""
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+
+        def run():
+            try:
+                self.reload()
+            finally:
+                with self.lock:
+                    self.refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def contains(self, machine_id):
+        """True if `machine_id` is registered, exact match"""
+        if not self.ready.is_set():
+            self.ready.wait(self.load_timeout)
+        self.lookups += 1
+        if not self.listen and self.loaded is not None and self.clock() - self.loaded > self.ttl:
+            # Answer from the current ids, the reload only matters for later lookups
+            self.refresh()
+        return machine_id in self.ids
+
+    __contains__ = contains
+
+    def __len__(self):
+        return len(self.ids)
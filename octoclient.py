@@ -1,24 +1,83 @@
+import copy
+import json
 import time
 import os
+import threading
 import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
 
-import cv2
+
+def is_heating(temperature):
+    """`temperature` is one `{"actual": ..., "target": ...}` entry of the printer API"""
+    return (temperature["target"] != 0.) and (abs(temperature["target"] - temperature["actual"]) > 1)
+
+
+def printed_progress(job_state, temperature):
+    """Progress of the current work from the job API and the `temperature` of the printer API"""
+    if job_state["state"] in ["Printing", "Pausing", "Paused", "Printing from SD"]:
+        completion = job_state["progress"]["completion"]
+        print_time_left = job_state["progress"]["printTimeLeft"]
+
+        state = job_state["state"]
+        if "bed" in temperature and is_heating(temperature["bed"]):
+            state = "board heated"
+        elif "tool0" in temperature and is_heating(temperature["tool0"]):
+            state = "tool heated"
+
+        return {
+            "job_state": state,
+            "completion": completion,
+            "print_time_left": print_time_left
+        }
+    else:
+        return {
+            "job_state": "Not printed"
+        }
+
+
+def current_user(user_profile):
+    """Name and role from the current user API"""
+    if "admins" in user_profile["groups"]:
+        role = "admins"
+    else:
+        role = user_profile["groups"][0]
+
+    return {
+        "name": user_profile["name"],
+        "role": role
+    }
 
 
 class OctoClient:
     def __init__(self, host_name="http://octopi.local", use_cap=True,
-                 device=0):
+                 device=0, timeout=5, max_workers=8):
         # Set up API url and secret key
         load_dotenv()
         self.api_key = os.getenv("api_key")
+        self.host_name = host_name
         self.base_url = f"{host_name}/api"
 
+        # Keep the connections to OctoPrint alive instead of a new TCP connection per call
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        # url -> Future of the GET request that is on the way
+        self.inflight = dict()
+        self.inflight_lock = threading.Lock()
+
         # Set up camera
         self.use_cap = use_cap
         if self.use_cap:
+            # OpenCV is only imported when the client opens the camera itself, the app does not
+            import cv2
             self.cam = cv2.VideoCapture(device)
             time.sleep(0.1)
         else:
@@ -55,26 +114,48 @@ class OctoClient:
         if self.cam is not None:
             self.cam.release()
 
+        import cv2
         self.cam = cv2.VideoCapture(device)
         self.check_cam()
 
-    @staticmethod
-    def __send_reqeust(url, data=None, use_post=False, use_file=False):
+    def __send_reqeust(self, url, data=None, use_post=False, use_file=False):
         try:
             if use_post:
                 assert data is not None, "Data should not be `None` for sending post"
-                response = requests.post(url, json=data)
+                response = self.session.post(url, json=data, timeout=self.timeout)
                 return response
             elif use_file:
                 assert data is not None, "Data should not be `None` for sending post"
-                response = requests.post(url, files=data)
+                response = self.session.post(url, files=data, timeout=self.timeout)
                 return response
             else:
-                response = requests.get(url)
+                response = self.__shared_get(url)
                 return response.json()
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             raise ValueError("Server is not working. Please check the service")
 
+    def __shared_get(self, url):
+        """Identical GET requests on the way at the same time share one response"""
+        with self.inflight_lock:
+            future = self.inflight.get(url)
+            is_owner = future is None
+            if is_owner:
+                future = self.inflight[url] = Future()
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.inflight_lock:
+                del self.inflight[url]
+
     def get_file_list(self):
         get_file_url = f"{self.base_url}/files?apikey={self.api_key}"
         return self.__send_reqeust(get_file_url)
@@ -89,17 +170,11 @@ class OctoClient:
 
     def check_bed_heated(self):
         get_board_temp = self.get_specific_temperature("bed")
-        temp_actual = get_board_temp["bed"]["actual"]
-        temp_target = get_board_temp["bed"]["target"]
-
-        return (temp_target != 0.) and (abs(temp_target - temp_actual) > 1)
+        return is_heating(get_board_temp["bed"])
 
     def check_tool_heated(self):
         get_tool_temp = self.get_specific_temperature("tool")
-        temp_actual = get_tool_temp["tool0"]["actual"]
-        temp_target = get_tool_temp["tool0"]["target"]
-
-        return (temp_target != 0.) and (abs(temp_target - temp_actual) > 1)
+        return is_heating(get_tool_temp["tool0"])
 
     def get_job_state(self):
         get_job_state_url = f"{self.base_url}/job?apikey={self.api_key}"
@@ -110,23 +185,11 @@ class OctoClient:
         job_state = self.get_job_state()
 
         if job_state["state"] in ["Printing", "Pausing", "Paused", "Printing from SD"]:
-            completion = job_state["progress"]["completion"]
-            print_time_left = job_state["progress"]["printTimeLeft"]
-
-            if self.check_bed_heated():
-                job_state["state"] = "board heated"
-            elif self.check_tool_heated():
-                job_state["state"] = "tool heated"
-
-            return {
-                "job_state": job_state["state"],
-                "completion": completion,
-                "print_time_left": print_time_left
-            }
+            # One request for both the bed and the tool temperature
+            temperature = self.get_all_temperature().get("temperature", {})
         else:
-            return {
-                "job_state": "Not printed"
-            }
+            temperature = {}
+        return printed_progress(job_state, temperature)
 
     def get_connect_state(self):
         get_connect_state_url = f"{self.base_url}/connection?apikey={self.api_key}"
@@ -145,17 +208,7 @@ class OctoClient:
         return self.__send_reqeust(get_user_url)
 
     def get_current_user(self):
-        user_profile = self.get_user_profile()
-
-        if "admins" in user_profile["groups"]:
-            role = "admins"
-        else:
-            role = user_profile["groups"][0]
-
-        return {
-            "name": user_profile["name"],
-            "role": role
-        }
+        return current_user(self.get_user_profile())
 
     def upload_file(self, filename):
         upload_file_url = f"{self.base_url}/files/local?apikey={self.api_key}"
@@ -169,6 +222,161 @@ class OctoClient:
         res = self.__send_reqeust(print_file_url, data={"command": "select", "print": "true"}, use_post=True)
         return res
 
+    def login_passive(self):
+        """Session for the push socket, see `PushSubscriber`"""
+        login_url = f"{self.base_url}/login?apikey={self.api_key}"
+        return self.__send_reqeust(login_url, data={"passive": True}, use_post=True).json()
+
+    def subscribe(self, **kwargs):
+        """Start a `PushSubscriber` that keeps a `PrinterState` up to date"""
+        return PushSubscriber(self, **kwargs).start()
+
+    def snapshot(self):
+        """Fetch connection, job, printer, profile and user state concurrently.
+
+        A GUI refresh costs one parallel round trip instead of a chain of requests, use
+        `printed_progress(snapshot["job"], snapshot["printer"].get("temperature", {}))`
+        for what `get_printed_progress` returns. The printer entry only has an "error"
+        when the printer is not operational.
+        """
+        requests_to_send = {
+            "connection": self.get_connect_state,
+            "job": self.get_job_state,
+            "printer": self.get_all_temperature,
+            "profile": self.get_printer_profile,
+            "user": self.get_user_profile
+        }
+        futures = {name: self.executor.submit(request) for name, request in requests_to_send.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+class PrinterState:
+    """Printer state built from the messages of OctoPrint's push socket.
+
+    `snapshot()` has the same layout as `OctoClient.snapshot`, so the GUI renders the
+    same way from either. Profile and user are not pushed, they are fetched once over REST.
+    """
+    def __init__(self, profile=None, user=None):
+        self.lock = threading.Lock()
+        self.connection = {"current": {"state": "Closed"}}
+        self.job = {"state": "Offline", "progress": {"completion": None, "printTimeLeft": None}}
+        self.temperature = dict()
+        self.profile = profile
+        self.user = user
+
+    def apply_current(self, current):
+        state = current.get("state")
+        if state:
+            closed = state.get("flags", dict()).get("closedOrError", False)
+            self.connection = {"current": {"state": "Closed" if closed else state.get("text", "Offline")}}
+            self.job["state"] = state.get("text", "Offline")
+        if current.get("progress"):
+            self.job["progress"] = current["progress"]
+        if current.get("job"):
+            self.job["job"] = current["job"]
+        # Only the new samples are pushed, an empty list means nothing changed
+        if current.get("temps"):
+            self.temperature = {
+                key: value for key, value in current["temps"][-1].items() if key != "time"}
+
+    def apply(self, message):
+        """Update with one push message, return True if it changed anything"""
+        with self.lock:
+            changed = False
+            for key in ["history", "current"]:
+                if key in message:
+                    self.apply_current(message[key])
+                    changed = True
+            return changed
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "connection": copy.deepcopy(self.connection),
+                "job": copy.deepcopy(self.job),
+                "printer": {"temperature": copy.deepcopy(self.temperature)},
+                "profile": self.profile,
+                "user": self.user
+            }
+
+
+class PushSubscriber:
+    """Keep a `PrinterState` up to date from OctoPrint's push socket (`/sockjs/websocket`).
+
+    Runs in its own thread and reconnects every `reconnect_delay` seconds after the socket
+    drops. Every listener is called with the new snapshot whenever a message changes the
+    state, from the subscriber thread. Poll over REST while `connected` is False.
+    Needs the `websocket-client` package.
+    """
+    def __init__(self, client, reconnect_delay=5, timeout=30):
+        self.client = client
+        self.reconnect_delay = reconnect_delay
+        self.timeout = timeout
+
+        self.state = PrinterState()
+        self.listeners = []
+        self.connected = False
+        self.running = False
+        self.socket = None
+        self.thread = None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    @property
+    def url(self):
+        return f"{self.client.host_name.replace('http', 'ws', 1)}/sockjs/websocket"
+
+    def start(self):
+        # Fail early on the GUI side if the optional package is missing
+        import websocket  # noqa: F401
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.socket is not None:
+            self.socket.close()
+
+    def listen(self):
+        import websocket
+
+        # Profile and user are not pushed, fetch them once per connection
+        self.state.profile = self.client.get_printer_profile()
+        self.state.user = self.client.get_user_profile()
+        session = self.client.login_passive()
+
+        self.socket = websocket.create_connection(self.url, timeout=self.timeout)
+        self.socket.send(json.dumps({"auth": f"{session['name']}:{session['session']}"}))
+        self.connected = True
+        while self.running:
+            message = self.socket.recv()
+            if not message:
+                break
+            if self.state.apply(json.loads(message)):
+                snapshot = self.state.snapshot()
+                for listener in self.listeners:
+                    listener(snapshot)
+
+    def run(self):
+        import websocket
+
+        while self.running:
+            try:
+                self.listen()
+            except (ValueError, KeyError, OSError, websocket.WebSocketException):
+                pass
+            finally:
+                self.connected = False
+                if self.socket is not None:
+                    self.socket.close()
+                    self.socket = None
+            if self.running:
+                time.sleep(self.reconnect_delay)
+
 
 if __name__ == "__main__":
     octo_client = OctoClient(use_cap=False)
@@ -0,0 +1,164 @@
+import argparse
+import socket
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from octoclient import OctoClient
+from frame_transport import FrameConnection, FRAME_JPEG, FRAME_RAW
+
+
+class FrameSender:
+    """Serve the camera of `OctoClient` to `VideoWorkerThread`.
+
+    A capture thread keeps only the latest frame, every receiver gets the newest frame
+    whenever it is ready for one (stale frames are dropped, never queued) and at most
+    `fps` frames per second. With `model_geometry=True` the frame is resized to
+    `resize_size` and center cropped to `crop_size` here, so only the pixels the model
+    looks at go over Wi-Fi, and the header of every frame says so. Printers with a region
+    of interest (`backend/inference/roi.py`) need the whole frame, `model_geometry=False`.
+    """
+    def __init__(self, client, host="0.0.0.0", port=9999, fps=10, jpeg_quality=80, raw=False,
+                 model_geometry=True, resize_size=400, crop_size=352):
+        self.client = client
+        self.address = (host, port)
+        self.interval = 1 / fps
+        self.jpeg_quality = jpeg_quality
+        self.raw = raw
+        self.model_geometry = model_geometry
+        self.resize_size = resize_size
+        self.crop_size = crop_size
+
+        self.condition = threading.Condition()
+        self.latest = None
+        self.latest_time = 0.
+        self.latest_index = 0
+        self.encoded = {}
+        self.running = False
+        self.listener = None
+
+    def crop(self, frame):
+        frame = cv2.resize(frame, (self.resize_size, self.resize_size), interpolation=cv2.INTER_LINEAR)
+        offset = (self.resize_size - self.crop_size) // 2
+        return np.ascontiguousarray(frame[offset:offset + self.crop_size, offset:offset + self.crop_size])
+
+    def capture(self):
+        while self.running:
+            frame = self.client.frame
+            if frame is None:
+                time.sleep(self.interval)
+                continue
+            if self.model_geometry:
+                frame = self.crop(frame)
+
+            with self.condition:
+                self.latest = frame
+                self.latest_time = time.time()
+                self.latest_index += 1
+                self.encoded = {}
+                self.condition.notify_all()
+
+    def wait_frame(self, last_index, timeout=1):
+        """Return the newest frame after `last_index`, or None if no new frame came in time"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.latest_index > last_index or not self.running, timeout):
+                return None
+            if not self.running:
+                return None
+            return self.latest_index, self.latest_time, self.latest
+
+    def encode(self, index, frame, raw):
+        """Encode each frame once no matter how many receivers there are"""
+        with self.condition:
+            if (index, raw) in self.encoded:
+                return self.encoded[(index, raw)]
+
+        if raw:
+            payload = frame
+            encoding = FRAME_RAW
+        else:
+            success, payload = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            assert success, "Fail to encode the frame"
+            encoding = FRAME_JPEG
+
+        with self.condition:
+            if self.latest_index == index:
+                self.encoded[(index, raw)] = (payload, encoding)
+        return payload, encoding
+
+    def handle(self, connect):
+        try:
+            frame_connection = FrameConnection(connect)
+            # Raw frames need the shape in the header, the legacy framing does not have one
+            raw = self.raw and frame_connection.streaming
+
+            last_index, last_sent = 0, 0.
+            while self.running:
+                if not frame_connection.wait_ready(timeout=1):
+                    continue
+                latest = self.wait_frame(last_index)
+                if latest is None:
+                    continue
+                last_index, captured, frame = latest
+
+                payload, encoding = self.encode(last_index, frame, raw)
+                time.sleep(max(0., last_sent + self.interval - time.time()))
+                last_sent = time.time()
+                frame_connection.send(
+                    payload, encoding=encoding, height=frame.shape[0], width=frame.shape[1], timestamp=captured,
+                    cropped=self.model_geometry)
+        except (BrokenPipeError, ConnectionResetError, socket.timeout):
+            pass
+        finally:
+            connect.close()
+
+    def start(self):
+        self.running = True
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(self.address)
+        self.listener.listen(5)
+        threading.Thread(target=self.capture, daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        while self.running:
+            try:
+                connect, _ = self.listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.handle, args=(connect,), daemon=True).start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.listener.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send the camera frames to the backend")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--device", default="0", help="Camera index or stream url")
+    parser.add_argument("--fps", type=float, default=10)
+    parser.add_argument("--quality", type=int, default=80, help="JPEG quality")
+    parser.add_argument("--raw", action="store_true",
+                        help="Send uncompressed uint8 frames, only worth it on a fast network")
+    parser.add_argument("--full-frame", action="store_true",
+                        help="Send the whole frame instead of the 352x352 crop the model uses. "
+                             "Needed if the printer has a region of interest")
+    args = parser.parse_args()
+
+    device = int(args.device) if args.device.isdigit() else args.device
+    octo_client = OctoClient(use_cap=True, device=device)
+    sender = FrameSender(
+        octo_client, port=args.port, fps=args.fps, jpeg_quality=args.quality,
+        raw=args.raw, model_geometry=not args.full_frame).start()
+    print(f"Sending frames on port {args.port}")
+    try:
+        sender.serve_forever()
+    except KeyboardInterrupt:
+        sender.stop()
+        octo_client.close_cam()
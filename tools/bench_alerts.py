@@ -0,0 +1,174 @@
+"""Compare the old 10 s scan of the `anomaly` collection with the event-driven alert path.
+
+    $ PYTHONPATH=.:linebot python tools/bench_alerts.py --machines 500 --seconds 30 --latency 50
+
+Both paths run against their own `tools/fake_firestore.py` store with `--latency` ms per
+call. A few machines turn anomalous at random times, the notification latency is the time
+from the app's write to the bot's notification. Billed document reads are extrapolated to
+an hour. A recorded-like sequence of per-frame predictions then shows how many writes
+`AnomalyPublisher` saves over writing every anomalous frame, and a store that fails its
+first writes shows the publisher retrying instead of dropping the transition.
+"""
+import argparse
+import random
+import threading
+import time
+
+import numpy as np
+
+from backend.alerts import AnomalyPublisher
+from anomaly_listener import AnomalyListener
+from fake_firestore import FakeFirestore
+
+
+def legacy_scan(collection, notify, interval, running):
+    """The old `check_database_anomaly` loop"""
+    while running.is_set():
+        for data in collection.stream():
+            if data.to_dict()["error"]:
+                notify(data.id)
+                collection.document(data.id).set({"error": False})
+        time.sleep(interval)
+
+
+def run_path(name, store, start_path, args):
+    collection = store.collection("anomaly")
+    for idx in range(args.machines):
+        collection.document(f"machine-{idx}").set({"error": False})
+    reads = store.reads
+
+    raised, latencies = dict(), []
+
+    def notify(machine_id):
+        if machine_id in raised:
+            latencies.append(time.time() - raised.pop(machine_id))
+
+    running = threading.Event()
+    running.set()
+    stop = start_path(collection, notify, running)
+    # Loading the collection once when the listener starts is not part of the steady state
+    time.sleep(1)
+    initial_reads = store.reads - reads
+    reads = store.reads
+
+    rng = random.Random(0)
+    start = time.time()
+    while time.time() - start < args.seconds:
+        time.sleep(rng.uniform(0.5, 2 * args.seconds / args.alerts))
+        machine_id = f"machine-{rng.randrange(args.machines)}"
+        raised[machine_id] = time.time()
+        collection.document(machine_id).set({"error": True, "time": time.time()})
+    # Let the slowest path pick up the last alert
+    time.sleep(args.interval + 1)
+    running.clear()
+    stop()
+    elapsed = time.time() - start
+
+    hourly_reads = (store.reads - reads) * 3600 / elapsed
+    print(f"{name:>8}: {len(latencies)} alerts, latency p50 {1000 * np.median(latencies):.0f} ms "
+          f"max {1000 * max(latencies):.0f} ms, {initial_reads} reads at start + {hourly_reads:.0f} reads/hour")
+    return latencies, hourly_reads
+
+
+def replay_predictions(frames, rng):
+    """1 prediction per second: normal printing with a few defects that last a while and some noise"""
+    predictions = np.zeros(frames, dtype=bool)
+    for _ in range(frames // 600):
+        start = rng.randrange(frames)
+        predictions[start:start + rng.randrange(30, 300)] = True
+    noise = np.array([rng.random() < 0.02 for _ in range(frames)])
+    return predictions ^ noise
+
+
+class FlakyCollection:
+    """`collection` whose first `failures` writes raise like an unreachable Firestore"""
+    def __init__(self, collection, failures):
+        self.collection = collection
+        self.failures = failures
+
+    def document(self, doc_id):
+        document = self.collection.document(doc_id)
+        set_document = document.set
+
+        def set(data, merge=False):
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("Firestore is unreachable")
+            set_document(data, merge=merge)
+        document.set = set
+        return document
+
+
+def check_retries(failures):
+    store = FakeFirestore()
+    publisher = AnomalyPublisher(FlakyCollection(store.collection("anomaly"), failures), "machine-0",
+                                 backoff=0.01)
+    publisher.publish(True)
+    deadline = time.time() + 5
+    while publisher.writes < 1 and time.time() < deadline:
+        time.sleep(0.01)
+    assert publisher.thread.is_alive(), "A failed write stopped the publisher"
+    assert store.collection("anomaly").read("machine-0").to_dict()["error"] is True, "The transition was dropped"
+    # The thread is still up for the next transition
+    publisher.publish(False)
+    publisher.close()
+    assert store.collection("anomaly").read("machine-0").to_dict()["error"] is False
+    print(f"{publisher.failed_writes} failed writes retried, the transitions arrived")
+
+
+def main(args):
+    def start_legacy(collection, notify, running):
+        thread = threading.Thread(target=legacy_scan, args=(collection, notify, args.interval, running),
+                                  daemon=True)
+        thread.start()
+        return lambda: None
+
+    def start_listener(collection, notify, running):
+        def on_anomaly(machine_id):
+            notify(machine_id)
+            collection.document(machine_id).set({"error": False}, merge=True)
+        return AnomalyListener(collection, on_anomaly).start().stop
+
+    latency = args.latency / 1000
+    results = {}
+    threads = [
+        threading.Thread(target=lambda: results.update(
+            legacy=run_path("scan", FakeFirestore(latency), start_legacy, args))),
+        threading.Thread(target=lambda: results.update(
+            listener=run_path("listener", FakeFirestore(latency), start_listener, args)))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    store = FakeFirestore()
+    predictions = replay_predictions(args.frames, random.Random(1))
+    publisher = AnomalyPublisher(store.collection("anomaly"), "machine-0")
+    transitions = 0
+    for anomaly in predictions:
+        # The frames are one second apart, every transition gets written before the next one
+        if publisher.publish(anomaly):
+            transitions += 1
+            while publisher.writes < transitions:
+                time.sleep(0.0001)
+    publisher.close()
+    print(f"{args.frames} frames, {predictions.sum()} anomalous: {predictions.sum()} writes per anomalous frame, "
+          f"{publisher.writes} writes per transition")
+
+    assert max(results["listener"][0]) < 1, "The bot should react within a second"
+    assert results["listener"][1] < results["legacy"][1]
+    assert publisher.writes == np.count_nonzero(np.diff(predictions.astype(int), prepend=0))
+    check_retries(failures=3)
+    print("Alerts OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--alerts", type=int, default=15, help="Alerts raised during --seconds")
+    parser.add_argument("--interval", type=float, default=10, help="Scan interval of the old loop")
+    parser.add_argument("--latency", type=float, default=50, help="ms per Firestore call")
+    parser.add_argument("--frames", type=int, default=3600, help="Predictions in the replayed sequence")
+    main(parser.parse_args())
@@ -0,0 +1,150 @@
+"""Compare the old serial push loop of the LINE bot with `NotificationDispatcher`.
+
+    $ PYTHONPATH=linebot:tools python tools/bench_dispatcher.py --machines 50 --users 1000 --latency 80
+
+Every one of `--machines` machines fails at once and each has `--users` subscribers.
+Messages go to `tools/fake_line_api.py` (`--latency` ms per request, 429 above `--rate`
+requests per second, 500 for a `--failures` share) and the flags to a
+`tools/fake_firestore.py` store. The old loop sends one push per user and writes the flag
+once per user, it runs for `--legacy-users` users and is extrapolated since it is
+serial. The dispatcher gets every alert twice, each user must get exactly one message
+and each flag one write. A machine whose alert reached nobody must keep its flag.
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+import requests
+
+from dispatcher import NotificationDispatcher
+from fake_firestore import FakeFirestore
+from fake_line_api import start_api
+
+
+class ApiError(Exception):
+    # Like `LineBotApiError` of the SDK
+    def __init__(self, status_code, message):
+        super(ApiError, self).__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+class MessagingClient:
+    """The two calls of `LineBotApi` the bot uses, one session per thread"""
+    def __init__(self, url):
+        self.url = url
+        self.local = threading.local()
+
+    def post(self, path, body):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        response = self.local.session.post(self.url + path, json=body, timeout=10)
+        if response.status_code != 200:
+            raise ApiError(response.status_code, response.json().get("message"))
+
+    def push_message(self, user_id, text):
+        self.post("/v2/bot/message/push", {"to": user_id, "messages": [{"type": "text", "text": text}]})
+
+    def multicast(self, user_ids, text):
+        self.post("/v2/bot/message/multicast", {"to": user_ids, "messages": [{"type": "text", "text": text}]})
+
+
+def legacy_loop(client, subscribers, collection, machine_ids):
+    """The old `check_database_anomaly` body, the flag is written inside the user loop"""
+    for machine_id in machine_ids:
+        for user_id in subscribers[machine_id]:
+            client.push_message(user_id, "Error detected!🆘")
+            collection.document(machine_id).set({"error": False})
+
+
+def check_failed_delivery():
+    """A machine whose alert reached nobody keeps its flag, the next alert resets it"""
+    broken = [True]
+    resets = []
+
+    def send(user_ids, text):
+        if broken[0]:
+            raise ApiError(500, "Internal error")
+
+    kept = 0
+    for ok in (False, True):
+        broken[0] = not ok
+        dispatcher = NotificationDispatcher(send, lambda machine_id: ["user-0", "user-1"], reset=resets.append,
+                                            workers=1, retries=2, backoff=0.001).start()
+        dispatcher.notify("machine-0", "Error detected!🆘")
+        while dispatcher.stats()["pending"]:
+            time.sleep(0.005)
+        # Joins the worker, `reset` has been called once it returns
+        dispatcher.stop()
+        assert resets == (["machine-0"] if ok else []), f"reset {resets} after a {'good' if ok else 'failed'} send"
+        kept += dispatcher.stats()["kept"]
+    assert kept == 1
+    print("Failed send: the flag was kept, the next delivered alert reset it")
+
+
+def main(args):
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    api, _ = asyncio.run_coroutine_threadsafe(start_api(
+        args.port, latency=args.latency / 1000, rate=args.rate, failures=args.failures), loop).result()
+    client = MessagingClient(f"http://127.0.0.1:{args.port}")
+
+    machine_ids = [f"machine-{idx}" for idx in range(args.machines)]
+    subscribers = {machine_id: [f"user-{machine_id}-{idx}" for idx in range(args.users)]
+                   for machine_id in machine_ids}
+    total = args.machines * args.users
+
+    # The old loop has no retries, an error would end the thread
+    api.failures = 0.
+    store = FakeFirestore(latency=args.firestore_latency / 1000)
+    collection = store.collection("anomaly")
+    start = time.perf_counter()
+    legacy_loop(client, {"sample": subscribers[machine_ids[0]][:args.legacy_users]}, collection, ["sample"])
+    elapsed = (time.perf_counter() - start) * total / args.legacy_users
+    print(f"Serial push:  {elapsed:.1f} s for {total} users ({total / elapsed:.0f} users/s, extrapolated "
+          f"from {args.legacy_users} users), {total} flag writes")
+
+    api.received.clear()
+    api.failures = args.failures
+    store = FakeFirestore(latency=args.firestore_latency / 1000)
+    collection = store.collection("anomaly")
+    dispatcher = NotificationDispatcher(
+        client.multicast, subscribers.get,
+        reset=lambda machine_id: collection.document(machine_id).set({"error": False}, merge=True),
+        workers=args.workers, rate=args.rate or 100, backoff=0.05).start()
+    requests_before = api.requests
+    start = time.perf_counter()
+    for machine_id in machine_ids + machine_ids:
+        dispatcher.notify(machine_id, "Error detected!🆘")
+    while dispatcher.stats()["pending"]:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    stats = dispatcher.stats()
+    dispatcher.stop()
+
+    print(f"Dispatcher:   {elapsed:.2f} s for {total} users ({total / elapsed:.0f} users/s), "
+          f"{api.requests - requests_before} requests, {store.writes} flag writes")
+    print(f"  {stats['alerts']} alerts, {stats['coalesced']} coalesced, {stats['batches']} batches, "
+          f"{stats['retries']} retries ({api.rate_limited} rate limited, {api.failed} server errors), "
+          f"{stats['failed']} failed")
+    # Alerts of a machine already done are deduplicated per user instead of coalesced
+    missing = [user_id for users in subscribers.values() for user_id in users if api.received[user_id] == 0]
+    duplicated = [user_id for user_id, count in api.received.items() if count > 1]
+    assert not missing and not duplicated, f"{len(missing)} users missed, {len(duplicated)} got duplicates"
+    assert store.writes == args.machines, "A flag was written more than once"
+    check_failed_delivery()
+    print("Dispatcher OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type=int, default=50)
+    parser.add_argument("--users", type=int, default=1000, help="Subscribers per machine")
+    parser.add_argument("--latency", type=float, default=80, help="ms per messaging API request")
+    parser.add_argument("--firestore-latency", type=float, default=30, help="ms per Firestore write")
+    parser.add_argument("--rate", type=int, default=100, help="Messaging API requests per second")
+    parser.add_argument("--failures", type=float, default=0.05, help="Share of requests failing with 500")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--legacy-users", type=int, default=100)
+    parser.add_argument("--port", type=int, default=6800)
+    main(parser.parse_args())
@@ -0,0 +1,67 @@
+"""Compare `RandomForestRegressor.predict` with the compiled `ForestEvaluator`.
+
+    $ PYTHONPATH=. python tools/bench_forest.py --batch 1000000
+
+Fits a forest like `weights/material_cls` (100 trees, 3 outputs, `n_jobs=-1`, a few dozen
+training rows) and times one row, what the Material tab asks on every edit, and a batch
+of `--batch` rows. The shipped `weights/material_forest` is timed on one row as well.
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from backend.forest import compile_forest, ForestEvaluator, load_forest
+from check_forest import material_rows
+
+weight_path = Path(__file__).resolve().parent.parent / "weights"
+
+
+def latency(function, repeats):
+    function()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return 1e6 * np.percentile(samples, 50), 1e6 * np.percentile(samples, 99)
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    X = material_rows(rng, args.samples)
+    y = np.stack([X[:, 0] * 100 + X[:, 4], X[:, 3] / 10 + X[:, 8] * 5, X[:, 2] / 3 - X[:, 10]], axis=1)
+    y += rng.normal(scale=0.5, size=y.shape)
+    model = RandomForestRegressor(n_estimators=100, n_jobs=-1, random_state=0).fit(X, y)
+    evaluator = ForestEvaluator(**compile_forest(model))
+    print(f"Forest: {evaluator.n_trees} trees, {len(evaluator.value)} leaves")
+
+    row = material_rows(rng, 1)
+    print("One row (p50 / p99):")
+    for name, function in (("model.predict, n_jobs=-1", lambda: model.predict(row)),
+                           ("model.predict, n_jobs=1", lambda: model.set_params(n_jobs=1).predict(row)),
+                           ("ForestEvaluator", lambda: evaluator.predict(row))):
+        p50, p99 = latency(function, args.repeats)
+        print(f"  {name:26s} {p50:9.1f} us {p99:9.1f} us")
+    model.set_params(n_jobs=-1)
+    shipped = load_forest(weight_path / "material_forest")
+    p50, p99 = latency(lambda: shipped.predict(row), args.repeats)
+    print(f"  {'weights/material_forest':26s} {p50:9.1f} us {p99:9.1f} us")
+
+    rows = material_rows(rng, args.batch)
+    print(f"{args.batch} rows:")
+    for name, function in (("model.predict, n_jobs=-1", model.predict), ("ForestEvaluator", evaluator.predict)):
+        start = time.perf_counter()
+        function(rows)
+        elapsed = time.perf_counter() - start
+        print(f"  {name:26s} {elapsed:9.2f} s  {args.batch / elapsed / 1e6:6.2f} M rows/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=50, help="Training rows, the material dataset is small")
+    parser.add_argument("--batch", type=int, default=1000000)
+    parser.add_argument("--repeats", type=int, default=200)
+    main(parser.parse_args())
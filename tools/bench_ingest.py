@@ -0,0 +1,159 @@
+"""Receive N camera streams with one `VideoWorkerThread` per stream (the old way) and
+with `IngestManager`, and compare the CPU time of the receiving process.
+
+    $ PYTHONPATH=. python tools/bench_ingest.py --streams 8 --fps 10 --seconds 10
+
+The senders run in another process and replay pre-encoded synthetic JPEGs, so only the
+receiving side is measured. The old way decodes, resizes, draws the FPS overlay and
+converts to RGB every frame of every stream. With the ingest manager one stream is shown
+at `--display-fps` and every stream is inferred once per second, the rest is never decoded.
+"""
+import argparse
+import multiprocessing
+import socket
+import threading
+import time
+
+import cv2
+import imutils
+
+from backend.streaming import IngestManager
+from benchmark import synthetic_jpegs
+from frame_transport import FrameConnection, FrameReceiver, decode_frame
+
+
+def serve_camera(listener, jpegs, fps):
+    while True:
+        connect, _ = listener.accept()
+        threading.Thread(target=send_frames, args=(connect, jpegs, fps), daemon=True).start()
+
+
+def send_frames(connect, jpegs, fps):
+    try:
+        connection = FrameConnection(connect)
+        index = 0
+        while True:
+            connection.wait_ready()
+            connection.send(jpegs[index % len(jpegs)])
+            index += 1
+            time.sleep(1 / fps)
+    except OSError:
+        connect.close()
+
+
+def run_senders(num_streams, fps, width, height, ports):
+    jpegs = synthetic_jpegs(16, height, width)
+    listeners = []
+    for _ in range(num_streams):
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(2)
+        listeners.append(listener)
+        threading.Thread(target=serve_camera, args=(listener, jpegs, fps), daemon=True).start()
+    for listener in listeners:
+        ports.put(listener.getsockname()[1])
+    while True:
+        time.sleep(1)
+
+
+def per_stream_threads(ports, seconds):
+    """One thread per stream, everything done on every frame like `VideoWorkerThread` used to"""
+    running = [True]
+    counts = []
+
+    def receive(port, index):
+        connect = socket.create_connection(("127.0.0.1", port))
+        connect.settimeout(5)
+        receiver = FrameReceiver(connect)
+        while running[0]:
+            frame = decode_frame(receiver.recv_frame())
+            if frame.shape[1] > 640:
+                frame = imutils.resize(frame, width=640)
+            frame = cv2.putText(frame, "FPS: 10", (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            counts[index] += 1
+        connect.close()
+
+    threads = []
+    for index, port in enumerate(ports):
+        counts.append(0)
+        threads.append(threading.Thread(target=receive, args=(port, index), daemon=True))
+    start = time.process_time()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    cpu = time.process_time() - start
+    running[0] = False
+    return cpu, {"received": sum(counts), "decoded": sum(counts)}
+
+
+def ingest_manager(ports, seconds, workers, display_fps):
+    ingest = IngestManager(workers=workers).start()
+    streams = [ingest.open(f"printer-{index}", "127.0.0.1", port) for index, port in enumerate(ports)]
+    running = [True]
+
+    def display(stream):
+        sequence = 0
+        while running[0]:
+            time.sleep(1 / display_fps)
+            latest = stream.frame(after=sequence, timeout=1)
+            if latest is not None:
+                sequence = latest[0]
+                frame = cv2.cvtColor(latest[2], cv2.COLOR_BGR2RGB)
+                cv2.putText(frame, "FPS: 10", (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+
+    def infer():
+        while running[0]:
+            time.sleep(1)
+            for stream in streams:
+                stream.frame(timeout=1)
+
+    start = time.process_time()
+    threads = [threading.Thread(target=display, args=(streams[0],), daemon=True),
+               threading.Thread(target=infer, daemon=True)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    cpu = time.process_time() - start
+    running[0] = False
+    stats = ingest.stats()
+    ingest.stop()
+    return cpu, stats
+
+
+def main(args):
+    context = multiprocessing.get_context("spawn")
+    ports = context.Queue()
+    sender = context.Process(target=run_senders, args=(args.streams, args.fps, args.width, args.height, ports),
+                             daemon=True)
+    sender.start()
+    ports = [ports.get() for _ in range(args.streams)]
+
+    old_cpu, old = per_stream_threads(ports, args.seconds)
+    new_cpu, stats = ingest_manager(ports, args.seconds, args.workers, args.display_fps)
+    sender.terminate()
+
+    print(f"{args.streams} streams at {args.fps} fps, {args.width}x{args.height}, {args.seconds} s")
+    print(f"  thread per stream: {old_cpu:.2f} s CPU, {old['received']} frames received, {old['decoded']} decoded")
+    received = sum(row["received"] for row in stats.values())
+    decoded = sum(row["decoded"] for row in stats.values())
+    print(f"     ingest manager: {new_cpu:.2f} s CPU, {received} frames received, {decoded} decoded "
+          f"on {args.workers} worker(s), CPU saved {1 - new_cpu / old_cpu:.0%}")
+    for name, row in stats.items():
+        latency = "-" if row["latency_ms"] is None else f"{row['latency_ms']:.1f} ms"
+        print(f"    {name}: {row['fps']:.1f} fps, latency {latency}, decoded {row['decoded']} "
+              f"skipped {row['skipped']}, reconnects {row['reconnects']}")
+    assert all(row["connected"] and row["received"] > 0 for row in stats.values()), "A stream got no frames"
+    print("Ingest OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--fps", type=float, default=10)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--display-fps", type=float, default=15)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    main(parser.parse_args())
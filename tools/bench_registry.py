@@ -0,0 +1,112 @@
+"""Compare the old full scan of the `machines` collection with `MachineRegistry` lookups.
+
+    $ PYTHONPATH=. python tools/bench_registry.py --machines 10000 --latency 50
+
+Runs against a `tools/fake_firestore.py` store with `--latency` ms per call. The old login
+and LINE bot checks stream the whole collection for every attempt, the registry loads it
+once and answers from memory. Checks that added and removed machines reach the registry
+through the listener and through the TTL reload, and that only exact ids match.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from fake_firestore import FakeFirestore
+from machine_registry import MachineRegistry
+
+
+def legacy_check(machine_id, collection):
+    """The old `check_in_db` of the login dialog"""
+    for data in collection.stream():
+        if machine_id == data.to_dict()["id"]:
+            return True
+    return False
+
+
+def percentiles(samples):
+    samples = 1e6 * np.asarray(samples)
+    return f"p50 {np.percentile(samples, 50):.1f} us, p99 {np.percentile(samples, 99):.1f} us"
+
+
+def wait_for(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def main(args):
+    store = FakeFirestore()
+    collection = store.collection("machines")
+    for idx in range(args.machines):
+        collection.document(f"doc-{idx}").set({"id": f"machine-{idx:05d}"})
+    store.latency = args.latency / 1000
+    rng = random.Random(0)
+    queries = [f"machine-{rng.randrange(2 * args.machines):05d}" for _ in range(args.lookups)]
+
+    reads = store.reads
+    legacy = []
+    for machine_id in queries[:args.legacy_lookups]:
+        start = time.perf_counter()
+        legacy_check(machine_id, collection)
+        legacy.append(time.perf_counter() - start)
+    legacy_reads = (store.reads - reads) / len(legacy)
+    print(f"Full scan:  {percentiles(legacy)}, {legacy_reads:.0f} document reads per lookup")
+
+    reads = store.reads
+    start = time.perf_counter()
+    registry = MachineRegistry(collection).start()
+    registry.ready.wait()
+    loaded = time.perf_counter() - start
+    initial_reads = store.reads - reads
+    assert registry.contains(queries[0]) == legacy_check(queries[0], collection)
+
+    reads = store.reads
+    timings = []
+    for machine_id in queries:
+        start = time.perf_counter()
+        found = registry.contains(machine_id)
+        timings.append(time.perf_counter() - start)
+        assert found == (int(machine_id.split("-")[1]) < args.machines)
+    print(f"Registry:   {percentiles(timings)}, {store.reads - reads} document reads for "
+          f"{len(queries)} lookups, loaded in {1000 * loaded:.0f} ms with {initial_reads} reads")
+    print(f"Speedup:    {np.median(legacy) / np.median(timings):.0f}x at the median")
+
+    # Exact ids only, the LINE bot used to accept any part of an id
+    assert registry.contains("machine-00001") and not registry.contains("machine-0000")
+    assert not registry.contains("00001") and not registry.contains("")
+
+    store.latency = 0.
+    collection.document("doc-new").set({"id": "machine-new"})
+    assert wait_for(lambda: registry.contains("machine-new")), "An added machine did not arrive"
+    collection.document("doc-0").delete()
+    assert wait_for(lambda: not registry.contains("machine-00000")), "A removed machine is still found"
+    collection.document("doc-1").set({"id": "machine-renamed"})
+    assert wait_for(lambda: registry.contains("machine-renamed") and not registry.contains("machine-00001"))
+    print(f"Listener:   {registry.changes} changes applied, additions, removals and renames OK")
+    registry.stop()
+
+    now = [0.]
+    polled = MachineRegistry(collection, listen=False, ttl=60, clock=lambda: now[0]).start()
+    assert polled.contains("machine-new")
+    collection.document("doc-ttl").set({"id": "machine-ttl"})
+    assert not polled.contains("machine-ttl"), "Reloaded before the TTL"
+    now[0] = 61
+    # The expired lookup still answers from the old ids and reloads in the background
+    polled.contains("machine-ttl")
+    assert wait_for(lambda: polled.contains("machine-ttl")), "The TTL reload did not happen"
+    print(f"TTL mode:   {polled.reloads} reloads, new machines found after the TTL")
+    print("Registry OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=50, help="ms per Firestore call")
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--legacy-lookups", type=int, default=20, help="The full scan is slow, fewer samples")
+    main(parser.parse_args())
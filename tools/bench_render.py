@@ -0,0 +1,127 @@
+"""Time the GUI thread work per shown frame before and after `render_frame`, and check that
+a camera faster than the GUI does not pile images up in the Qt event queue, and that
+frames which do not decode are skipped without stopping the monitor.
+
+    $ QT_QPA_PLATFORM=offscreen PYTHONPATH=. python tools/bench_render.py --width 1280 --height 720
+
+before: worker `imutils.resize` + `putText` + `cvtColor`, GUI `QImage` + `fromImage` + `scaled`
+ after: worker `render_frame` (one resize to the label), GUI `fromImage` only
+"""
+import argparse
+import time
+
+import cv2
+import imutils
+import numpy as np
+from PyQt5 import QtWidgets
+from PyQt5.QtGui import QImage, QPixmap
+
+from backend.streaming import FrameSlot
+from backend.threads.video_thread import VideoWorkerThread, render_frame
+from benchmark import printer_scene
+
+
+def time_calls(function, frames, repeat):
+    start = time.perf_counter()
+    for idx in range(repeat):
+        function(frames[idx % len(frames)])
+    return 1000 * (time.perf_counter() - start) / repeat
+
+
+class FloodStream:
+    """`CameraStream` stand-in with a new frame every `1 / fps` seconds, every
+    `corrupt_every`-th of them does not decode"""
+    def __init__(self, frames, fps, corrupt_every=0):
+        self.frames = frames
+        self.interval = 1 / fps
+        self.corrupt_every = corrupt_every
+        self.start = time.monotonic()
+
+    def frame(self, after=0, timeout=None):
+        sequence = int((time.monotonic() - self.start) / self.interval) + 1
+        if sequence <= after:
+            time.sleep(self.interval)
+            sequence = after + 1
+        if self.corrupt_every and sequence % self.corrupt_every == 0:
+            return sequence, time.time(), None
+        return sequence, time.time(), self.frames[sequence % len(self.frames)]
+
+    def stats(self):
+        return {"fps": 1 / self.interval, "error": None}
+
+
+def flood(app, label, frames, fps, gui_delay, seconds, corrupt_every=0):
+    """Run the worker against a camera faster than a GUI that takes `gui_delay` per image"""
+    parent = type("Tab", (), {"thread_is_running": True})()
+    worker = VideoWorkerThread(parent, FloodStream(frames, fps, corrupt_every), FrameSlot(),
+                               target_size=(label.width(), label.height()), max_fps=fps)
+    shown = [0]
+    worker.failures = []
+    worker.failed.connect(worker.failures.append)
+
+    def show(image):
+        label.setPixmap(QPixmap.fromImage(image))
+        time.sleep(gui_delay)
+        shown[0] += 1
+        worker.shown()
+
+    worker.image_ready.connect(show)
+    worker.start()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        app.processEvents()
+    parent.thread_is_running = False
+    worker.wait()
+    app.processEvents()
+    return worker, shown[0]
+
+
+def main(args):
+    app = QtWidgets.QApplication([])
+    label = QtWidgets.QLabel()
+    label.setFixedSize(args.label, args.label)
+    rng = np.random.default_rng(0)
+    frames = [printer_scene(rng, args.height, args.width, index) for index in range(8)]
+
+    def old_worker(frame):
+        if frame.shape[1] > 640:
+            frame = imutils.resize(frame, width=640)
+        frame = cv2.putText(frame.copy(), "FPS: 30", (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def old_gui(frame):
+        image = QImage(frame, frame.shape[1], frame.shape[0], frame.shape[1] * 3, QImage.Format_RGB888)
+        label.setPixmap(QPixmap.fromImage(image).scaled(label.width(), label.height()))
+
+    size = (label.width(), label.height())
+    rendered = [render_frame(frame, size, "FPS: 30") for frame in frames]
+    old_frames = [old_worker(frame) for frame in frames]
+
+    print(f"{args.width}x{args.height} frames into a {args.label}x{args.label} label, ms per frame")
+    print(f"  before: worker {time_calls(old_worker, frames, args.repeat):.2f}, "
+          f"GUI thread {time_calls(old_gui, old_frames, args.repeat):.2f}")
+    print(f"   after: worker {time_calls(lambda frame: render_frame(frame, size, 'FPS: 30'), frames, args.repeat):.2f}, "
+          f"GUI thread {time_calls(lambda image: label.setPixmap(QPixmap.fromImage(image)), rendered, args.repeat):.2f}")
+
+    worker, shown = flood(app, label, frames, args.camera_fps, args.gui_delay, args.seconds)
+    print(f"{args.camera_fps} fps camera, GUI taking {1000 * args.gui_delay:.0f} ms per image: "
+          f"{worker.rendered} rendered, {shown} shown, {worker.dropped} dropped in the worker")
+    assert worker.rendered - shown <= 1, "Images piled up in the event queue"
+
+    worker, shown = flood(app, label, frames, 30, 0., 1, corrupt_every=5)
+    print(f"every 5th frame corrupt: {worker.corrupt} skipped, {shown} shown, failures {worker.failures}")
+    assert worker.corrupt > 0 and shown > worker.corrupt and not worker.failures, \
+        "A corrupt frame stopped the monitor"
+    print("Render OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--label", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--camera-fps", type=float, default=60)
+    parser.add_argument("--gui-delay", type=float, default=0.05, help="Seconds the GUI takes per image")
+    parser.add_argument("--seconds", type=float, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,96 @@
+"""Loopback benchmark of the camera transport: the old `recv_all` loop against
+`FrameReceiver` with the legacy framing and with the streaming protocol.
+
+    $ PYTHONPATH=. python tools/bench_transport.py --frames 2000 --width 640 --height 480
+
+`copied/frame` counts the bytes copied in user space after the kernel wrote them into
+a Python buffer, the kernel copy itself is the same for every transport.
+"""
+import argparse
+import socket
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from frame_transport import FrameConnection, FrameReceiver
+
+
+def recv_all_counted(connect, count, copied):
+    """`VideoWorkerThread.recv_all` before the streaming protocol, counting its copies"""
+    buffer = b""
+    while count:
+        new_buffer = connect.recv(count)
+        if not new_buffer:
+            return None
+        buffer += new_buffer
+        copied[0] += len(buffer)
+        count -= len(new_buffer)
+    return buffer
+
+
+def serve(listener, payload, num_frames):
+    connect, _ = listener.accept()
+    frame_connection = FrameConnection(connect)
+    for _ in range(num_frames):
+        frame_connection.wait_ready()
+        frame_connection.send(payload)
+    # Wait for the receiver to hang up
+    connect.recv(1)
+    connect.close()
+
+
+def run(mode, payload, num_frames):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    server = threading.Thread(target=serve, args=(listener, payload, num_frames), daemon=True)
+    server.start()
+
+    connect = socket.create_connection(listener.getsockname())
+    copied = [0]
+    # The clock starts at the first frame, a legacy sender waits for the stream hello before it
+    start = None
+    if mode == "recv_all":
+        for idx in range(num_frames):
+            length = recv_all_counted(connect, 16, copied)
+            img_string = recv_all_counted(connect, int(length), copied)
+            # `np.fromstring` copies the whole JPEG once more
+            frame = np.frombuffer(img_string, dtype="uint8").copy()
+            copied[0] += frame.nbytes
+            if idx != num_frames - 1:
+                connect.send(b"get")
+            if start is None:
+                start, copied[0] = time.perf_counter(), 0
+    else:
+        receiver = FrameReceiver(connect, streaming=mode == "stream")
+        for _ in range(num_frames):
+            frame = np.frombuffer(receiver.recv_frame().payload, dtype=np.uint8)
+            if start is None:
+                start = time.perf_counter()
+    elapsed = time.perf_counter() - start
+
+    connect.close()
+    server.join()
+    listener.close()
+    return (num_frames - 1) / elapsed, copied[0] / (num_frames - 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--quality", type=int, default=90)
+    args = parser.parse_args()
+
+    # Noise compresses badly, which gives a pessimistic (big) JPEG
+    image = cv2.GaussianBlur(
+        np.random.randint(0, 256, (args.height, args.width, 3), dtype=np.uint8), (0, 0), 1)
+    payload = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, args.quality])[1].tobytes()
+    print(f"{len(payload) / 1024:.1f} KB per frame, {args.frames} frames")
+
+    for mode in ["recv_all", "legacy", "stream"]:
+        fps, copied = run(mode, payload, args.frames)
+        print(f"{mode:>8}: {fps:8.1f} frames/s, {copied / 1024:8.1f} KB copied/frame")
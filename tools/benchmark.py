@@ -0,0 +1,223 @@
+"""End-to-end benchmark of the monitor pipeline for every engine and batch size.
+
+    $ PYTHONPATH=. python tools/benchmark.py --backends onnx torchscript --batch-sizes 1 4 8 --output bench.json
+    $ PYTHONPATH=. python tools/benchmark.py --compare bench.json
+
+Each iteration takes `batch size` synthetic camera JPEGs through
+(transport ->) JPEG decode -> preprocess -> inference -> postprocess and times every stage.
+It reports p50/p95/p99 latency per batch, frames per second and the peak RSS of the
+engine. Every engine runs in its own process, so the peak RSS and the torch thread pool
+of one engine do not leak into the next. With `--compare` the p50 latency and
+throughput are compared against an earlier JSON result, e.g. of the previous commit.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import socket
+import subprocess
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from backend.inference.autotune import host_fingerprint
+from backend.inference.decision import anomaly_score
+from backend.inference.engines import available_engines, engine_registry, load_engine
+from backend.inference.preprocess import Preprocessor
+from frame_transport import FrameConnection, FrameReceiver, decode_frame
+
+stages = ["transport", "decode", "preprocess", "inference", "postprocess"]
+
+
+def printer_scene(rng, height=480, width=640, index=0):
+    """Something that compresses like a camera frame: a lit bed, a printed part and sensor noise"""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    frame = np.empty((height, width, 3), dtype=np.float32)
+    frame[...] = (90 + 60 * y / height)[..., None]
+    frame[..., 2] += 30 * x / width
+
+    # The part grows with the frame index, like a print does
+    center = (width // 2, height // 2 + height // 8)
+    radius = width // 8
+    part_height = min(height // 3, 20 + index)
+    cv2.rectangle(frame, (center[0] - radius, center[1] - part_height), (center[0] + radius, center[1]),
+                  (40, 160, 220), -1)
+    cv2.circle(frame, (center[0], center[1] - part_height - 30), 12, (200, 200, 200), -1)
+    frame += rng.normal(0, 4, frame.shape).astype(np.float32)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def synthetic_jpegs(count, height=480, width=640, quality=80, seed=0):
+    rng = np.random.default_rng(seed)
+    jpegs = []
+    for index in range(count):
+        success, jpeg = cv2.imencode(".jpg", printer_scene(rng, height, width, index),
+                                     [cv2.IMWRITE_JPEG_QUALITY, quality])
+        assert success, "Fail to encode the frame"
+        jpegs.append(jpeg.tobytes())
+    return jpegs
+
+
+class LoopbackTransport:
+    """Send every JPEG through the streaming camera protocol over a local socket pair"""
+    def __init__(self, ring_size):
+        self.sender_socket, receiver_socket = socket.socketpair()
+        self.outgoing = []
+        self.ready = threading.Semaphore(0)
+        threading.Thread(target=self.serve, daemon=True).start()
+        # Every frame of a batch has to stay valid until the batch is decoded
+        self.receiver = FrameReceiver(receiver_socket, streaming=True, ring_size=ring_size)
+
+    def serve(self):
+        connection = FrameConnection(self.sender_socket)
+        while True:
+            self.ready.acquire()
+            payload = self.outgoing.pop(0)
+            connection.wait_ready()
+            connection.send(payload)
+
+    def transfer(self, jpeg):
+        self.outgoing.append(jpeg)
+        self.ready.release()
+        return self.receiver.recv_frame()
+
+
+def percentiles(seconds):
+    ms = 1000 * np.asarray(seconds)
+    return {"p50": float(np.percentile(ms, 50)), "p95": float(np.percentile(ms, 95)),
+            "p99": float(np.percentile(ms, 99)), "mean": float(ms.mean())}
+
+
+def run_backend(backend, args):
+    """Benchmark every batch size of one engine, runs in a fresh process"""
+    jpegs = synthetic_jpegs(args.frames, args.height, args.width, args.quality)
+    engine = load_engine(backend, num_threads=args.threads)
+    preprocess = Preprocessor(resize_size=round(args.input_size * 400 / 352), crop_size=args.input_size,
+                              bgr=True, max_batch_size=max(args.batch_sizes))
+    transport = LoopbackTransport(max(args.batch_sizes)) if args.transport else None
+
+    results = []
+    for batch_size in args.batch_sizes:
+        timings = {stage: [] for stage in stages + ["total"]}
+        for iteration in range(args.warmup + args.iterations):
+            batch_jpegs = [jpegs[(iteration * batch_size + idx) % len(jpegs)] for idx in range(batch_size)]
+            times = [time.perf_counter()]
+
+            if transport is not None:
+                received = [transport.transfer(jpeg) for jpeg in batch_jpegs]
+            times.append(time.perf_counter())
+
+            if transport is not None:
+                frames = [decode_frame(frame) for frame in received]
+            else:
+                frames = [cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                          for jpeg in batch_jpegs]
+            times.append(time.perf_counter())
+
+            batch = preprocess.batch(frames)
+            times.append(time.perf_counter())
+
+            logits = engine.predict_batch(batch)
+            times.append(time.perf_counter())
+
+            scores = [anomaly_score(frame_logits) for frame_logits in logits]
+            anomalies = [score > 0.5 for score in scores]
+            times.append(time.perf_counter())
+
+            if iteration < args.warmup:
+                continue
+            for stage, start, end in zip(stages, times[:-1], times[1:]):
+                timings[stage].append(end - start)
+            timings["total"].append(times[-1] - times[0])
+        assert len(anomalies) == batch_size
+
+        total = np.sum(timings["total"])
+        results.append({
+            "backend": backend,
+            "batch_size": batch_size,
+            "latency_ms": percentiles(timings["total"]),
+            "stage_p50_ms": {stage: percentiles(timings[stage])["p50"]
+                             for stage in stages if transport is not None or stage != "transport"},
+            "frames_per_second": batch_size * args.iterations / total
+        })
+
+    # Linux reports kilobytes
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    for row in results:
+        row["peak_rss_mb"] = peak_rss_mb
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    rows = {(row["backend"], row["batch_size"]): row for row in baseline["results"]}
+    if baseline["settings"].get("input_size", 352) != results["settings"]["input_size"]:
+        print(f"input size {baseline['settings'].get('input_size', 352)} -> {results['settings']['input_size']}")
+    print(f"compared with {baseline.get('commit')}:")
+    for row in results["results"]:
+        old = rows.get((row["backend"], row["batch_size"]))
+        if old is None:
+            continue
+        print(f"{row['backend']:>18} batch {row['batch_size']:>2}: "
+              f"p50 {old['latency_ms']['p50']:.1f} -> {row['latency_ms']['p50']:.1f} ms "
+              f"({row['latency_ms']['p50'] / old['latency_ms']['p50'] - 1:+.1%}), "
+              f"{old['frames_per_second']:.1f} -> {row['frames_per_second']:.1f} frames/s")
+
+
+def main(args):
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for backend in args.backends or available_engines():
+        with context.Pool(1) as pool:
+            results += pool.apply(run_backend, (backend, args))
+
+    output = {
+        "commit": git_commit(),
+        "host": host_fingerprint(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "results": results
+    }
+    for row in results:
+        latency = row["latency_ms"]
+        stage_text = " ".join(f"{stage} {ms:.1f}" for stage, ms in row["stage_p50_ms"].items())
+        print(f"{row['backend']:>18} batch {row['batch_size']:>2}: p50 {latency['p50']:7.1f} "
+              f"p95 {latency['p95']:7.1f} p99 {latency['p99']:7.1f} ms, {row['frames_per_second']:6.1f} frames/s, "
+              f"rss {row['peak_rss_mb']:.0f} MB | {stage_text}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(output, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark decode -> preprocess -> inference -> postprocess")
+    parser.add_argument("--backends", nargs="*", choices=list(engine_registry), help="Defaults to every available one")
+    parser.add_argument("--batch-sizes", nargs="*", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads of the engines")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--input-size", type=int, default=352,
+                        help="Model input size, the exported ONNX model takes any size")
+    parser.add_argument("--frames", type=int, default=32, help="Distinct synthetic JPEGs")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--quality", type=int, default=80, help="JPEG quality")
+    parser.add_argument("--transport", action="store_true",
+                        help="Also send the JPEGs through the camera protocol over a local socket")
+    parser.add_argument("--output", help="Save the results as JSON")
+    parser.add_argument("--compare", help="JSON result of an earlier run to compare with")
+    main(parser.parse_args())
@@ -0,0 +1,98 @@
+"""Poll a farm of fake printers (`tools/fake_octoprint.py`) with `FleetPoller`.
+
+    $ PYTHONPATH=. python tools/check_fleet.py --printers 200 --concurrency 32 --latency 50
+
+Some of the printers are unreachable ports, some answer 403 to the API key and some are
+not connected to their board (409 on `/api/printer`). Checks that every other printer
+shows up in the state table, that the unreachable and the refusing ones back off
+instead of being polled every interval without stopping the rest of the fleet, and that
+no more than `--concurrency` printers are polled at the same time.
+"""
+import argparse
+import asyncio
+import time
+
+from async_octoclient import FleetPoller
+from fake_octoprint import start_fleet
+
+
+async def main(args):
+    printers, runners = await start_fleet(
+        args.printers, args.port, latency=args.latency / 1000, jitter=args.latency / 4000)
+    # Nothing listens on these ports
+    dead_hosts = {f"dead-{idx}": f"http://127.0.0.1:{args.port + args.printers + idx}" for idx in range(args.dead)}
+    hosts = {printer.name: url for url, printer in printers.items()}
+    fleet = list(printers.values())
+    forbidden = [printer.name for printer in fleet[:args.forbidden]]
+    disconnected = [printer.name for printer in fleet[args.forbidden:args.forbidden + args.disconnected]]
+    for printer in fleet[:args.forbidden]:
+        printer.api_key = "another key"
+    for printer in fleet[args.forbidden:args.forbidden + args.disconnected]:
+        printer.connected = False
+
+    concurrent, max_concurrent = [0], [0]
+    poller = FleetPoller.from_hosts(
+        {**hosts, **dead_hosts}, interval=args.interval, concurrency=args.concurrency,
+        timeout=2, max_backoff=args.seconds)
+
+    # Count printers in the middle of a poll from the client side
+    def counted(snapshot):
+        async def counted_snapshot(*args, **kwargs):
+            concurrent[0] += 1
+            max_concurrent[0] = max(max_concurrent[0], concurrent[0])
+            try:
+                return await snapshot(*args, **kwargs)
+            finally:
+                concurrent[0] -= 1
+        return counted_snapshot
+    for client in poller.clients.values():
+        client.snapshot = counted(client.snapshot)
+
+    start = time.time()
+    task = asyncio.create_task(poller.run())
+    await asyncio.sleep(args.seconds)
+    assert not task.done() and poller.running, "A failing printer stopped the fleet"
+    poller.stop()
+    task.cancel()
+    elapsed = time.time() - start
+    try:
+        check(args, poller, printers, hosts, dead_hosts, forbidden, disconnected, elapsed, max_concurrent[0])
+    finally:
+        await poller.close()
+        for runner in runners:
+            await runner.cleanup()
+
+
+def check(args, poller, printers, hosts, dead_hosts, forbidden, disconnected, elapsed, max_concurrent):
+    table = {row["name"]: row for row in poller.table()}
+    live_requests = sum(printer.requests for printer in printers.values())
+    latencies = sorted(poller.state[name]["latency"] for name in hosts if "latency" in poller.state.get(name, dict()))
+    print(f"{len(hosts)} live + {len(dead_hosts)} dead printers polled for {elapsed:.1f} s")
+    print(f"requests to live printers: {live_requests} ({live_requests / elapsed:.0f}/s)")
+    print(f"poll latency p50 {1000 * latencies[len(latencies) // 2]:.0f} ms, "
+          f"max concurrent polls {max_concurrent}")
+    print(f"dead printer failures: {[table[name]['failures'] for name in dead_hosts]}")
+    print(f"forbidden printer failures: {[table[name]['failures'] for name in forbidden]}")
+
+    working = [name for name in hosts if name not in forbidden]
+    assert all(table[name]["online"] for name in working), "Some live printers were never polled"
+    assert not any(table[name]["connected"] for name in disconnected)
+    assert not any(table[name]["online"] for name in [*dead_hosts, *forbidden])
+    assert max_concurrent <= args.concurrency
+    # Without backoff a failing printer would fail about seconds / interval times
+    assert max(table[name]["failures"] for name in [*dead_hosts, *forbidden]) < args.seconds / args.interval
+    print("Fleet OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--printers", type=int, default=200)
+    parser.add_argument("--dead", type=int, default=5)
+    parser.add_argument("--forbidden", type=int, default=3, help="Live printers that refuse the API key")
+    parser.add_argument("--disconnected", type=int, default=3, help="Live printers without a board")
+    parser.add_argument("--port", type=int, default=6000)
+    parser.add_argument("--latency", type=float, default=50, help="ms")
+    parser.add_argument("--interval", type=float, default=1)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=8)
+    asyncio.run(main(parser.parse_args()))
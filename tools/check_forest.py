@@ -0,0 +1,108 @@
+"""Check that the compiled forest of `backend/forest.py` predicts exactly like scikit-learn.
+
+    $ PYTHONPATH=. python tools/check_forest.py
+
+Fits a `RandomForestRegressor` with the Material tab's 11 inputs and 3 outputs, compiles
+it and compares `ForestEvaluator.predict` with `model.predict` bit for bit: on random
+rows, on rows that sit exactly on a split threshold or one float32 step next to it and
+on float64 inputs that round to a threshold in float32. Saving and mapping the arrays
+back must not change anything. The shipped `weights/material_forest` is compared with
+its pickle, through `predict` if this scikit-learn can read it, otherwise with a plain
+tree walk over the pickled nodes.
+"""
+import argparse
+import warnings
+from pathlib import Path
+import tempfile
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from backend.forest import compile_forest, ForestEvaluator, load_forest, load_pickled_forest, save_forest
+
+weight_path = Path(__file__).resolve().parent.parent / "weights"
+
+
+def material_rows(rng, count):
+    """Inputs in the ranges of the Material tab, one-hot infill pattern and material"""
+    numeric = rng.uniform([0.02, 1, 10, 200, 60, 40, 0], [0.2, 10, 90, 250, 80, 120, 100], size=(count, 7))
+    pattern = np.eye(2)[rng.integers(0, 2, count)]
+    material = np.eye(2)[rng.integers(0, 2, count)]
+    return np.hstack([numeric, pattern, material])
+
+
+def edge_rows(model, rng, count):
+    """Rows with one feature on a split threshold, one float32 step around it, or a float64
+    value that only becomes the threshold in float32"""
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    rows = material_rows(rng, count)
+    for row in rows:
+        tree = trees[rng.integers(len(trees))]
+        splits = np.flatnonzero(tree.children_left != -1)
+        node = splits[rng.integers(len(splits))]
+        value = np.float32(tree.threshold[node])
+        row[tree.feature[node]] = rng.choice([
+            tree.threshold[node], value, np.nextafter(value, np.float32(np.inf)),
+            np.nextafter(value, np.float32(-np.inf)), float(value) + 1e-12])
+    return rows
+
+
+def reference_walk(forest, X):
+    """One row and one tree at a time over the pickled nodes, like `Tree.apply`"""
+    X = np.asarray(X, dtype=np.float32)
+    out = np.zeros((len(X), forest.estimators_[0].tree_.value.shape[1]))
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        for idx, row in enumerate(X):
+            node = 0
+            while tree.children_left[node] != -1:
+                node = tree.children_left[node] if row[tree.feature[node]] <= tree.threshold[node] \
+                    else tree.children_right[node]
+            out[idx] += tree.value[node][:, 0]
+    return out / len(forest.estimators_)
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    X = material_rows(rng, args.samples)
+    y = np.stack([X[:, 0] * 100 + X[:, 4], X[:, 3] / 10 + X[:, 8] * 5, X[:, 2] / 3 - X[:, 10]], axis=1)
+    y += rng.normal(scale=0.5, size=y.shape)
+    # One job, several threads add the trees in any order and change the last bits
+    model = RandomForestRegressor(n_estimators=100, n_jobs=1, random_state=0).fit(X, y)
+    evaluator = ForestEvaluator(**compile_forest(model))
+    print(f"Fitted forest: {evaluator.n_trees} trees, {len(evaluator.value)} leaves, {evaluator.words} mask words per tree")
+
+    for name, rows in (("random", material_rows(rng, args.rows)), ("threshold", edge_rows(model, rng, args.rows))):
+        expected = model.predict(rows)
+        assert np.array_equal(evaluator.predict(rows), expected), f"{name} rows differ"
+        assert np.array_equal(evaluator.predict(rows, chunk_size=7), expected), f"{name} rows differ in chunks"
+        assert np.array_equal(evaluator.predict(rows[:1]), model.predict(rows[:1])), f"a single {name} row differs"
+        print(f"  {len(rows)} {name} rows identical to model.predict")
+
+    with tempfile.TemporaryDirectory() as directory:
+        save_forest(compile_forest(model), directory)
+        mapped = load_forest(directory)
+        assert isinstance(mapped.value.base, np.memmap), "The arrays were read instead of mapped"
+        assert np.array_equal(mapped.predict(X), model.predict(X)), "The mapped arrays differ"
+    print("  saved and mapped arrays identical")
+
+    with warnings.catch_warnings():
+        # The pickle is from an older scikit-learn
+        warnings.simplefilter("ignore")
+        shipped = load_pickled_forest(weight_path / "material_cls")
+    compiled = load_forest(weight_path / "material_forest")
+    rows = np.vstack([material_rows(rng, args.rows), edge_rows(shipped, rng, args.rows)])
+    if hasattr(shipped.estimators_[0].tree_, "apply"):
+        expected, against = shipped.predict(rows), "model.predict"
+    else:
+        expected, against = reference_walk(shipped, rows), "a walk over the pickled nodes"
+    assert np.array_equal(compiled.predict(rows), expected), "weights/material_forest differs from its pickle"
+    print(f"  weights/material_forest identical to {against} on {len(rows)} rows")
+    print("Forest OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=200, help="Training rows of the fitted forest, the default grows trees of more than 64 leaves")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows compared per case")
+    main(parser.parse_args())
@@ -0,0 +1,110 @@
+"""Check `FrameSlot` against the old `queue.Queue(maxsize=200)` of `MonitorTab`.
+
+    $ PYTHONPATH=. python tools/check_frame_slot.py --seconds 5
+
+A writer puts frames at camera rate (`--fps`), every frame filled with its own index, and
+a reader takes one per `--predict-interval` like `PredictThread`. With the queue the
+reader gets the oldest queued frame, with the slot always the newest one. The slot run
+also has a second reader copying as fast as it can, which must never see a torn frame.
+"""
+import argparse
+import queue
+import threading
+import time
+
+import numpy as np
+
+from backend.streaming import FrameSlot
+
+
+def writer(put, running, fps, height, width, copy=False):
+    index = 0
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    while running[0]:
+        index += 1
+        frame[...] = index % 256
+        # The queue keeps references, every frame used to be a new array
+        put(frame.copy() if copy else frame, time.time())
+        time.sleep(1 / fps)
+
+
+def run_queue(args):
+    frames = queue.Queue(maxsize=200)
+
+    def put_queue(frame, timestamp):
+        # `MonitorTab.update_video_frames` before the slot
+        try:
+            frames.put_nowait((timestamp, frame))
+        except queue.Full:
+            frames.get_nowait()
+            frames.put_nowait((timestamp, frame))
+
+    running = [True]
+    threading.Thread(target=writer, args=(put_queue, running, args.fps, args.height, args.width, True),
+                     daemon=True).start()
+    ages = []
+    end = time.time() + args.seconds
+    while time.time() < end:
+        time.sleep(args.predict_interval)
+        try:
+            timestamp, _ = frames.get_nowait()
+            ages.append(time.time() - timestamp)
+        except queue.Empty:
+            pass
+    running[0] = False
+    return ages, frames.qsize() * args.height * args.width * 3
+
+
+def run_slot(args):
+    slot = FrameSlot(size=2)
+    running = [True]
+    threading.Thread(target=writer, args=(slot.put, running, args.fps, args.height, args.width), daemon=True).start()
+
+    torn = [0, 0]
+
+    def fast_reader():
+        out, sequence = None, 0
+        while running[0]:
+            latest = slot.latest(out)
+            if latest is None:
+                continue
+            sequence, _, out = latest
+            torn[1] += 1
+            if out.min() != out.max():
+                torn[0] += 1
+
+    threading.Thread(target=fast_reader, daemon=True).start()
+    ages, out, sequence = [], None, 0
+    end = time.time() + args.seconds
+    while time.time() < end:
+        time.sleep(args.predict_interval)
+        latest = slot.latest(out, after=sequence)
+        if latest is not None:
+            sequence, timestamp, out = latest
+            ages.append(time.time() - timestamp)
+    running[0] = False
+    return ages, sum(frame.nbytes for frame in slot.frames), torn, slot.dropped
+
+
+def main(args):
+    queue_ages, queue_bytes = run_queue(args)
+    slot_ages, slot_bytes, (torn, reads), dropped = run_slot(args)
+
+    print(f"{args.fps} fps camera, one prediction every {args.predict_interval} s, {args.seconds} s")
+    print(f"  queue: frame age at inference p50 {np.median(queue_ages):.2f} s max {max(queue_ages):.2f} s, "
+          f"{queue_bytes / 2 ** 20:.1f} MB queued")
+    print(f"   slot: frame age at inference p50 {np.median(slot_ages):.3f} s max {max(slot_ages):.3f} s, "
+          f"{slot_bytes / 2 ** 20:.1f} MB, {dropped} frames never read, {torn} torn of {reads} fast reads")
+    assert torn == 0, "A reader saw a frame while it was written"
+    assert max(slot_ages) < 2 / args.fps + 0.1, "The slot served a stale frame"
+    print("Frame slot OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--predict-interval", type=float, default=1.)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    main(parser.parse_args())
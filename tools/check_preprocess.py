@@ -0,0 +1,78 @@
+"""Check that `Preprocessor` gives the same model input as the torchvision pipeline
+`MonitorTab.transform` used to have, on random frames of the usual camera sizes, and
+that frames already cropped by `send_image.py` are only normalised (or resized to a
+smaller `crop_size`), while a full frame that happens to be 352x352 is still cropped.
+A region of interest on a cropped frame has to cover the same pixels as on the full frame.
+
+    $ PYTHONPATH=. python tools/check_preprocess.py
+"""
+import cv2
+import numpy as np
+import torch
+from torchvision import transforms
+
+from backend.inference.preprocess import Preprocessor, imagenet_mean, imagenet_std
+
+# The resized pixels are rounded to uint8 before normalising and `cv2.warpAffine`
+#  interpolates at 1/32 pixel, together they stay within one intensity level
+tolerance = 1 / 255 / min(imagenet_std)
+
+
+if __name__ == "__main__":
+    # torchvision 0.12 does not antialias tensors, newer versions need to be told
+    reference = transforms.Compose([
+        transforms.ToTensor(),
+        transforms.Resize((400, 400), antialias=False),
+        transforms.CenterCrop((352, 352)),
+        transforms.Normalize(mean=imagenet_mean, std=imagenet_std),
+        transforms.Lambda(lambda x: x.unsqueeze(0))
+    ])
+    rgb_preprocess = Preprocessor()
+    bgr_preprocess = Preprocessor(bgr=True)
+
+    rng = np.random.default_rng(0)
+    frames = []
+    for height, width in [(480, 640), (720, 1280), (1080, 1920), (400, 400), (300, 200)]:
+        # Blur the noise so the frames look more like a camera than white noise
+        frame = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (0, 0), 1.5)
+        frames.append(frame)
+
+        expected = reference(frame).numpy()
+        rgb_error = np.abs(rgb_preprocess(frame) - expected).max()
+        bgr_error = np.abs(bgr_preprocess(np.ascontiguousarray(frame[..., ::-1])) - expected).max()
+        print(f"{height}x{width}: max abs error rgb {rgb_error:.6f} bgr {bgr_error:.6f}")
+        assert rgb_error <= tolerance and bgr_error <= tolerance
+
+    batch = Preprocessor(max_batch_size=2).batch(frames)
+    expected = torch.cat([reference(frame) for frame in frames]).numpy()
+    batch_error = np.abs(batch - expected).max()
+    print(f"batch of {len(frames)}: max abs error {batch_error:.6f}")
+    assert batch.shape == (len(frames), 3, 352, 352) and batch_error <= tolerance
+
+    cropped = frames[3][24:376, 24:376].copy()
+    normalize = transforms.Normalize(mean=imagenet_mean, std=imagenet_std)
+    expected = normalize(transforms.ToTensor()(cropped)).numpy()
+    precropped = Preprocessor(precropped=["printer"])
+    cropped_error = np.abs(precropped(cropped, "printer")[0] - expected).max()
+    print(f"already cropped 352x352: max abs error {cropped_error:.6f}")
+    assert cropped_error <= 1e-5
+
+    # Only the flag of the stream tells, not the size
+    full_error = np.abs(rgb_preprocess(cropped) - reference(cropped).numpy()).max()
+    print(f"full frame of 352x352: max abs error {full_error:.6f}")
+    assert full_error <= tolerance
+
+    small = Preprocessor(resize_size=round(224 * 400 / 352), crop_size=224, precropped=["printer"])
+    expected = normalize(transforms.Resize((224, 224), antialias=False)(transforms.ToTensor()(cropped))).numpy()
+    small_error = np.abs(small(cropped, "printer")[0] - expected).max()
+    print(f"already cropped 352x352 to 224: max abs error {small_error:.6f}")
+    assert small_error <= tolerance
+
+    roi = {"printer": (0.25, 0.3, 0.5, 0.4)}
+    full = Preprocessor(rois=roi)(frames[3], "printer").copy()
+    mapped = Preprocessor(rois=roi, precropped=["printer"])(cropped, "printer")
+    roi_error = np.abs(full - mapped).max()
+    print(f"region of interest of a cropped frame: max abs error {roi_error:.6f}")
+    # Both sample the same pixels, at most one intensity level apart (plus float32 rounding)
+    assert roi_error <= tolerance + 1e-6
+    print(f"All within {tolerance:.6f}")
@@ -0,0 +1,84 @@
+"""Follow a fake printer (`tools/fake_octoprint.py`) with `PushSubscriber`.
+
+    $ PYTHONPATH=. python tools/check_push.py --port 6500 --push-interval 0.2
+
+Checks that pushed updates keep the state fresh without any REST polling, that a printer
+disconnect shows up as "Closed", that `connected` goes False when the push socket drops
+(so the GUI falls back to polling) and that the subscriber reconnects once the push
+socket is back.
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+from octoclient import OctoClient
+from fake_octoprint import start_fleet
+
+
+def wait_until(condition, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def main(args):
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    def run(coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    printers, runners = run(start_fleet(1, args.port, push_interval=args.push_interval))
+    url, printer = next(iter(printers.items()))
+
+    updates = []
+    subscriber = OctoClient(url, use_cap=False).subscribe(reconnect_delay=args.reconnect_delay)
+    subscriber.add_listener(lambda snapshot: updates.append((time.time(), snapshot)))
+    try:
+        assert wait_until(lambda: len(updates) >= 5, 5), "No pushed updates"
+        requests = printer.requests
+        time.sleep(1)
+        gaps = [later[0] - earlier[0] for earlier, later in zip(updates[-6:], updates[-5:])]
+        print(f"{len(updates)} updates, max gap {1000 * max(gaps):.0f} ms, "
+              f"{printer.requests - requests} REST requests while pushing")
+        assert printer.requests == requests, "The subscriber should not poll"
+        snapshot = updates[-1][1]
+        assert snapshot["connection"]["current"]["state"] != "Closed"
+        assert "actual" in snapshot["printer"]["temperature"]["tool0"]
+        assert snapshot["profile"]["axes"] and snapshot["user"]["name"] == printer.name
+
+        printer.connected = False
+        assert wait_until(
+            lambda: updates[-1][1]["connection"]["current"]["state"] == "Closed", 2), "Disconnect not pushed"
+        printer.connected = True
+        print("printer disconnect pushed")
+
+        printer.push_enabled = False
+        run(printer.drop_sockets())
+        assert wait_until(lambda: not subscriber.connected, 2), "Dropped socket not noticed"
+        print("socket dropped, falling back to polling")
+
+        printer.push_enabled = True
+        start = time.time()
+        assert wait_until(lambda: subscriber.connected, args.reconnect_delay + 3), "No reconnect"
+        count = len(updates)
+        assert wait_until(lambda: len(updates) > count, 2), "No updates after reconnecting"
+        print(f"reconnected after {time.time() - start:.1f} s")
+        print("Push OK")
+    finally:
+        subscriber.stop()
+        for runner in runners:
+            run(runner.cleanup())
+        loop.call_soon_threadsafe(loop.stop)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=6500)
+    parser.add_argument("--push-interval", type=float, default=0.2)
+    parser.add_argument("--reconnect-delay", type=float, default=1)
+    main(parser.parse_args())
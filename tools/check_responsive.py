@@ -0,0 +1,92 @@
+"""Check that the GUI stays responsive while OctoPrint is slow or offline.
+
+    $ QT_QPA_PLATFORM=offscreen PYTHONPATH=. python tools/check_responsive.py --latency 1.5
+
+Builds the status, file and monitor tabs against a fake printer (`tools/fake_octoprint.py`)
+that takes `--latency` seconds per request, then against a port nobody listens on, and
+measures the longest stall of the Qt event loop with a 10 ms heartbeat timer. Every
+OctoPrint call runs on the thread pool, so no stall may come near the request latency.
+"""
+import argparse
+import asyncio
+import socket
+import threading
+import time
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QTimer
+
+from backend.tab_widgets import FileTab, StateTab
+from octoclient import OctoClient
+from fake_octoprint import start_fleet
+
+
+class Heartbeat:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.last = time.monotonic()
+        self.max_stall = 0.
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.beat)
+        self.timer.start(int(interval * 1000))
+
+    def beat(self):
+        now = time.monotonic()
+        self.max_stall = max(self.max_stall, now - self.last - self.interval)
+        self.last = now
+
+
+def spin(app, seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def run(app, url, seconds, state_ready):
+    octo = OctoClient(url, use_cap=False, timeout=3)
+    heartbeat = Heartbeat()
+    start = time.monotonic()
+    state_tab = StateTab(None, octo)
+    file_tab = FileTab(None, octo)
+    built = time.monotonic() - start
+
+    heartbeat.last = time.monotonic()
+    spin(app, seconds)
+    state_tab.check_thread = False
+    print(f"  tabs built in {1000 * built:.0f} ms, longest event loop stall {1000 * heartbeat.max_stall:.0f} ms, "
+          f"state '{state_tab.connected_state.text()}', {file_tab.list_view.count()} file item(s)")
+    assert state_ready(state_tab, file_tab), "The results did not reach the widgets"
+    return built, heartbeat.max_stall
+
+
+def main(args):
+    app = QtWidgets.QApplication([])
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    printers, _ = asyncio.run_coroutine_threadsafe(
+        start_fleet(1, args.port, latency=args.latency), loop).result()
+    url = next(iter(printers))
+
+    print(f"OctoPrint answering in {args.latency} s")
+    built, stall = run(app, url, args.seconds, lambda state_tab, file_tab:
+                       state_tab.connected_state.text().startswith("Connected") and file_tab.list_view.count() > 0)
+    assert built < args.latency / 2 and stall < args.latency / 2, "The GUI waited for OctoPrint"
+
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    offline_port = listener.getsockname()[1]
+    listener.close()
+    print("OctoPrint offline")
+    built, stall = run(app, f"http://127.0.0.1:{offline_port}", 2, lambda state_tab, file_tab:
+                       state_tab.connected_state.text().startswith("Closed") and file_tab.list_view.count() == 1)
+    assert built < 0.5 and stall < 0.5, "The GUI waited for OctoPrint"
+    print("Responsive OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=1.5, help="Seconds per OctoPrint request")
+    parser.add_argument("--seconds", type=float, default=6, help="How long to watch the event loop")
+    parser.add_argument("--port", type=int, default=6700)
+    main(parser.parse_args())
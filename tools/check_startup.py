@@ -0,0 +1,147 @@
+"""Measure the start up of the desktop app and fail if it regresses.
+
+    $ QT_QPA_PLATFORM=offscreen PYTHONPATH=.:tools python tools/check_startup.py --budget 1.0
+
+Runs the real `MainWindow` against a fake printer (`tools/fake_octoprint.py`) and a
+`tools/fake_firestore.py` store that takes `--firebase-delay` seconds to come up, and logs
+in like a user who needs `--typing` seconds for the dialog. Reports the time to the login
+dialog, from the login click to the interactive main window, until every background step
+is done and the longest stall of the event loop. Fails if the window takes longer than
+`--budget` seconds after the click, the event loop stalls longer than that, a tab
+other than the shown one was built before it was opened, or importing `backend.main`
+imported OpenCV, a model runtime or firebase_admin.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+START = time.monotonic()
+
+# None of these may be imported before the login, the start up steps load them in the background
+heavy_modules = ("torch", "torchvision", "timm", "onnxruntime", "joblib", "cv2", "imutils", "firebase_admin")
+
+from PyQt5 import QtWidgets  # noqa: E402
+from PyQt5.QtCore import QTimer  # noqa: E402
+
+from fake_firestore import FakeFirestore  # noqa: E402
+from fake_octoprint import start_fleet  # noqa: E402
+
+
+class Heartbeat:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.last = time.monotonic()
+        self.max_stall = 0.
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.beat)
+        self.timer.start(int(interval * 1000))
+
+    def beat(self):
+        now = time.monotonic()
+        self.max_stall = max(self.max_stall, now - self.last - self.interval)
+        self.last = now
+
+
+class User:
+    """Fill in the login dialog `typing` seconds after it shows up and click Login"""
+    def __init__(self, machine_id, typing):
+        self.machine_id = machine_id
+        self.typing = typing
+        self.dialog_shown = None
+        self.clicked = None
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.poll)
+        self.timer.start(5)
+
+    def poll(self):
+        from backend.login import Login
+
+        dialog = QtWidgets.QApplication.activeModalWidget()
+        if not isinstance(dialog, Login):
+            return
+        if self.dialog_shown is None:
+            self.dialog_shown = time.monotonic()
+        if time.monotonic() - self.dialog_shown < self.typing or dialog.machine_registry is None:
+            return
+        self.timer.stop()
+        dialog.acc_edit.setText("startup-check")
+        dialog.pwd_edit.setText("secret")
+        dialog.machine_edit.setText(self.machine_id)
+        self.clicked = time.monotonic()
+        dialog.buttonLogin.click()
+
+
+def main(args):
+    os.environ["startup-check"] = "secret"
+    app = QtWidgets.QApplication([])
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    printers, _ = asyncio.run_coroutine_threadsafe(
+        start_fleet(1, args.port, latency=args.latency / 1000), loop).result()
+
+    store = FakeFirestore()
+    store.collection("machines").document("printer").set({"id": "machine-1"})
+
+    def firebase():
+        time.sleep(args.firebase_delay)
+        return store
+
+    from octoclient import OctoClient
+    from backend.main import MainWindow
+    from backend.threads import task_pool
+    imported = [name for name in heavy_modules if name in sys.modules]
+
+    heartbeat = Heartbeat()
+    user = User("machine-1", args.typing)
+    window = MainWindow(octo=OctoClient(next(iter(printers)), use_cap=False), firebase=firebase)
+    app.processEvents()
+    interactive = time.monotonic()
+    tabs = window.main_widget
+    built_early = [name for name in ("file_tab", "monitor_tab", "material_tab") if getattr(tabs, name) is not None]
+
+    while not window.startup.finished and time.monotonic() - START < 120:
+        app.processEvents()
+        time.sleep(0.002)
+    ready = time.monotonic()
+
+    print(f"Login dialog after {user.dialog_shown - START:.2f} s (imports included)")
+    print(f"Login click -> interactive window: {1000 * (interactive - user.clicked):.0f} ms")
+    print(f"Every background step done after {ready - START:.2f} s, longest event loop stall "
+          f"{1000 * heartbeat.max_stall:.0f} ms")
+    for name in window.startup.steps:
+        outcome = "failed" if name in window.startup.errors else "done"
+        print(f"  {name:9s} {outcome} in {window.startup.durations.get(name, 0):.2f} s, "
+              f"after {window.startup.finished_at[name]:.2f} s")
+
+    build_times = dict()
+    for index in range(tabs.count()):
+        start = time.perf_counter()
+        tabs.setCurrentIndex(index)
+        build_times[tabs.tabText(index)] = time.perf_counter() - start
+        app.processEvents()
+    print("  first view of the tabs: " + ", ".join(f"{name} {1000 * seconds:.0f} ms"
+                                                  for name, seconds in build_times.items()))
+    # Before, every step but the status fetch ran one after the other behind the login
+    serial = sum(window.startup.durations.get(name, 0) for name in ("model", "material")) + sum(build_times.values())
+    print(f"  serial start up after the click would take about {serial:.2f} s")
+
+    window.main_widget.state_tab.check_thread = False
+    task_pool().waitForDone(3000)
+    assert not imported, f"Imported with backend.main: {imported}"
+    assert not built_early, f"Built before they were opened: {built_early}"
+    assert interactive - user.clicked < args.budget, "The main window took too long after the login"
+    assert heartbeat.max_stall < args.budget, "The event loop stalled during the start up"
+    print("Startup OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=1.0, help="Seconds allowed from the click to the window")
+    parser.add_argument("--typing", type=float, default=1.0, help="Seconds the user needs for the login dialog")
+    parser.add_argument("--firebase-delay", type=float, default=1.0, help="Seconds until Firebase is up")
+    parser.add_argument("--latency", type=float, default=50, help="ms per OctoPrint request")
+    parser.add_argument("--port", type=int, default=6900)
+    main(parser.parse_args())
@@ -0,0 +1,109 @@
+"""Check the LINE bot's subscriber store and leader election across worker processes.
+
+    $ PYTHONPATH=linebot python tools/check_subscribers.py --workers 4
+
+Starts `--workers` processes like gunicorn does, each with its own `SubscriberStore` on
+one database and a `LeaderLock`. Subscriptions written by one worker must be seen by
+every other on its next lookup, must survive a restart, and exactly one worker may run
+the alert loop, with another taking over when the leader dies. Also times cached and
+uncached lookups.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from leader_lock import LeaderLock
+from subscriber_store import SubscriberStore
+
+
+def worker(index, database, commands, results):
+    store = SubscriberStore(database)
+    leader = LeaderLock(database + ".leader", on_elected=lambda: results.put(("leader", index)), retry=0.1).start()
+    while True:
+        command = commands.get()
+        if command is None:
+            break
+        name, args = command
+        if name == "subscribe":
+            store.subscribe(*args)
+            results.put(("done", index))
+        elif name == "lookup":
+            results.put((index, store.machine_of(args[0]), store.subscribers(args[1])))
+    leader.stop()
+
+
+def wait_for_leader(results, timeout=5):
+    kind, index = results.get(timeout=timeout)
+    assert kind == "leader", kind
+    return index
+
+
+def main(args):
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, "subscribers.db")
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    queues = [context.Queue() for _ in range(args.workers)]
+    processes = [context.Process(target=worker, args=(idx, database, queues[idx], results), daemon=True)
+                 for idx in range(args.workers)]
+    for process in processes:
+        process.start()
+
+    leader = wait_for_leader(results)
+    time.sleep(1)
+    assert results.empty(), "A second worker became leader"
+    print(f"Worker {leader} of {args.workers} leads the alert loop")
+
+    # Every worker caches an empty answer first, then one worker subscribes
+    for queue in queues:
+        queue.put(("lookup", ("user-a", "machine-1")))
+    assert all(results.get(timeout=5)[1:] == (None, []) for _ in queues)
+    queues[0].put(("subscribe", ("user-a", "machine-1")))
+    queues[-1].put(("subscribe", ("user-b", "machine-1")))
+    assert [results.get(timeout=5)[0] for _ in range(2)] == ["done", "done"]
+    for queue in queues:
+        queue.put(("lookup", ("user-a", "machine-1")))
+    answers = [results.get(timeout=5) for _ in queues]
+    assert all(answer[1] == "machine-1" and sorted(answer[2]) == ["user-a", "user-b"] for answer in answers), answers
+    print("Subscriptions made on one worker are seen by every worker")
+
+    processes[leader].terminate()
+    processes[leader].join()
+    successor = wait_for_leader(results)
+    assert successor != leader
+    print(f"Worker {leader} killed, worker {successor} took over")
+    for idx, queue in enumerate(queues):
+        if idx != leader:
+            queue.put(None)
+    for process in processes:
+        process.join()
+
+    store = SubscriberStore(database)
+    assert store.machine_of("user-a") == "machine-1" and sorted(store.subscribers("machine-1")) == ["user-a", "user-b"]
+    print("Subscriptions survive a restart")
+
+    for idx in range(args.subscribers):
+        store.subscribe(f"user-{idx}", f"machine-{idx % args.machines}")
+    user_ids = [f"user-{idx}" for idx in range(args.subscribers)]
+    for label, reset in (("uncached", True), ("cached", False)):
+        for user_id in user_ids:
+            store.machine_of(user_id)
+        start = time.perf_counter()
+        for user_id in user_ids:
+            if reset:
+                store.machines.clear()
+            store.machine_of(user_id)
+        elapsed = (time.perf_counter() - start) / len(user_ids)
+        print(f"  {label} lookup: {1e6 * elapsed:.1f} us")
+    store.close()
+    print("Subscriber store OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--subscribers", type=int, default=10000)
+    parser.add_argument("--machines", type=int, default=1000)
+    main(parser.parse_args())
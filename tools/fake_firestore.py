@@ -0,0 +1,146 @@
+"""In-memory stand-in for the parts of the Firestore client the app and the LINE bot use.
+
+`FakeFirestore().collection(name)` supports `document(id).set(data, merge=False)`,
+`document(id).get()`, `document(id).delete()`, `stream()` and `on_snapshot(callback)`.
+Listeners are called from their own thread with `(docs, changes, read_time)` like the real client, starting with one
+ADDED change per existing document. `reads` and `writes` count billed document operations
+and `latency` seconds are added to every call that goes over the network.
+"""
+import copy
+import enum
+import queue
+import threading
+import time
+from collections import namedtuple
+
+
+class ChangeType(enum.Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+
+DocumentChange = namedtuple("DocumentChange", ["type", "document"])
+
+
+class DocumentSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self.data)
+
+
+class Watch:
+    def __init__(self, collection, callback):
+        self.collection = collection
+        self.callback = callback
+        self.changes = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            changes = self.changes.get()
+            if changes is None:
+                break
+            self.callback(self.collection.snapshots(), changes, time.time())
+
+    def unsubscribe(self):
+        self.collection.watches.remove(self)
+        self.changes.put(None)
+
+
+class FakeDocument:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+
+    def set(self, data, merge=False):
+        self.collection.write(self.id, data, merge)
+
+    def get(self):
+        return self.collection.read(self.id)
+
+    def delete(self):
+        self.collection.delete(self.id)
+
+
+class FakeCollection:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.documents = dict()
+        self.watches = []
+        self.lock = threading.Lock()
+
+    def document(self, doc_id):
+        return FakeDocument(self, doc_id)
+
+    def write(self, doc_id, data, merge=False):
+        time.sleep(self.client.latency)
+        with self.lock:
+            existing = self.documents.get(doc_id)
+            if merge and existing is not None:
+                data = {**existing, **data}
+            self.documents[doc_id] = copy.deepcopy(data)
+            self.client.writes += 1
+            change = DocumentChange(
+                ChangeType.MODIFIED if existing is not None else ChangeType.ADDED,
+                DocumentSnapshot(doc_id, copy.deepcopy(data)))
+            for watch in self.watches:
+                self.client.reads += 1
+                watch.changes.put([change])
+
+    def delete(self, doc_id):
+        time.sleep(self.client.latency)
+        with self.lock:
+            existing = self.documents.pop(doc_id, None)
+            self.client.writes += 1
+            if existing is None:
+                return
+            change = DocumentChange(ChangeType.REMOVED, DocumentSnapshot(doc_id, existing))
+            for watch in self.watches:
+                self.client.reads += 1
+                watch.changes.put([change])
+
+    def read(self, doc_id):
+        time.sleep(self.client.latency)
+        with self.lock:
+            self.client.reads += 1
+            return DocumentSnapshot(doc_id, copy.deepcopy(self.documents.get(doc_id)))
+
+    def snapshots(self):
+        with self.lock:
+            return [DocumentSnapshot(doc_id, copy.deepcopy(data)) for doc_id, data in self.documents.items()]
+
+    def stream(self):
+        time.sleep(self.client.latency)
+        docs = self.snapshots()
+        self.client.reads += len(docs)
+        return iter(docs)
+
+    def on_snapshot(self, callback):
+        with self.lock:
+            watch = Watch(self, callback)
+            initial = [DocumentChange(ChangeType.ADDED, DocumentSnapshot(doc_id, copy.deepcopy(data)))
+                       for doc_id, data in self.documents.items()]
+            self.client.reads += len(initial)
+            watch.changes.put(initial)
+            self.watches.append(watch)
+        return watch
+
+
+class FakeFirestore:
+    def __init__(self, latency=0.):
+        self.latency = latency
+        self.collections = dict()
+        self.reads = 0
+        self.writes = 0
+
+    def collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self, name)
+        return self.collections[name]
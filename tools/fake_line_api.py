@@ -0,0 +1,93 @@
+"""Local stand-in for the push and multicast endpoints of the LINE Messaging API.
+
+    $ python tools/fake_line_api.py --port 6800 --latency 80 --rate 100 --failures 0.02
+
+Answers `POST /v2/bot/message/push` and `POST /v2/bot/message/multicast` like the real API
+after `--latency` ms, with 429 once more than `--rate` requests arrive within a second and
+with 500 for a `--failures` share of the requests. Rejected requests deliver nothing.
+`received` counts the messages each user got, so a client can check for lost and
+duplicated messages.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+class FakeLineApi:
+    def __init__(self, latency=0., rate=None, failures=0., max_recipients=500):
+        self.latency = latency
+        self.rate = rate
+        self.failures = failures
+        self.max_recipients = max_recipients
+        self.received = Counter()
+        self.requests = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.window = (0, 0)
+
+    def limited(self):
+        second = int(time.monotonic())
+        start, count = self.window
+        count = count + 1 if start == second else 1
+        self.window = (second, count)
+        return self.rate is not None and count > self.rate
+
+    async def deliver(self, recipients):
+        self.requests += 1
+        if self.limited():
+            self.rate_limited += 1
+            return web.json_response({"message": "The API rate limit has been exceeded. Try again later."},
+                                     status=429)
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failures:
+            self.failed += 1
+            return web.json_response({"message": "Internal server error"}, status=500)
+        if not recipients or len(recipients) > self.max_recipients:
+            return web.json_response({"message": "The request body has 1 error(s)"}, status=400)
+        self.received.update(recipients)
+        return web.json_response({})
+
+    async def push(self, request):
+        body = await request.json()
+        return await self.deliver([body["to"]])
+
+    async def multicast(self, request):
+        body = await request.json()
+        return await self.deliver(body["to"])
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/v2/bot/message/push", self.push)
+        app.router.add_post("/v2/bot/message/multicast", self.multicast)
+        return app
+
+
+async def start_api(port, **options):
+    api = FakeLineApi(**options)
+    runner = web.AppRunner(api.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return api, runner
+
+
+def main(args):
+    async def serve():
+        await start_api(args.port, latency=args.latency / 1000, rate=args.rate, failures=args.failures)
+        print(f"Fake LINE Messaging API on http://127.0.0.1:{args.port}")
+        while True:
+            await asyncio.sleep(3600)
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=6800)
+    parser.add_argument("--latency", type=float, default=80, help="ms per request")
+    parser.add_argument("--rate", type=int, default=None, help="Requests per second before 429")
+    parser.add_argument("--failures", type=float, default=0., help="Share of requests answered with 500")
+    main(parser.parse_args())
@@ -0,0 +1,197 @@
+"""Local stand-in for the OctoPrint REST API and push socket with injected latency.
+
+    $ python tools/fake_octoprint.py --printers 200 --port 6000 --latency 50 --jitter 20
+
+serves 200 fake printers on ports 6000-6199. Only the endpoints `OctoClient` uses are
+implemented, each fake printer "prints" a job that advances with time and pushes a
+"current" message every `push_interval` seconds to the clients of `/sockjs/websocket`.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+
+class FakePrinter:
+    def __init__(self, name, latency=0., jitter=0., print_seconds=600, push_interval=0.5):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.print_seconds = print_seconds
+        self.push_interval = push_interval
+        self.started = time.time()
+        self.connected = True
+        self.push_enabled = True
+        # Requests without this key get 403 like OctoPrint with a wrong API key
+        self.api_key = None
+        self.sockets = set()
+        self.stored_files = [{"name": "cube.gcode", "origin": "local", "size": 123456}]
+
+        # Numbers for checking the clients
+        self.requests = 0
+        self.inflight = 0
+        self.max_inflight = 0
+
+    def completion(self):
+        return min(100., 100 * (time.time() - self.started) / self.print_seconds)
+
+    def temperature(self):
+        return {
+            "tool0": {"actual": 209.5 + random.random(), "target": 210., "offset": 0},
+            "bed": {"actual": 59.5 + random.random(), "target": 60., "offset": 0}
+        }
+
+    @web.middleware
+    async def inject_latency(self, request, handler):
+        self.requests += 1
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            await asyncio.sleep(max(0., self.latency + random.uniform(-self.jitter, self.jitter)))
+            if self.api_key is not None and request.query.get("apikey") != self.api_key:
+                return web.json_response({"error": "Invalid API key"}, status=403)
+            return await handler(request)
+        finally:
+            self.inflight -= 1
+
+    async def files(self, request):
+        return web.json_response({"files": self.stored_files, "free": 1 << 30})
+
+    async def upload(self, request):
+        form = await request.post()
+        upload = form["file"]
+        self.stored_files.append({"name": upload.filename, "origin": "local", "size": len(upload.file.read())})
+        return web.json_response({"done": True}, status=201)
+
+    async def select(self, request):
+        self.started = time.time()
+        return web.Response(status=204)
+
+    def job_state(self):
+        completion = self.completion()
+        return {
+            "state": "Printing" if completion < 100 else "Operational",
+            "job": {"file": {"name": self.stored_files[0]["name"]}},
+            "progress": {
+                "completion": completion,
+                "printTimeLeft": int(self.print_seconds * (1 - completion / 100))
+            }
+        }
+
+    def current_message(self):
+        """The "current" push message, the same shape as OctoPrint's"""
+        job = self.job_state()
+        state_text = job["state"] if self.connected else "Offline"
+        return {"current": {
+            "state": {"text": state_text, "flags": {"closedOrError": not self.connected}},
+            "job": job["job"],
+            "progress": job["progress"],
+            "temps": [{"time": int(time.time()), **self.temperature()}] if self.connected else []
+        }}
+
+    async def job(self, request):
+        return web.json_response(self.job_state())
+
+    async def printer(self, request):
+        if not self.connected:
+            return web.json_response({"error": "Printer is not operational"}, status=409)
+        return web.json_response({"temperature": self.temperature(), "state": {"text": "Printing"}})
+
+    async def printer_part(self, request):
+        temperature = self.temperature()
+        target = "tool0" if request.match_info["target"] == "tool" else "bed"
+        return web.json_response({target: temperature[target]})
+
+    async def connection(self, request):
+        return web.json_response({"current": {"state": "Operational" if self.connected else "Closed"}})
+
+    async def profile(self, request):
+        axes = {axis: {"speed": 6000, "inverted": False} for axis in ["x", "y", "z", "e"]}
+        return web.json_response({"id": request.match_info["name"], "axes": axes})
+
+    async def current_user(self, request):
+        return web.json_response({"name": self.name, "groups": ["admins", "users"]})
+
+    async def login(self, request):
+        return web.json_response({"name": self.name, "session": f"session-{self.name}"})
+
+    async def push_socket(self, request):
+        if not self.push_enabled:
+            return web.Response(status=404)
+
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        auth = await socket.receive_json()
+        if auth.get("auth") != f"{self.name}:session-{self.name}":
+            await socket.close()
+            return socket
+
+        self.sockets.add(socket)
+        try:
+            await socket.send_json({"connected": {"version": "fake", "apikey": None}})
+            while not socket.closed:
+                await socket.send_json(self.current_message())
+                await asyncio.sleep(self.push_interval)
+        except ConnectionResetError:
+            pass
+        finally:
+            self.sockets.discard(socket)
+        return socket
+
+    async def drop_sockets(self):
+        """Close every push socket like a restarting OctoPrint would"""
+        for socket in list(self.sockets):
+            await socket.close()
+
+    def app(self):
+        app = web.Application(middlewares=[self.inject_latency])
+        app.add_routes([
+            web.get("/api/files", self.files),
+            web.post("/api/files/local", self.upload),
+            web.post("/api/files/{origin}/{name}", self.select),
+            web.get("/api/job", self.job),
+            web.get("/api/printer", self.printer),
+            web.get("/api/printer/{target}", self.printer_part),
+            web.get("/api/connection", self.connection),
+            web.get("/api/printerprofiles/{name}", self.profile),
+            web.get("/api/currentuser", self.current_user),
+            web.post("/api/login", self.login),
+            web.get("/sockjs/websocket", self.push_socket)
+        ])
+        return app
+
+
+async def start_fleet(num_printers, port=6000, host="127.0.0.1", **kwargs):
+    """Start `num_printers` fake printers on consecutive ports, returns {url: FakePrinter} and the runners"""
+    printers, runners = dict(), []
+    for idx in range(num_printers):
+        printer = FakePrinter(f"printer-{idx}", **kwargs)
+        runner = web.AppRunner(printer.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port + idx).start()
+        printers[f"http://{host}:{port + idx}"] = printer
+        runners.append(runner)
+    return printers, runners
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--printers", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6000)
+    parser.add_argument("--latency", type=float, default=50, help="ms added to every response")
+    parser.add_argument("--jitter", type=float, default=0, help="+- ms of random latency")
+    args = parser.parse_args()
+
+    async def main():
+        await start_fleet(args.printers, args.port, args.host,
+                          latency=args.latency / 1000, jitter=args.jitter / 1000)
+        print(f"{args.printers} fake printers on {args.host}:{args.port}-{args.port + args.printers - 1}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
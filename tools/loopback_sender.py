@@ -0,0 +1,98 @@
+"""Run `send_image.FrameSender` against `frame_transport.FrameReceiver` on loopback with a
+synthetic camera, for every protocol / encoding combination.
+
+    $ PYTHONPATH=. python tools/loopback_sender.py
+
+Checks that frames arrive with the model geometry and flagged as cropped (full frames
+with `--full-frame`, without the flag), that raw frames are bit exact, that
+the fps limit holds and that a slow receiver always gets a fresh frame instead of a
+backlog of old ones.
+"""
+import socket
+import threading
+import time
+
+import numpy as np
+
+from frame_transport import FrameReceiver, FRAME_RAW, decode_frame
+from send_image import FrameSender
+
+
+class SyntheticCamera:
+    """Stand-in for `OctoClient` with a camera, the frame index is written into the pixels"""
+    def __init__(self, height=480, width=640, fps=30):
+        self.height = height
+        self.width = width
+        self.interval = 1 / fps
+        self.index = 0
+
+    def render(self, index):
+        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        frame[..., 0] = index % 256
+        frame[..., 1] = np.linspace(0, 255, self.width, dtype=np.uint8)
+        return frame
+
+    @property
+    def frame(self):
+        time.sleep(self.interval)
+        self.index += 1
+        return self.render(self.index)
+
+
+def run(streaming, raw, fps=20, num_frames=20, receiver_delay=0., credits=4, model_geometry=True):
+    camera = SyntheticCamera()
+    sender = FrameSender(camera, host="127.0.0.1", port=0, fps=fps, raw=raw, model_geometry=model_geometry).start()
+    threading.Thread(target=sender.serve_forever, daemon=True).start()
+
+    connect = socket.create_connection(sender.listener.getsockname())
+    connect.settimeout(5)
+    receiver = FrameReceiver(connect, streaming=streaming, credits=credits)
+
+    ages, frames = [], []
+    start = None
+    for _ in range(num_frames):
+        frame = receiver.recv_frame()
+        image = decode_frame(frame)
+        if start is None:
+            start = time.time()
+        if streaming:
+            ages.append(time.time() - frame.timestamp)
+        frames.append((frame.encoding, frame.cropped, image.copy()))
+        time.sleep(receiver_delay)
+    received_fps = (num_frames - 1) / (time.time() - start)
+
+    connect.close()
+    sender.stop()
+    return frames, received_fps, ages, sender, camera
+
+
+if __name__ == "__main__":
+    for streaming in [False, True]:
+        for raw in [False, True]:
+            name = f"{'stream' if streaming else 'legacy'} {'raw' if raw else 'jpeg'}"
+            frames, received_fps, ages, sender, camera = run(streaming, raw)
+
+            for encoding, cropped, image in frames:
+                assert image.shape == (352, 352, 3), image.shape
+                # Legacy framing has no header to carry the flag
+                assert cropped == streaming, f"{name}: the cropped flag is {cropped}"
+                assert (encoding == FRAME_RAW) == (raw and streaming)
+                if encoding == FRAME_RAW:
+                    expected = sender.crop(camera.render(int(image[0, 0, 0])))
+                    assert np.array_equal(image, expected), f"{name}: raw frame is changed on the way"
+            assert received_fps <= 20 * 1.1, f"{name}: {received_fps:.1f} fps is over the limit"
+            print(f"{name}: {len(frames)} frames at {received_fps:.1f} fps")
+
+    frames, _, _, _, camera = run(True, True, model_geometry=False)
+    assert all(not cropped and image.shape == (camera.height, camera.width, 3) for _, cropped, image in frames)
+    print(f"stream raw full frame: {len(frames)} frames of {camera.height}x{camera.width}, not flagged")
+
+    # A receiver that takes 0.2 s per frame only ever has `credits` frames in flight,
+    #  so frames are never older than that no matter how long it runs
+    for credits in [1, 4]:
+        frames, received_fps, ages, _, _ = run(
+            True, False, fps=30, num_frames=15, receiver_delay=0.2, credits=credits)
+        print(f"slow receiver with {credits} credits: {received_fps:.1f} fps, "
+              f"frame age max {1000 * max(ages):.0f} ms")
+        assert max(ages) < credits * 0.2 + 0.1, "Stale frames are queued for a slow receiver"
+    print("Loopback OK")
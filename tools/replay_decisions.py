@@ -0,0 +1,106 @@
+"""Replay prediction sequences through `DecisionEngine` and count the alert writes it saves.
+
+    $ PYTHONPATH=. python tools/replay_decisions.py --printers 20 --frames 3600
+    $ PYTHONPATH=. python tools/replay_decisions.py --logits printer0.npy printer1.npy
+
+Recorded sequences are `(frames, 2)` arrays of logits saved with `np.save`, one frame per
+second. Without `--logits` synthetic sequences are generated: normal printing with blurry
+single-frame false positives and a few real defects that stay visible for minutes.
+Reports Firestore writes (one per anomalous frame like the old app, one per raw
+transition, and one per debounced transition) plus false alerts, missed defects and the
+detection delay for every engine configuration.
+"""
+import argparse
+import json
+import random
+
+import numpy as np
+
+from backend.inference import DecisionEngine
+
+configs = {
+    "raw": dict(window=1, votes=1, ema_alpha=1., raise_threshold=0.5, clear_threshold=0.5, cooldown=0),
+    "ema": dict(window=1, votes=1, ema_alpha=0.3, raise_threshold=0.6, clear_threshold=0.3, cooldown=0),
+    "vote": dict(window=8, votes=5, ema_alpha=1., raise_threshold=0.5, clear_threshold=0.5, cooldown=0),
+    "default": dict()
+}
+
+
+def synthetic_sequence(frames, rng, defects=2, false_positive_rate=0.03):
+    """Logits and the ground truth defect mask of one printer"""
+    truth = np.zeros(frames, dtype=bool)
+    for _ in range(defects):
+        start = rng.randrange(frames)
+        truth[start:start + rng.randrange(60, 600)] = True
+
+    defect_logit = np.where(truth, 2.0, -2.0) + np.array([rng.gauss(0, 1) for _ in range(frames)])
+    # Blurry frames look like defects, real defects are sometimes missed
+    flips = np.array([rng.random() < false_positive_rate for _ in range(frames)])
+    defect_logit[flips] = -defect_logit[flips]
+    return np.stack([np.zeros(frames), defect_logit], axis=1), truth
+
+
+def episodes(mask):
+    edges = np.diff(mask.astype(int), prepend=0, append=0)
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def replay(sequences, config):
+    engine = DecisionEngine(**config)
+    writes, false_alerts, missed, delays = 0, 0, 0, []
+    for printer_id, (logits, truth) in enumerate(sequences):
+        raised = []
+        for frame, frame_logits in enumerate(logits):
+            change = engine.update(printer_id, frame_logits, timestamp=float(frame))
+            if change is not None:
+                writes += 1
+                if change:
+                    raised.append(frame)
+
+        if truth is None:
+            continue
+        defects = episodes(truth)
+        for start, end in defects:
+            # An alert counts for the defect until a minute after it stops being visible
+            hits = [frame for frame in raised if start <= frame < end + 60]
+            if hits:
+                delays.append(hits[0] - start)
+            else:
+                missed += 1
+        false_alerts += sum(not any(start <= frame < end + 60 for start, end in defects) for frame in raised)
+
+    return {
+        "writes": writes,
+        "false_alerts": false_alerts if delays or missed else None,
+        "missed_defects": missed if delays or missed else None,
+        "mean_delay_frames": round(float(np.mean(delays)), 1) if delays else None
+    }
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    if args.logits:
+        sequences = [(np.load(path), None) for path in args.logits]
+    else:
+        sequences = [synthetic_sequence(args.frames, rng) for _ in range(args.printers)]
+
+    anomalous_frames = sum(int(np.sum(logits[:, 1] > logits[:, 0])) for logits, _ in sequences)
+    results = {"anomalous_frames": anomalous_frames}
+    print(f"{len(sequences)} printers, {anomalous_frames} writes with one write per anomalous frame")
+    for name, config in configs.items():
+        results[name] = replay(sequences, config)
+        print(f"{name:>8}: {json.dumps(results[name])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logits", nargs="*", help="Recorded (frames, 2) logits saved with np.save")
+    parser.add_argument("--printers", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=3600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Save the results as JSON")
+    main(parser.parse_args())
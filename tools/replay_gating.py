@@ -0,0 +1,113 @@
+"""Replay camera sequences with and without `FrameGate` and compare CPU time and alerts.
+
+    $ PYTHONPATH=. python tools/replay_gating.py --printers 4
+    $ PYTHONPATH=. python tools/replay_gating.py --frames-dir recordings/printer0 --backend onnx
+
+A recorded sequence is a directory of JPEGs, one frame per second in file name order.
+Without `--frames-dir` synthetic sequences are rendered: heating (static), printing with a
+new layer every `--layer-seconds`, a pause (static) and a defect that grows over a few
+minutes. `--backend` runs a real engine, otherwise a stand-in model scores the amount of
+defect-colored pixels so the alerts mean something on synthetic frames. Both runs feed
+the same `DecisionEngine`, the gated run has to raise and clear the same alerts.
+"""
+import argparse
+import glob
+import time
+
+import cv2
+import numpy as np
+
+from backend.inference import AnomalyModel, DecisionEngine, FrameGate
+from benchmark import printer_scene
+
+defect_color = np.array([30, 30, 200], dtype=np.int16)
+
+
+def synthetic_sequence(rng, heating=300, printing=1200, pause=120, layer_seconds=20, defect_start=900,
+                       height=480, width=640):
+    frames = []
+    for second in range(heating + printing + pause):
+        layer = 0 if second < heating else min(printing, second - heating) // layer_seconds
+        frame = printer_scene(rng, height, width, index=layer)
+        printed = second - heating
+        if printed >= defect_start:
+            # Spaghetti: a tangle that grows every second until the print is stopped
+            growth = min(printed - defect_start, 180)
+            center = (width // 2 + 40, height // 2)
+            for idx in range(growth // 2):
+                angle = idx * 0.7
+                end = (int(center[0] + (10 + idx) * np.cos(angle)), int(center[1] + (5 + idx / 2) * np.sin(angle)))
+                cv2.line(frame, center, end, tuple(int(value) for value in defect_color), 3)
+        frames.append(frame)
+    return frames
+
+
+def recorded_sequence(frames_dir):
+    return [cv2.imread(path, cv2.IMREAD_COLOR) for path in sorted(glob.glob(f"{frames_dir}/*.jpg"))]
+
+
+class DefectColorModel:
+    """Stand-in for the classifier: the more defect-colored pixels, the higher the defect logit"""
+    def predict(self, frame):
+        close = np.abs(frame.astype(np.int16) - defect_color).sum(axis=2) < 60
+        return np.array([0., 1000 * (close.mean() - 0.005)], dtype=np.float32)
+
+
+def replay(sequences, model, gate):
+    engine = DecisionEngine()
+    transitions = []
+    inferences = [0]
+
+    def predict(frame):
+        inferences[0] += 1
+        return model.predict(frame)
+
+    start = time.process_time()
+    for printer_id, frames in enumerate(sequences):
+        for second, frame in enumerate(frames):
+            if gate is None:
+                logits = predict(frame)
+            else:
+                logits = gate.predict(printer_id, frame, predict, timestamp=float(second))
+            change = engine.update(printer_id, logits, timestamp=float(second))
+            if change is not None:
+                transitions.append((printer_id, second, change))
+    return transitions, inferences[0], time.process_time() - start
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    if args.frames_dir:
+        sequences = [recorded_sequence(frames_dir) for frames_dir in args.frames_dir]
+    else:
+        sequences = [synthetic_sequence(rng, layer_seconds=args.layer_seconds) for _ in range(args.printers)]
+    model = AnomalyModel(args.backend, bgr=True) if args.backend else DefectColorModel()
+    num_frames = sum(len(frames) for frames in sequences)
+
+    baseline, baseline_inferences, baseline_cpu = replay(sequences, model, None)
+    gate = FrameGate(threshold=args.threshold, max_age=args.max_age)
+    gated, gated_inferences, gated_cpu = replay(sequences, model, gate)
+
+    print(f"{len(sequences)} printers, {num_frames} frames")
+    print(f"  no gate: {baseline_inferences} inferences, {baseline_cpu:.1f} s CPU, alerts {baseline}")
+    print(f"     gate: {gated_inferences} inferences, {gated_cpu:.1f} s CPU, alerts {gated}")
+    print(f"     gate: {gate.report()}, CPU saved {1 - gated_cpu / baseline_cpu:.0%}")
+
+    # The gated run may see a defect a moment later, never miss it or raise extra alerts
+    assert [(printer, change) for printer, _, change in baseline] == \
+        [(printer, change) for printer, _, change in gated], "The gate changed the alerts"
+    delays = [gated_second - second for (_, second, _), (_, gated_second, _) in zip(baseline, gated)]
+    print(f"alert delay from gating: {delays} s")
+    print("Gating OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames-dir", nargs="*", help="Directories of recorded JPEGs, one per printer")
+    parser.add_argument("--backend", default=None, help="Engine to run, defaults to the stand-in model")
+    parser.add_argument("--printers", type=int, default=2)
+    parser.add_argument("--layer-seconds", type=int, default=20)
+    parser.add_argument("--threshold", type=float, default=2.5)
+    parser.add_argument("--max-age", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
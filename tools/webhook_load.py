@@ -0,0 +1,169 @@
+"""Post bursts of signed LINE webhook payloads and measure the webhook latency.
+
+    $ PYTHONPATH=linebot python tools/webhook_load.py --requests 300 --concurrency 16
+    $ PYTHONPATH=linebot python tools/webhook_load.py --url http://127.0.0.1:5000 --secret <channel secret>
+
+Without `--url` two local bots run on one single-threaded server, like one gunicorn sync
+worker, with a handler that takes `--db-latency` + `--reply-latency` ms per event (the old
+token scan plus the reply). "inline" handles the events before answering like the old
+`callback()`, "queued" is `webhook.add_callback` with an `EventProcessor`. Reports the
+webhook latency, the processing latency and the queue depth from `/metrics`, and checks
+that a bad signature gets 400 and that the events of every user are handled in the order
+their bodies arrived.
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Flask, abort, request
+from werkzeug.serving import make_server
+
+from webhook import EventProcessor, add_callback, verify_signature
+
+
+def payload(index):
+    user_id = f"U{index % 97:032x}"
+    return json.dumps({"destination": "Ubot", "events": [{
+        "type": "message", "mode": "active", "timestamp": int(time.time() * 1000),
+        "webhookEventId": uuid.uuid4().hex, "replyToken": uuid.uuid4().hex,
+        "source": {"type": "user", "userId": user_id},
+        "message": {"type": "text", "id": str(index), "text": f"machine-{index % 13}"},
+        "deliveryContext": {"isRedelivery": False}}]})
+
+
+def sign(secret, body):
+    return base64.b64encode(hmac.new(secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()).decode()
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return 1000 * ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def fire(url, secret, count, concurrency):
+    bodies = [payload(idx) for idx in range(count)]
+    local = threading.local()
+
+    def post(body):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        response = local.session.post(f"{url}/callback", data=body.encode("utf-8"), timeout=120, headers={
+            "Content-Type": "application/json", "X-Line-Signature": sign(secret, body)})
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(post, bodies))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for latency, _ in results]
+    statuses = [status for _, status in results]
+    print(f"  webhook: p50 {percentile(latencies, 0.5):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms, "
+          f"{count / elapsed:.0f} requests/s, {statuses.count(200)} OK, {len(statuses) - statuses.count(200)} refused")
+
+    bad = requests.post(f"{url}/callback", data=bodies[0].encode("utf-8"),
+                        headers={"X-Line-Signature": sign(secret + "x", bodies[0])}, timeout=10)
+    assert bad.status_code == 400, f"A bad signature got {bad.status_code}"
+    return latencies
+
+
+def wait_for_metrics(url, timeout=120):
+    end = time.monotonic() + timeout
+    while True:
+        metrics = requests.get(f"{url}/metrics", timeout=10).json()
+        if metrics["handled"] >= metrics["submitted"] or time.monotonic() > end:
+            return metrics
+        time.sleep(0.05)
+
+
+def serve(app):
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main(args):
+    if args.url:
+        fire(args.url, args.secret, args.requests, args.concurrency)
+        print(f"  processing: {wait_for_metrics(args.url)}")
+        return
+
+    secret = "local-secret"
+    # Message ids of every user in the order they were queued and handled
+    arrived, handled = defaultdict(list), defaultdict(list)
+
+    def handle(body, signature):
+        # `WebhookHandler.handle` checks the signature again and calls one handler per event
+        if not verify_signature(secret, body, signature):
+            raise ValueError("Invalid signature")
+        for event in json.loads(body)["events"]:
+            time.sleep((args.db_latency + args.reply_latency) / 1000)
+            handled[event["source"]["userId"]].append(event["message"]["id"])
+
+    inline = Flask("inline")
+
+    @inline.route("/callback", methods=["POST"])
+    def callback():
+        body = request.get_data(as_text=True)
+        try:
+            handle(body, request.headers["X-Line-Signature"])
+        except ValueError:
+            abort(400)
+        return "OK"
+
+    print(f"Inline handling, {args.db_latency + args.reply_latency:.0f} ms per event")
+    server, url = serve(inline)
+    inline_latencies = fire(url, secret, args.requests, args.concurrency)
+    server.shutdown()
+
+    handled.clear()
+    processor = EventProcessor(handle, workers=args.workers, queue_size=args.queue_size).start()
+    submit = processor.submit
+
+    def recorded_submit(body, signature):
+        # The server has one thread, bodies are submitted in the order they arrived
+        if not submit(body, signature):
+            return False
+        for event in json.loads(body)["events"]:
+            arrived[event["source"]["userId"]].append(event["message"]["id"])
+        return True
+    processor.submit = recorded_submit
+    print(f"Queued handling, {args.workers} processor threads")
+    server, url = serve(add_callback(Flask("queued"), secret, processor))
+    queued_latencies = fire(url, secret, args.requests, args.concurrency)
+    metrics = wait_for_metrics(url)
+    server.shutdown()
+    print(f"  processing: wait p50 {metrics['wait']['p50_ms']} ms, p99 {metrics['wait']['p99_ms']} ms, "
+          f"done p50 {metrics['latency']['p50_ms']} ms, p99 {metrics['latency']['p99_ms']} ms, "
+          f"max queue depth {metrics['max_depth']}, {metrics['handled']} handled, {metrics['failed']} failed, "
+          f"{metrics['rejected']} rejected")
+
+    assert metrics["handled"] + metrics["rejected"] == args.requests and metrics["failed"] == 0
+    assert handled == arrived, "Events of a user were handled out of order"
+    print(f"  the events of each of the {len(arrived)} users were handled in the order they arrived")
+    assert percentile(queued_latencies, 0.99) < percentile(inline_latencies, 0.5), \
+        "The queued webhook is not faster than handling inline"
+    print("Webhook OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="A running bot, a local one is started without it")
+    parser.add_argument("--secret", default=None, help="The channel secret of the bot at --url")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--db-latency", type=float, default=50, help="ms of the token check per event")
+    parser.add_argument("--reply-latency", type=float, default=80, help="ms of the reply per event")
+    parser.add_argument("--workers", type=int, default=8, help="Processor threads")
+    parser.add_argument("--queue-size", type=int, default=1000)
+    main(parser.parse_args())